@@ -0,0 +1,131 @@
+"""
+Pre-built, precompressed OpenAPI documents.
+
+FastAPI generates the OpenAPI schema from every route and model and
+serializes it on each request. Agent platforms fetch it often to refresh
+their tools, so the documents are built and serialized once (at startup, or
+on first use), compressed with gzip (and brotli, if installed), and served
+with a strong ETag so unchanged documents cost a 304.
+
+Two profiles are built: "full" (everything in the app) and "agent", which
+leaves out the admin and UI routes and the schemas only they use.
+"""
+import copy
+import gzip
+import hashlib
+import json
+import threading
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+FULL = "full"
+AGENT = "agent"
+
+# Operations tagged only with these are left out of the agent profile
+AGENT_EXCLUDED_TAGS = {"Admin", "UI"}
+
+
+class Document:
+    """
+    One serialized OpenAPI document in every supported encoding.
+    """
+
+    def __init__(self, schema: dict):
+        self.body = json.dumps(schema, separators=(",", ":"), sort_keys=True).encode()
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        # encoding -> (bytes, ETag); each representation gets its own strong ETag
+        self.encodings = {"identity": (self.body, f'"{self.etag}"')}
+        self.encodings["gzip"] = (gzip.compress(self.body, compresslevel=9, mtime=0), f'"{self.etag}-gz"')
+        if brotli is not None:
+            self.encodings["br"] = (brotli.compress(self.body, quality=11), f'"{self.etag}-br"')
+
+    def negotiate(self, accept_encoding: str):
+        """
+        Returns (encoding, bytes, etag) for an Accept-Encoding header value.
+        """
+        accepted = set()
+        for part in (accept_encoding or "").split(","):
+            name, _, params = part.partition(";")
+            weight = params.strip()
+            try:
+                if weight.startswith("q=") and float(weight[2:]) == 0:
+                    continue
+            except ValueError:
+                pass
+            accepted.add(name.strip().lower())
+        for encoding in ("br", "gzip"):
+            if encoding in self.encodings and (encoding in accepted or "*" in accepted):
+                return (encoding, *self.encodings[encoding])
+        return ("identity", *self.encodings["identity"])
+
+
+def agent_profile(schema: dict):
+    """
+    Returns a copy of the schema without admin/UI operations and unused components.
+    """
+    trimmed = copy.deepcopy(schema)
+    paths = {}
+    for path, operations in trimmed.get("paths", {}).items():
+        kept = {
+            method: op for method, op in operations.items()
+            if not (isinstance(op, dict) and op.get("tags") and set(op["tags"]) <= AGENT_EXCLUDED_TAGS)
+        }
+        if any(isinstance(op, dict) for op in kept.values()):
+            paths[path] = kept
+    trimmed["paths"] = paths
+    trimmed["tags"] = [t for t in trimmed.get("tags", []) if t.get("name") not in AGENT_EXCLUDED_TAGS]
+    if not trimmed["tags"]:
+        del trimmed["tags"]
+
+    schemas = trimmed.get("components", {}).get("schemas")
+    if schemas is not None:
+        used = _referenced_schemas(paths, schemas)
+        trimmed["components"]["schemas"] = {name: s for name, s in schemas.items() if name in used}
+    return trimmed
+
+
+def _referenced_schemas(node, schemas):
+    prefix = "#/components/schemas/"
+    used = set()
+    pending = [node]
+    while pending:
+        current = pending.pop()
+        if isinstance(current, dict):
+            ref = current.get("$ref")
+            if isinstance(ref, str) and ref.startswith(prefix):
+                name = ref[len(prefix):]
+                if name not in used and name in schemas:
+                    used.add(name)
+                    pending.append(schemas[name])
+            pending.extend(current.values())
+        elif isinstance(current, list):
+            pending.extend(current)
+    return used
+
+
+_documents = {}
+_lock = threading.Lock()
+
+
+def build(app):
+    """
+    Builds and caches every profile from the app's routes.
+    """
+    schema = app.openapi()
+    documents = {FULL: Document(schema), AGENT: Document(agent_profile(schema))}
+    with _lock:
+        _documents.clear()
+        _documents.update(documents)
+    return documents
+
+
+def get_document(app, profile: str = FULL):
+    if profile not in (FULL, AGENT):
+        raise KeyError(profile)
+    document = _documents.get(profile)
+    if document is None:
+        document = build(app)[profile]
+    return document
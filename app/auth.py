@@ -0,0 +1,154 @@
+"""
+Password hashing and session tokens.
+
+Passwords are hashed with scrypt, which is deliberately slow and CPU-bound,
+so hashing runs in a small dedicated thread pool (hashlib releases the GIL
+while it works) and never on the event loop. The pool size bounds how many
+hashes run at once; further logins queue for a worker.
+
+Session tokens are stateless and signed with HMAC-SHA256:
+base64url(payload) + "." + base64url(signature), where the payload holds the
+username, tenant and expiry. Verified tokens are cached in memory, so an
+authenticated cart call costs one dict lookup and no Firestore read.
+"""
+import asyncio
+import base64
+import contextvars
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import config
+from app.cache import LRUCache
+
+log = logging.getLogger(__name__)
+
+_SCHEME = "scrypt"
+
+if config.AUTH_SECRET:
+    _secret = config.AUTH_SECRET.encode()
+else:
+    _secret = secrets.token_bytes(32)
+    log.warning("AUTH_SECRET is not set; session tokens won't survive a restart or work across instances.")
+
+_executor = ThreadPoolExecutor(max_workers=config.AUTH_HASH_WORKERS, thread_name_prefix="auth-hash")
+
+# token -> (username, tenant, expires_at) for tokens already verified
+_token_cache = LRUCache(maxsize=config.AUTH_TOKEN_CACHE_SIZE, ttl=config.AUTH_TOKEN_TTL_SECONDS)
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64encode(data: bytes):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text: str):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def hash_password(password: str, salt: bytes = None):
+    """
+    Returns "scrypt$n$r$p$salt$hash" for storage.
+    """
+    n, r, p = config.AUTH_SCRYPT_N, config.AUTH_SCRYPT_R, config.AUTH_SCRYPT_P
+    salt = salt or os.urandom(16)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=32, maxmem=256 * n * r)
+    return f"{_SCHEME}${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def verify_password(password: str, stored: str):
+    """
+    Checks a password against a hash_password() value, in constant time.
+    """
+    try:
+        scheme, n, r, p, salt, expected = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        if scheme != _SCHEME:
+            return False
+        digest = hashlib.scrypt(
+            password.encode(), salt=_b64decode(salt), n=n, r=r, p=p, dklen=32, maxmem=256 * n * r
+        )
+    except (ValueError, AttributeError):
+        return False
+    return hmac.compare_digest(digest, _b64decode(expected))
+
+
+@functools.lru_cache(maxsize=4)
+def _dummy_hash(n: int, r: int, p: int):
+    # Keyed by the scrypt parameters so it's redone if they change
+    return hash_password(secrets.token_urlsafe(16))
+
+
+def check_password(password: str, stored: str = None):
+    """
+    Like verify_password(), but with no stored hash (no such user) it checks
+    against a dummy hash and returns False, so unknown usernames take as long
+    as wrong passwords.
+    """
+    if stored is None:
+        verify_password(password, _dummy_hash(config.AUTH_SCRYPT_N, config.AUTH_SCRYPT_R, config.AUTH_SCRYPT_P))
+        return False
+    return verify_password(password, stored)
+
+
+async def run_hashing(fn, *args):
+    """
+    Runs hash_password() or check_password() on the hashing pool, in a copy
+    of the caller's context. Keep datastore calls out of it: a worker waiting
+    on I/O holds a slot other logins need for hashing.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_executor, context.run, fn, *args)
+
+
+def issue_token(username: str, ttl: float = None, tenant: str = None):
+    """
+    Returns a signed session token for the user (of `tenant`, if given).
+    """
+    expires_at = int(time.time() + (ttl or config.AUTH_TOKEN_TTL_SECONDS))
+    claims = {"sub": username, "exp": expires_at}
+    if tenant:
+        claims["tid"] = tenant
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    signature = _b64encode(hmac.new(_secret, payload.encode(), hashlib.sha256).digest())
+    token = f"{payload}.{signature}"
+    _token_cache.set(token, (username, tenant, expires_at))
+    return token
+
+
+def verify_token(token: str, tenant: str = None):
+    """
+    Returns the username for a valid token issued for `tenant`. Raises InvalidToken otherwise.
+    """
+    cached = _token_cache.get(token)
+    if cached is None:
+        try:
+            payload, signature = token.split(".")
+            expected = _b64encode(hmac.new(_secret, payload.encode(), hashlib.sha256).digest())
+            if not hmac.compare_digest(signature, expected):
+                raise InvalidToken("Bad signature")
+            claims = json.loads(_b64decode(payload))
+            cached = (claims["sub"], claims.get("tid"), int(claims["exp"]))
+        except InvalidToken:
+            raise
+        except (ValueError, KeyError, TypeError) as e:
+            raise InvalidToken("Malformed token") from e
+        _token_cache.set(token, cached)
+
+    username, token_tenant, expires_at = cached
+    if expires_at < time.time():
+        _token_cache.pop(token)
+        raise InvalidToken("Token expired")
+    if token_tenant != tenant:
+        raise InvalidToken("Token belongs to another tenant")
+    return username
+
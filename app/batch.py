@@ -0,0 +1,143 @@
+"""
+In-process execution of batched API sub-requests.
+
+Each sub-request is sent straight into the ASGI app (so it goes through the
+same middleware, routing and validation as a real request) without an HTTP
+round trip. Consecutive GET requests run concurrently; any other method runs
+on its own, in order, after everything before it has finished, so a write
+is never reordered with the reads around it.
+
+Sub-requests run with the batch's remaining time as their deadline (see
+app/deadline.py), so their datastore calls give up when the batch does.
+Reads still running at the time limit are abandoned and reported as 504. A
+write is always awaited, so the status reported for it is what happened,
+never a 504 for a write that went on to commit.
+"""
+import asyncio
+import json
+import time
+
+from app import config
+from app import deadline
+
+# Parent request headers not passed on to sub-requests
+_DROPPED_HEADERS = {b"content-length", b"content-type", b"accept-encoding", b"transfer-encoding"}
+
+
+async def dispatch(app, parent_scope, method: str, path: str, body=None):
+    """
+    Runs one request against the ASGI app. Returns (status, parsed body).
+    """
+    path, _, query = path.partition("?")
+    payload = json.dumps(body).encode() if body is not None else b""
+    headers = [(k, v) for k, v in parent_scope.get("headers", []) if k not in _DROPPED_HEADERS]
+    headers += [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+    scope = {
+        "type": "http",
+        "asgi": parent_scope.get("asgi", {"version": "3.0"}),
+        "http_version": parent_scope.get("http_version", "1.1"),
+        "method": method.upper(),
+        "scheme": parent_scope.get("scheme", "http"),
+        "server": parent_scope.get("server"),
+        "client": parent_scope.get("client"),
+        "root_path": parent_scope.get("root_path", ""),
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": headers,
+    }
+
+    sent = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        # Nothing more to read; the "client" disconnects once the response is done
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    status = 500
+    response_headers = {}
+    chunks = []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            response_headers.update((k.lower(), v) for k, v in message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        finished.set()
+
+    raw = b"".join(chunks)
+    if not raw:
+        return status, None
+    if response_headers.get(b"content-type", b"").startswith(b"application/json"):
+        return status, json.loads(raw)
+    return status, raw.decode(errors="replace")
+
+
+def _groups(requests):
+    """
+    Splits request indices into runs of consecutive GETs and single other requests.
+    """
+    groups = []
+    for index, request in enumerate(requests):
+        if request.method.upper() == "GET" and groups and groups[-1][1]:
+            groups[-1][0].append(index)
+        else:
+            groups.append(([index], request.method.upper() == "GET"))
+    return [indices for indices, _ in groups]
+
+
+async def run_batch(app, parent_scope, requests, timeout: float = None):
+    """
+    Runs the sub-requests and returns one {"status", "body"} per request, in order.
+    Requests that haven't finished within `timeout` seconds get a 504.
+    """
+    timeout = config.BATCH_TIMEOUT_SECONDS if timeout is None else timeout
+    ends_at = time.monotonic() + timeout
+    results = [None] * len(requests)
+
+    for indices in _groups(requests):
+        remaining = ends_at - time.monotonic()
+        if remaining <= 0:
+            break
+        tasks = {}
+        # Each task copies the context, and with it this deadline
+        with deadline.within(remaining):
+            for i in indices:
+                request = requests[i]
+                if not request.path.startswith("/api/") or request.path.split("?")[0].rstrip("/") == "/api/batch":
+                    results[i] = {"status": 400, "body": {"detail": "path must be an /api/ route other than /api/batch"}}
+                    continue
+                tasks[i] = asyncio.ensure_future(dispatch(app, parent_scope, request.method, request.path, request.body))
+        if not tasks:
+            continue
+
+        # Reads can be abandoned; a write runs on (bounded by its deadline) until we know its outcome
+        is_write = any(requests[i].method.upper() != "GET" for i in tasks)
+        done, pending = await asyncio.wait(tasks.values(), timeout=None if is_write else remaining)
+        for task in pending:
+            task.cancel()
+        for i, task in tasks.items():
+            if task in done:
+                try:
+                    status, body = task.result()
+                    results[i] = {"status": status, "body": body}
+                except Exception as e:
+                    results[i] = {"status": 500, "body": {"detail": str(e)}}
+        if pending:
+            break
+
+    return [
+        result if result is not None else {"status": 504, "body": {"detail": "Batch time limit exceeded"}}
+        for result in results
+    ]
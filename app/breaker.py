@@ -0,0 +1,223 @@
+"""
+Circuit breaker around datastore calls.
+
+The breaker watches the outcome of the last `window` calls. Once at least
+`min_calls` have completed, it opens if too many of them failed or took
+longer than `slow_call_seconds`. While open, calls are rejected at once with
+CircuitOpenError instead of queueing behind a datastore that is down or
+overloaded. After `open_seconds` it lets a single probe call through
+(half-open): if the probe succeeds quickly the breaker closes, otherwise it
+opens again for another `open_seconds`.
+
+Callers decide what a rejection means. Catalog reads in app/database.py
+answer from the last-known-good products and flag the response as stale
+(see mark_stale and StaleHeaderMiddleware); writes surface it as a 503.
+"""
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class DatastoreUnavailable(Exception):
+    """
+    The datastore can't be used right now; `retry_after` is a hint in seconds.
+    """
+
+    def __init__(self, message: str = "Datastore unavailable", retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(DatastoreUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window: int = 20, min_calls: int = 10,
+                 failure_rate: float = 0.5, slow_call_seconds: float = 1.0,
+                 slow_call_rate: float = 0.5, open_seconds: float = 10.0, excluded=()):
+        """
+        `excluded` exception types are the caller's business (e.g. out of
+        stock) and count as successful calls.
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.excluded = tuple(excluded)
+        self._outcomes = deque(maxlen=window)  # (failed, slow) per completed call
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        # Calls made from inside a protected call (e.g. stock levels read
+        # while fetching a product) are part of the outer call
+        self._active = contextvars.ContextVar(f"breaker_{name}_active", default=False)
+        self.stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def retry_after(self):
+        """
+        Seconds until the breaker will next let a probe through.
+        """
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def _acquire(self):
+        """
+        Returns True if this call is the half-open probe. Raises CircuitOpenError if rejected.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return False
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.stats["rejected"] += 1
+            remaining = self.open_seconds - (time.monotonic() - self._opened_at)
+        raise CircuitOpenError(f"Circuit '{self.name}' is open", retry_after=max(1.0, remaining))
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.stats["opened"] += 1
+
+    def _record(self, probe: bool, failed: bool, slow: bool):
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["failures"] += failed
+            self.stats["slow_calls"] += slow
+            if probe:
+                self._probing = False
+                if failed or slow:
+                    self._open()
+                    log.warning("Circuit %s: probe failed, open again for %.0fs.", self.name, self.open_seconds)
+                else:
+                    self._state = CLOSED
+                    log.warning("Circuit %s closed.", self.name)
+                return
+            if self._state != CLOSED:
+                return
+            self._outcomes.append((failed, slow))
+            count = len(self._outcomes)
+            if count < self.min_calls:
+                return
+            failures = sum(f for f, _ in self._outcomes)
+            slow_calls = sum(s for _, s in self._outcomes)
+            if failures >= self.failure_rate * count or slow_calls >= self.slow_call_rate * count:
+                self._open()
+                log.error(
+                    "Circuit %s opened: %d failed and %d slow of the last %d calls.",
+                    self.name, failures, slow_calls, count,
+                )
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) through the breaker. Raises CircuitOpenError while open.
+        """
+        if self._active.get():
+            return fn(*args, **kwargs)
+        probe = self._acquire()
+        token = self._active.set(True)
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except self.excluded:
+            self._record(probe, False, time.monotonic() - start > self.slow_call_seconds)
+            raise
+        except BaseException:
+            self._record(probe, True, False)
+            raise
+        finally:
+            self._active.reset(token)
+        self._record(probe, False, time.monotonic() - start > self.slow_call_seconds)
+        return result
+
+    def snapshot(self):
+        state = self.state
+        return dict(self.stats, state=state, retry_after=round(self.retry_after(), 1))
+
+
+# Per-request record of stale data served: {"source": ..., "age": ...}. The
+# middleware installs a dict that endpoints running in worker threads fill in
+# (the threads get a copy of the context, but the same dict).
+_stale = contextvars.ContextVar("stale_response", default=None)
+
+
+def mark_stale(source: str, age: float = None):
+    """
+    Notes that the current response includes data from `source` ("snapshot"
+    or "csv") rather than the datastore, `age` seconds old if known.
+    """
+    holder = _stale.get()
+    if holder is not None:
+        holder["source"] = source
+        holder["age"] = age
+
+
+@contextlib.contextmanager
+def track_stale():
+    """
+    Collects mark_stale() calls made inside the block into the yielded dict.
+    """
+    holder = {}
+    token = _stale.set(holder)
+    try:
+        yield holder
+    finally:
+        _stale.reset(token)
+
+
+class StaleHeaderMiddleware:
+    """
+    Flags responses built from fallback data: `Warning: 110` (response is
+    stale), `X-Data-Source` naming the fallback, and `Age` when it's known.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        holder = {}
+
+        async def send_with_staleness(message):
+            if message["type"] == "http.response.start" and holder:
+                headers = list(message.get("headers", []))
+                headers.append((b"warning", b'110 - "Response is Stale"'))
+                headers.append((b"x-data-source", holder["source"].encode()))
+                if holder.get("age") is not None:
+                    headers.append((b"age", str(int(holder["age"])).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        token = _stale.set(holder)
+        try:
+            await self.app(scope, receive, send_with_staleness)
+        finally:
+            _stale.reset(token)
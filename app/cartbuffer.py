@@ -0,0 +1,173 @@
+"""
+Write-behind buffer for cart documents.
+
+Keeps each active user's cart in memory and merges the mutations made
+within a short window into one datastore write. Reads are served from the
+buffer, so a user always sees their own writes. A background thread flushes
+dirty carts once their window has passed and drops carts that have been
+idle for a while; `hold()` flushes synchronously (used before checkout) and
+`flush_all()` runs on shutdown.
+
+The buffer is per process, so enable it (CART_WRITE_BEHIND=true) only when
+a user's requests reach the same instance, e.g. with session affinity.
+"""
+import contextlib
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("items", "dirty_since", "last_used", "lock", "evicted")
+
+    def __init__(self):
+        self.items = None  # loaded lazily
+        self.dirty_since = None
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        self.evicted = False
+
+
+class CartBuffer:
+    def __init__(self, load, store, window: float = 0.5, idle_ttl: float = 60.0):
+        """
+        `load(user_id) -> items` reads a cart, `store(user_id, items)` writes one.
+        """
+        self._load = load
+        self._store = store
+        self.window = window
+        self.idle_ttl = idle_ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"mutations": 0, "writes": 0}
+
+    @contextlib.contextmanager
+    def _locked_entry(self, user_id):
+        while True:
+            with self._lock:
+                entry = self._entries.get(user_id)
+                if entry is None:
+                    entry = self._entries[user_id] = _Entry()
+            with entry.lock:
+                # The flusher may have evicted it between the two locks
+                if entry.evicted:
+                    continue
+                if entry.items is None:
+                    entry.items = self._load(user_id)
+                entry.last_used = time.monotonic()
+                yield entry
+                return
+
+    def _mutate(self, user_id, fn):
+        """
+        Applies fn(items) under the user's lock. A truthy result marks the cart dirty.
+        Returns (result, copy of items).
+        """
+        self._ensure_flusher()
+        with self._locked_entry(user_id) as entry:
+            changed = fn(entry.items)
+            if changed:
+                self.stats["mutations"] += 1
+                if entry.dirty_since is None:
+                    entry.dirty_since = time.monotonic()
+            return changed, dict(entry.items)
+
+    def add(self, user_id: str, item_id: str, quantity: int):
+        def apply(items):
+            items[item_id] = items.get(item_id, 0) + quantity
+            return True
+        return self._mutate(user_id, apply)[1]
+
+    def remove(self, user_id: str, item_id: str):
+        """
+        Returns the updated items, or None if the item wasn't in the cart.
+        """
+        removed, items = self._mutate(user_id, lambda items: items.pop(item_id, None) is not None)
+        return items if removed else None
+
+    def get(self, user_id: str):
+        with self._locked_entry(user_id) as entry:
+            return dict(entry.items)
+
+    def _flush_entry(self, user_id, entry):
+        # Caller holds entry.lock
+        if entry.dirty_since is None:
+            return
+        self._store(user_id, dict(entry.items))
+        self.stats["writes"] += 1
+        entry.dirty_since = None
+
+    def flush(self, user_id: str):
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is not None:
+            with entry.lock:
+                self._flush_entry(user_id, entry)
+
+    @contextlib.contextmanager
+    def hold(self, user_id: str):
+        """
+        Flushes the user's cart and blocks their mutations while the block runs
+        (e.g. a checkout that rewrites the cart in the datastore). The buffered
+        copy is dropped afterwards, so the next read goes to the datastore.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None:
+            yield
+            return
+        with entry.lock:
+            if not entry.evicted:
+                self._flush_entry(user_id, entry)
+            try:
+                yield
+            finally:
+                entry.evicted = True
+                with self._lock:
+                    if self._entries.get(user_id) is entry:
+                        del self._entries[user_id]
+
+    def flush_due(self, now: float = None):
+        """
+        Flushes carts whose write window has passed and evicts idle clean carts.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entries = list(self._entries.items())
+        for user_id, entry in entries:
+            with entry.lock:
+                if entry.evicted:
+                    continue
+                if entry.dirty_since is not None and now - entry.dirty_since >= self.window:
+                    try:
+                        self._flush_entry(user_id, entry)
+                    except Exception as e:
+                        # Stays dirty and is retried on the next pass
+                        log.error("Error flushing cart for %s: %s", user_id, e)
+                elif entry.dirty_since is None and now - entry.last_used >= self.idle_ttl:
+                    entry.evicted = True
+                    with self._lock:
+                        del self._entries[user_id]
+
+    def flush_all(self):
+        self._stop.set()
+        with self._lock:
+            entries = list(self._entries.items())
+        for user_id, entry in entries:
+            with entry.lock:
+                self._flush_entry(user_id, entry)
+
+    def _ensure_flusher(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="cart-flusher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.window / 2):
+            self.flush_due()
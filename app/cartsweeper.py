@@ -0,0 +1,131 @@
+"""
+Background deletion of expired carts.
+
+Every cart write stamps `expires_at` (see database._cart_document), so an
+abandoned guest cart stops being touched and eventually falls behind the
+clock. The sweeper periodically queries carts whose `expires_at` has passed
+and deletes them in write batches committed in parallel. Deletes are paced
+to at most `max_rate` documents per second so a large backlog doesn't starve
+regular traffic of write capacity (Firestore recommends starting around 500
+writes/second for a new workload).
+
+Only document references are fetched (an empty projection), so a sweep
+doesn't read cart contents, and it's a collection-group query, so it covers
+the carts of every tenant (see app/tenancy.py). Runs in a daemon thread;
+`sweep()` can also be called directly (e.g. from the admin endpoint).
+
+Each delete carries its snapshot's update time as a precondition, so a cart
+written between the query and the delete is kept.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from google.api_core import exceptions as gcp_exceptions
+
+log = logging.getLogger(__name__)
+
+
+class CartSweeper:
+    def __init__(self, get_client, batch_size: int = 500, parallelism: int = 4,
+                 max_rate: float = 500.0, interval: float = 300.0):
+        """
+        `get_client()` returns the datastore client, or None when it's unavailable.
+        """
+        self._get_client = get_client
+        self.batch_size = batch_size
+        self.parallelism = parallelism
+        self.max_rate = max_rate
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"sweeps": 0, "reclaimed": 0, "errors": 0}
+
+    def _delete(self, client, snapshots):
+        """
+        Deletes the carts unless they were written after the sweep query read
+        them (the user came back). Returns the number deleted.
+        """
+        batch = client.batch()
+        for snapshot in snapshots:
+            batch.delete(snapshot.reference, option=client.write_option(last_update_time=snapshot.update_time))
+        try:
+            batch.commit()
+            return len(snapshots)
+        except gcp_exceptions.FailedPrecondition:
+            pass
+
+        # A batch is all or nothing; delete one by one, skipping the carts that changed
+        deleted = 0
+        for snapshot in snapshots:
+            try:
+                snapshot.reference.delete(option=client.write_option(last_update_time=snapshot.update_time))
+                deleted += 1
+            except gcp_exceptions.FailedPrecondition:
+                continue
+        return deleted
+
+    def sweep(self, now: datetime = None):
+        """
+        Deletes every cart that expired before `now`. Returns the number deleted.
+        """
+        client = self._get_client()
+        if client is None:
+            return 0
+        cutoff = now or datetime.now(timezone.utc)
+        page = self.batch_size * self.parallelism
+        deleted = 0
+        # One sweep at a time, so two sweeps don't race to delete the same page
+        with self._lock, ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="cart-sweep") as pool:
+            while True:
+                started = time.monotonic()
+                query = client.collection_group("carts").where("expires_at", "<", cutoff).select([]).limit(page)
+                expired = list(query.stream())
+                if not expired:
+                    break
+                batches = [expired[i:i + self.batch_size] for i in range(0, len(expired), self.batch_size)]
+                futures = [pool.submit(self._delete, client, batch) for batch in batches]
+                failed = False
+                for future in futures:
+                    try:
+                        deleted += future.result()
+                    except Exception as e:
+                        # Left for the next sweep
+                        log.error("Error deleting expired carts: %s", e)
+                        self.stats["errors"] += 1
+                        failed = True
+                if failed or len(expired) < page:
+                    break
+                # Pace the next page so deletes stay under max_rate per second
+                if self.max_rate > 0:
+                    if self._stop.wait(max(0.0, len(expired) / self.max_rate - (time.monotonic() - started))):
+                        break
+
+        self.stats["sweeps"] += 1
+        self.stats["reclaimed"] += deleted
+        if deleted:
+            log.info("Cart sweeper: deleted %d expired carts.", deleted)
+        return deleted
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="cart-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                log.exception("Cart sweep failed: %s", e)
+                self.stats["errors"] += 1
@@ -0,0 +1,300 @@
+"""
+Columnar in-memory snapshot of the product catalog.
+
+Prices and ratings are NumPy arrays, category and inventory_status are small
+integer codes (with a row list per category), and string fields are
+interned, so filters over the whole catalog run as vectorized boolean masks
+with no datastore reads.
+
+The snapshot is loaded from the datastore on first use, rebuilt when the
+inventory is reloaded, and refreshed in the background of a request once it
+is older than CATALOG_TTL_SECONDS (other requests keep using the old one).
+If the datastore is unavailable (see app/breaker.py), the last good snapshot
+is kept, or one is built from the inventory CSV, and responses using it are
+marked stale until a refresh from the datastore succeeds.
+"""
+import bisect
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+
+from app import breaker
+from app import config
+from app import database
+from app.cache import LRUCache
+
+_WORD = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+SORTS = ("price_asc", "price_desc", "rating_desc", "rating_asc", "title_asc")
+
+
+class Catalog:
+    def __init__(self, records, version: int = 0):
+        self.version = version
+        self.records = [dict(r) for r in records]
+        for record in self.records:
+            for field in ("id", "category", "title", "inventory_status"):
+                if isinstance(record.get(field), str):
+                    record[field] = sys.intern(record[field])
+
+        self.ids = [r["id"] for r in self.records]
+        self.titles = [r.get("title", "").lower() for r in self.records]
+        # Distinct title words, sorted for prefix lookups
+        self.title_words = sorted({w for t in self.titles for w in _WORD.findall(t)})
+        self.row_of = {item_id: i for i, item_id in enumerate(self.ids)}
+        self.price = np.array([float(r.get("price", 0.0)) for r in self.records], dtype=np.float64)
+        self.rating = np.array([float(r.get("rating", 0.0)) for r in self.records], dtype=np.float32)
+
+        self.categories, self.category_codes = _encode([r.get("category", "") for r in self.records])
+        self.statuses, self.status_codes = _encode([r.get("inventory_status", "") for r in self.records])
+        # Row indices per category code, in catalog order
+        order = np.argsort(self.category_codes, kind="stable")
+        bounds = np.searchsorted(self.category_codes[order], np.arange(len(self.categories) + 1))
+        self.category_rows = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.categories))]
+
+        # Title order as a rank array, so sorting by title is an integer argsort
+        title_order = sorted(range(len(self.records)), key=lambda i: self.records[i].get("title", "").lower())
+        self.title_rank = np.empty(len(self.records), dtype=np.int64)
+        self.title_rank[title_order] = np.arange(len(self.records))
+
+        self.price_edges = np.array(config.PRICE_FACET_EDGES, dtype=np.float64)
+        self.rating_edges = np.array(config.RATING_FACET_EDGES, dtype=np.float32)
+        # Facets per normalized filter set; a rebuilt catalog starts empty
+        self._facet_cache = LRUCache(maxsize=config.FACET_CACHE_SIZE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def _codes(self, values, vocabulary):
+        lookup = {v: i for i, v in enumerate(vocabulary)}
+        return [lookup[v] for v in values if v in lookup]
+
+    def select(self, q=None, categories=None, min_price=None, max_price=None, min_rating=None, statuses=None):
+        """
+        Returns the indices of rows matching all given filters (None means no filter).
+        `q` matches a case-insensitive substring of the title. A category filter starts from that category's rows, so the other
+        columns are only compared for those.
+        """
+        if categories is not None:
+            postings = [self.category_rows[c] for c in self._codes(categories, self.categories)]
+            rows = np.sort(np.concatenate(postings)) if postings else np.empty(0, dtype=np.int64)
+            column = lambda values: values[rows]
+        else:
+            rows = None
+            column = lambda values: values
+
+        mask = None
+        def require(condition):
+            nonlocal mask
+            mask = condition if mask is None else np.logical_and(mask, condition, out=mask)
+
+        if q is not None:
+            needle = q.lower().strip()
+            titles = self.titles if rows is None else [self.titles[i] for i in rows]
+            require(np.fromiter((needle in t for t in titles), dtype=bool, count=len(titles)))
+        if statuses is not None:
+            codes = column(self.status_codes)
+            matches = np.zeros(len(codes), dtype=bool)
+            for code in self._codes(statuses, self.statuses):
+                matches |= codes == code
+            require(matches)
+        if min_price is not None or max_price is not None:
+            price = column(self.price)
+            if min_price is not None:
+                require(price >= min_price)
+            if max_price is not None:
+                require(price <= max_price)
+        if min_rating is not None:
+            require(column(self.rating) >= min_rating)
+
+        if rows is None:
+            return np.arange(len(self.records)) if mask is None else np.flatnonzero(mask)
+        return rows if mask is None else rows[mask]
+
+    def has_title_word(self, prefix: str):
+        """
+        Whether any title has a word starting with `prefix`.
+        """
+        i = bisect.bisect_left(self.title_words, prefix)
+        return i < len(self.title_words) and self.title_words[i].startswith(prefix)
+
+    def title_matches(self, rows, alternatives):
+        """
+        Boolean mask over `rows`: whether each title contains any of `alternatives`.
+        """
+        titles = self.titles
+        return np.fromiter(
+            (any(word in titles[i] for word in alternatives) for i in rows), dtype=bool, count=len(rows)
+        )
+
+    def sort_key(self, rows, sort: str):
+        if sort == "price_asc":
+            return self.price[rows]
+        if sort == "price_desc":
+            return -self.price[rows]
+        if sort == "rating_desc":
+            return -self.rating[rows]
+        if sort == "rating_asc":
+            return self.rating[rows]
+        if sort == "title_asc":
+            return self.title_rank[rows]
+        raise ValueError(f"Unknown sort: {sort}")
+
+    def sort_rows(self, rows, sort: str = None, k: int = None):
+        """
+        Returns the first `k` (default all) of `rows` ordered by `sort`, one of
+        SORTS; ties keep catalog order, and None keeps catalog order throughout.
+        """
+        if sort is None:
+            return rows[:k]
+        key = self.sort_key(rows, sort)
+        if k is not None and k < len(rows):
+            # Partial sort: keep everything below the k-th key plus the
+            # earliest rows equal to it, then order just those
+            bound = np.partition(key, k - 1)[k - 1]
+            below = np.flatnonzero(key < bound)
+            tied = np.flatnonzero(key == bound)[:k - len(below)]
+            keep = np.sort(np.concatenate([below, tied]))
+            rows, key = rows[keep], key[keep]
+        return rows[np.argsort(key, kind="stable")]
+
+    def page(self, rows, sort: str = None, offset: int = 0, limit: int = 50):
+        return self.materialize(self.sort_rows(rows, sort, k=offset + limit)[offset:])
+
+    def filter(self, sort: str = None, offset: int = 0, limit: int = 50, **filters):
+        """
+        Returns (total_matches, page of product dicts).
+        """
+        rows = self.select(**filters)
+        return len(rows), self.page(rows, sort, offset, limit)
+
+    def facets(self, rows=None, **filters):
+        """
+        Counts per category, inventory_status, price bucket and rating band for
+        the rows matching `filters` (pass `rows` if already selected). Cached
+        per filter set; the result must be treated as read-only.
+        """
+        key = _filter_key(filters)
+        cached = self._facet_cache.get(key)
+        if cached is None:
+            cached = self._count_facets(self.select(**filters) if rows is None else rows)
+            self._facet_cache.set(key, cached)
+        return cached
+
+    def _count_facets(self, rows):
+        categories = np.bincount(self.category_codes[rows], minlength=len(self.categories))
+        statuses = np.bincount(self.status_codes[rows], minlength=len(self.statuses))
+        prices = np.bincount(
+            np.searchsorted(self.price_edges, self.price[rows], side="right"),
+            minlength=len(self.price_edges) + 1,
+        )
+        ratings = np.bincount(
+            np.searchsorted(self.rating_edges, self.rating[rows], side="right"),
+            minlength=len(self.rating_edges) + 1,
+        )
+        return {
+            "category": {name: int(n) for name, n in zip(self.categories, categories) if n},
+            "inventory_status": {name: int(n) for name, n in zip(self.statuses, statuses) if n},
+            "price": _buckets(self.price_edges, prices, lambda v: f"${v:g}"),
+            "rating": _buckets(self.rating_edges, ratings, lambda v: f"{v:g}"),
+        }
+
+    def materialize(self, rows):
+        return [self.records[i] for i in rows]
+
+
+def _encode(values):
+    """
+    Dictionary-encodes strings: returns (vocabulary, int16 code array).
+    """
+    vocabulary = sorted(set(values))
+    lookup = {v: i for i, v in enumerate(vocabulary)}
+    return vocabulary, np.array([lookup[v] for v in values], dtype=np.int16)
+
+
+def _filter_key(filters):
+    key = []
+    for name, value in sorted(filters.items()):
+        if isinstance(value, (list, tuple, set)):
+            value = tuple(sorted(value))
+        elif isinstance(value, str):
+            value = value.lower().strip()
+        key.append((name, value))
+    return tuple(key)
+
+
+def _buckets(edges, counts, fmt):
+    """
+    Labels histogram counts for half-open ranges [edges[i-1], edges[i]).
+    """
+    bounds = [None] + [float(e) for e in edges] + [None]
+    buckets = []
+    for low, high, count in zip(bounds, bounds[1:], counts):
+        if low is None:
+            label = f"Under {fmt(high)}"
+        elif high is None:
+            label = f"{fmt(low)} and up"
+        else:
+            label = f"{fmt(low)} - {fmt(high)}"
+        buckets.append({"label": label, "min": low, "max": high, "count": int(count)})
+    return buckets
+
+
+_catalog = None
+_loaded_at = 0.0
+_stale = True
+_version = 0
+# "snapshot" or "csv" while the snapshot isn't fresh from the datastore
+_degraded = None
+_lock = threading.Lock()
+
+
+def _rebuild():
+    global _catalog, _loaded_at, _stale, _version, _degraded
+    with breaker.track_stale() as fallback:
+        records = database.get_all_products()
+    _stale = False
+    if fallback and _catalog is not None:
+        # Keep what we have rather than swap in fallback data
+        _degraded = _degraded or "snapshot"
+        return
+    _version += 1
+    _catalog = Catalog(records, version=_version)
+    _loaded_at = time.monotonic()
+    _degraded = fallback.get("source")
+
+
+def get_catalog():
+    """
+    Returns the current Catalog snapshot, loading or refreshing it as needed.
+    """
+    if _catalog is None or _stale:
+        with _lock:
+            if _catalog is None or _stale:
+                _rebuild()
+    elif _degraded or time.monotonic() - _loaded_at > config.CATALOG_TTL_SECONDS:
+        # Only one request refreshes an expired snapshot; the rest use the old one.
+        # While degraded every request tries, which costs little: the breaker
+        # rejects at once while it's open.
+        if _lock.acquire(blocking=False):
+            try:
+                _rebuild()
+            finally:
+                _lock.release()
+    if _degraded:
+        breaker.mark_stale(_degraded, time.monotonic() - _loaded_at if _degraded == "snapshot" else None)
+    return _catalog
+
+
+def invalidate(rows=None):
+    """
+    Marks the snapshot stale so the next get_catalog() rebuilds it.
+    """
+    global _stale
+    _stale = True
+
+
+database.on_inventory_change(invalidate)
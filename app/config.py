@@ -1,4 +1,6 @@
 import os
+import json
+import logging
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,17 +18,190 @@ SERVICE_URL = os.getenv("SERVICE_URL", "http://localhost:8080")
 # Project ID (Optional check)
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
 
+# Datastore backend: "firestore" (default) or "memory" for the in-process stand-in
+# used by local load tests and demos without a Firestore project.
+DATASTORE = os.getenv("DATASTORE", "firestore")
+
+# Inventory
+# Stock seeded from each row's inventory_status when loading the CSV
+INITIAL_STOCK_IN_STOCK = int(os.getenv("INITIAL_STOCK_IN_STOCK", "100"))
+INITIAL_STOCK_LOW_STOCK = int(os.getenv("INITIAL_STOCK_LOW_STOCK", "5"))
+# Quantities at or below this are reported as LOW_STOCK
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "10"))
+# Stock is kept in sharded counters; more shards allow more concurrent
+# checkouts of the same SKU. Per-SKU overrides are a JSON object,
+# e.g. STOCK_SHARD_OVERRIDES='{"SKU-10001": 16}'
+STOCK_SHARDS = int(os.getenv("STOCK_SHARDS", "4"))
+STOCK_SHARD_OVERRIDES = json.loads(os.getenv("STOCK_SHARD_OVERRIDES", "{}"))
+MAX_STOCK_SHARDS = int(os.getenv("MAX_STOCK_SHARDS", "100"))
+# Aggregated stock levels are cached for this many seconds
+STOCK_CACHE_TTL = float(os.getenv("STOCK_CACHE_TTL", "5"))
+STOCK_CACHE_SIZE = int(os.getenv("STOCK_CACHE_SIZE", "4096"))
+# The in-memory catalog used by /products/filter is rebuilt on inventory
+# reload, and refreshed once it is older than this
+CATALOG_TTL_SECONDS = float(os.getenv("CATALOG_TTL_SECONDS", "300"))
+# Largest page returned by /products/filter
+FILTER_MAX_LIMIT = int(os.getenv("FILTER_MAX_LIMIT", "200"))
+# Facet bucket boundaries (comma-separated) and number of cached facet results
+PRICE_FACET_EDGES = [float(v) for v in os.getenv("PRICE_FACET_EDGES", "25,50,100,200").split(",")]
+RATING_FACET_EDGES = [float(v) for v in os.getenv("RATING_FACET_EDGES", "3,4,4.5").split(",")]
+FACET_CACHE_SIZE = int(os.getenv("FACET_CACHE_SIZE", "1024"))
+# Autocomplete: most suggestions returned, and prefix length up to which the
+# best matches are precomputed
+SUGGEST_MAX_LIMIT = int(os.getenv("SUGGEST_MAX_LIMIT", "20"))
+SUGGEST_PRECOMPUTED_PREFIX_LEN = int(os.getenv("SUGGEST_PRECOMPUTED_PREFIX_LEN", "3"))
+
+# Free-text queries (see app/nlquery.py): minimum rating for "top rated"
+QUERY_TOP_RATED = float(os.getenv("QUERY_TOP_RATED", "4.5"))
+# Semantic search: hashing vector size, rows scored per matrix product, and
+# catalog size from which queries only scan the SEMANTIC_NPROBE closest clusters
+SEMANTIC_DIMENSIONS = int(os.getenv("SEMANTIC_DIMENSIONS", "256"))
+SEMANTIC_CHUNK_ROWS = int(os.getenv("SEMANTIC_CHUNK_ROWS", "65536"))
+SEMANTIC_IVF_THRESHOLD = int(os.getenv("SEMANTIC_IVF_THRESHOLD", "50000"))
+SEMANTIC_NPROBE = int(os.getenv("SEMANTIC_NPROBE", "8"))
+SEMANTIC_KMEANS_ITERATIONS = int(os.getenv("SEMANTIC_KMEANS_ITERATIONS", "8"))
+# Related products: neighbours kept per product, score bonus for the same
+# price band, and rows scored per block when (re)computing the table
+RELATED_K = int(os.getenv("RELATED_K", "10"))
+RELATED_PRICE_WEIGHT = float(os.getenv("RELATED_PRICE_WEIGHT", "0.2"))
+RELATED_BLOCK_ROWS = int(os.getenv("RELATED_BLOCK_ROWS", "1024"))
+
+# Orders
+# Attempts before a contended checkout transaction gives up
+CHECKOUT_MAX_ATTEMPTS = int(os.getenv("CHECKOUT_MAX_ATTEMPTS", "10"))
+# Number of orders kept in the in-memory status cache, and seconds before a
+# cached order is read again (status changes made elsewhere show up after this)
+ORDER_CACHE_SIZE = int(os.getenv("ORDER_CACHE_SIZE", "1024"))
+ORDER_CACHE_TTL = float(os.getenv("ORDER_CACHE_TTL", "10"))
+# Default and maximum page size for order history
+ORDER_HISTORY_PAGE_SIZE = int(os.getenv("ORDER_HISTORY_PAGE_SIZE", "20"))
+ORDER_HISTORY_MAX_PAGE_SIZE = int(os.getenv("ORDER_HISTORY_MAX_PAGE_SIZE", "100"))
+# Default and maximum page size for catalog delta sync (/api/products/changes)
+CHANGES_PAGE_SIZE = int(os.getenv("CHANGES_PAGE_SIZE", "100"))
+CHANGES_MAX_PAGE_SIZE = int(os.getenv("CHANGES_MAX_PAGE_SIZE", "1000"))
+# How long a catalog write may hold back delta syncs if its instance dies mid-write
+CATALOG_WRITE_LEASE_SECONDS = float(os.getenv("CATALOG_WRITE_LEASE_SECONDS", "300"))
+# Days between checkout and the estimated delivery date
+DELIVERY_DAYS = int(os.getenv("DELIVERY_DAYS", "5"))
+
+# Carts
+# Buffer cart mutations in memory and merge those within the window into one
+# write. Only enable when a user's requests reach the same instance.
+CART_WRITE_BEHIND = os.getenv("CART_WRITE_BEHIND", "false").lower() == "true"
+CART_WRITE_BEHIND_WINDOW_MS = float(os.getenv("CART_WRITE_BEHIND_WINDOW_MS", "500"))
+# Buffered carts with no activity for this long are dropped from memory
+CART_BUFFER_IDLE_SECONDS = float(os.getenv("CART_BUFFER_IDLE_SECONDS", "60"))
+
+# Carts expire this long after their last write and are then deleted by the sweeper
+CART_TTL_DAYS = float(os.getenv("CART_TTL_DAYS", "7"))
+CART_SWEEP_ENABLED = os.getenv("CART_SWEEP_ENABLED", "true").lower() == "true"
+CART_SWEEP_INTERVAL_SECONDS = float(os.getenv("CART_SWEEP_INTERVAL_SECONDS", "300"))
+# Deletes per write batch (Firestore allows up to 500), batches committed in parallel,
+# and the most carts deleted per second
+CART_SWEEP_BATCH_SIZE = int(os.getenv("CART_SWEEP_BATCH_SIZE", "500"))
+CART_SWEEP_PARALLELISM = int(os.getenv("CART_SWEEP_PARALLELISM", "4"))
+CART_SWEEP_MAX_DELETES_PER_SECOND = float(os.getenv("CART_SWEEP_MAX_DELETES_PER_SECOND", "500"))
+
+# Rate limiting and load shedding
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Per user (or client address) token bucket: sustained requests/second and burst size
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "20"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "40"))
+# Proxies in front of the service that append to X-Forwarded-For: 1 for Cloud Run,
+# 2 behind an external HTTPS load balancer, 0 to ignore the header
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+# Maximum in-flight requests per route class on one instance
+CONCURRENCY_LIMIT_READ = int(os.getenv("CONCURRENCY_LIMIT_READ", "64"))
+CONCURRENCY_LIMIT_WRITE = int(os.getenv("CONCURRENCY_LIMIT_WRITE", "32"))
+CONCURRENCY_LIMIT_ADMIN = int(os.getenv("CONCURRENCY_LIMIT_ADMIN", "2"))
+# Above this average latency, concurrency caps shrink to shed load (0 disables)
+SHED_LATENCY_MS = float(os.getenv("SHED_LATENCY_MS", "500"))
+
+# Tenant namespaces: header naming the tenant, and an optional comma-separated
+# allowlist of tenant ids (empty allows any valid id)
+TENANT_HEADER = os.getenv("TENANT_HEADER", "X-Tenant-ID")
+TENANTS = {t.strip().lower() for t in os.getenv("TENANTS", "").split(",") if t.strip()}
+
+# Most SKUs per bulk product lookup
+BULK_LOOKUP_MAX_IDS = int(os.getenv("BULK_LOOKUP_MAX_IDS", "100"))
+
+# Batch endpoint: most sub-requests per batch, and time allowed for all of them
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+BATCH_TIMEOUT_SECONDS = float(os.getenv("BATCH_TIMEOUT_SECONDS", "10"))
+
+# Accounts and sessions
+# Key for signing session tokens; set the same value on every instance
+AUTH_SECRET = os.getenv("AUTH_SECRET", "")
+AUTH_TOKEN_TTL_SECONDS = int(os.getenv("AUTH_TOKEN_TTL_SECONDS", "86400"))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# scrypt cost parameters (N must be a power of 2)
+AUTH_SCRYPT_N = int(os.getenv("AUTH_SCRYPT_N", "16384"))
+AUTH_SCRYPT_R = int(os.getenv("AUTH_SCRYPT_R", "8"))
+AUTH_SCRYPT_P = int(os.getenv("AUTH_SCRYPT_P", "1"))
+# Threads hashing passwords; bounds the CPU and memory logins can use at once
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Require a session token on cart and order history calls
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "false").lower() == "true"
+# Which usernames have accounts, cached per instance: calls for a registered user
+# need its token. A signup may take this long to be seen by other instances.
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+
+# Datastore circuit breaker (see app/breaker.py): over the last
+# BREAKER_WINDOW calls, open once this share failed or was slower than
+# BREAKER_SLOW_CALL_SECONDS, then probe again after BREAKER_OPEN_SECONDS
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() == "true"
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "1.0"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("BREAKER_SLOW_CALL_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "10"))
+
+# Request deadlines (see app/deadline.py): time budget per route class, and
+# per-path-prefix overrides, e.g. "/api/batch=15,/api/cart/checkout=12"
+DEADLINE_READ_SECONDS = float(os.getenv("DEADLINE_READ_SECONDS", "5"))
+DEADLINE_WRITE_SECONDS = float(os.getenv("DEADLINE_WRITE_SECONDS", "10"))
+DEADLINE_ADMIN_SECONDS = float(os.getenv("DEADLINE_ADMIN_SECONDS", "120"))
+DEADLINE_ROUTE_OVERRIDES = os.getenv("DEADLINE_ROUTE_OVERRIDES", "")
+# Shortest budget a caller may ask for with X-Request-Timeout
+DEADLINE_MIN_SECONDS = float(os.getenv("DEADLINE_MIN_SECONDS", "0.25"))
+# Timeout for datastore calls made outside a request (background threads)
+DATASTORE_TIMEOUT_SECONDS = float(os.getenv("DATASTORE_TIMEOUT_SECONDS", "30"))
+# First backoff between retries of transient datastore errors; doubles each retry
+DATASTORE_RETRY_INITIAL_SECONDS = float(os.getenv("DATASTORE_RETRY_INITIAL_SECONDS", "0.05"))
+
+# Hedged reads (see app/hedging.py) for product and cart lookups: send a second
+# read once the first has taken longer than this percentile of recent reads
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "2"))
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "64"))
+
+# Logging (JSON lines on stdout, see app/logs.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Per-module levels, e.g. "app.database=DEBUG,app.cartsweeper=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Each distinct message may log this many times per interval; the rest are counted and dropped
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "10"))
+LOG_SAMPLE_INTERVAL_SECONDS = float(os.getenv("LOG_SAMPLE_INTERVAL_SECONDS", "10"))
+
 def configure_environment():
     """
-    Sets up environment variables if they are not already set.
+    Sets up logging, and environment variables if they are not already set.
     """
+    from app import logs
+    logs.configure()
+    log = logging.getLogger(__name__)
+
     if GOOGLE_APPLICATION_CREDENTIALS:
-        print(f"Setting credentials from config: {GOOGLE_APPLICATION_CREDENTIALS}")
+        log.info("Setting credentials from config: %s", GOOGLE_APPLICATION_CREDENTIALS)
         # This is required for the google-cloud-firestore library to pick it up
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
     
     # Other setup if needed
-    print(f"Service URL configured as: {SERVICE_URL}")
+    log.info("Service URL configured as: %s", SERVICE_URL)
 
 # Execute configuration
 configure_environment()
+
@@ -1,29 +1,331 @@
 
 import os
 import csv
+import contextlib
+import copy
+import functools
+import json
+import logging
+import base64
 import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from google.api_core import exceptions as gcp_exceptions
 from google.cloud import firestore
 from app.models import InventoryItem, CartItem
 from app import config
+from app.cache import LRUCache
+from app import memstore
+from app import tenancy
+from app import breaker
+from app import deadline
+from app.singleflight import coalesce
+from app.cartbuffer import CartBuffer
+from app.cartsweeper import CartSweeper
+from app.hedging import Hedger
+
+log = logging.getLogger(__name__)
 
 # Initialize Firestore
 db = None
-try:
-    db = firestore.Client()
-    print("Firestore client initialized.")
-except Exception as e:
-    print(f"Warning: Could not initialize Firestore client. {e}")
+if config.DATASTORE == "memory":
+    db = memstore.Client()
+    log.info("Using in-memory datastore.")
+else:
+    try:
+        db = firestore.Client()
+        log.info("Firestore client initialized.")
+    except Exception as e:
+        log.warning("Could not initialize Firestore client. %s", e)
+
+def _cart_document(items: dict):
+    """
+    Cart document for a write; every write pushes `expires_at` forward.
+    """
+    return {
+        "items": items,
+        "last_modified": firestore.SERVER_TIMESTAMP,
+        "expires_at": datetime.now(timezone.utc) + timedelta(days=config.CART_TTL_DAYS),
+    }
+
+# The write-behind buffer flushes from a background thread, outside any
+# request, so its keys carry the tenant: (tenant, user_id)
+def _cart_key(user_id: str):
+    return (tenancy.current(), user_id)
+
+def _load_cart_items(key):
+    tenant, user_id = key
+    with tenancy.use(tenant):
+        doc = tenancy.collection(db, "carts").document(user_id).get(**deadline.options())
+    return doc.to_dict().get("items", {}) if doc.exists else {}
+
+def _store_cart_items(key, items: dict):
+    tenant, user_id = key
+    with tenancy.use(tenant):
+        cart_ref = tenancy.collection(db, "carts").document(user_id)
+    if items:
+        cart_ref.set(_cart_document(items), **deadline.options())
+    else:
+        cart_ref.delete(**deadline.options())
+
+# Optional write-behind cart buffer (see app/cartbuffer.py)
+cart_buffer = None
+if config.CART_WRITE_BEHIND:
+    cart_buffer = CartBuffer(
+        _load_cart_items,
+        _store_cart_items,
+        window=config.CART_WRITE_BEHIND_WINDOW_MS / 1000,
+        idle_ttl=config.CART_BUFFER_IDLE_SECONDS,
+    )
+
+# Deletes expired carts in the background (see app/cartsweeper.py)
+cart_sweeper = CartSweeper(
+    lambda: db,
+    batch_size=config.CART_SWEEP_BATCH_SIZE,
+    parallelism=config.CART_SWEEP_PARALLELISM,
+    max_rate=config.CART_SWEEP_MAX_DELETES_PER_SECOND,
+    interval=config.CART_SWEEP_INTERVAL_SECONDS,
+)
+
+def flush_carts():
+    """
+    Writes any buffered cart changes to the datastore (called on shutdown).
+    """
+    if cart_buffer:
+        cart_buffer.flush_all()
+
+class CheckoutError(Exception):
+    """
+    Base class for checkout failures that should be reported to the caller.
+    """
+
+class CartEmptyError(CheckoutError):
+    pass
+
+class OutOfStockError(CheckoutError):
+    def __init__(self, item_ids):
+        super().__init__(f"Insufficient stock for: {', '.join(item_ids)}")
+        self.item_ids = item_ids
+
+class CheckoutContentionError(CheckoutError):
+    pass
+
+# Datastore calls go through a circuit breaker (see app/breaker.py), so
+# they fail fast while Firestore is down or slow instead of piling up
+datastore_breaker = breaker.CircuitBreaker(
+    "datastore",
+    window=config.BREAKER_WINDOW,
+    min_calls=config.BREAKER_MIN_CALLS,
+    failure_rate=config.BREAKER_FAILURE_RATE,
+    slow_call_seconds=config.BREAKER_SLOW_CALL_SECONDS,
+    slow_call_rate=config.BREAKER_SLOW_CALL_RATE,
+    open_seconds=config.BREAKER_OPEN_SECONDS,
+    # Business outcomes, not datastore trouble
+    excluded=(CheckoutError, ValueError, deadline.DeadlineExceeded),
+)
+
+def _within_budget(fn, *args, **kwargs):
+    """
+    Runs fn, re-raising a datastore timeout as deadline.DeadlineExceeded when
+    the request's own budget had run out (e.g. a short X-Request-Timeout):
+    the breaker excludes those, so callers can't open it for everyone.
+    """
+    try:
+        return fn(*args, **kwargs)
+    except (gcp_exceptions.DeadlineExceeded, gcp_exceptions.RetryError) as e:
+        if deadline.ran_out(e):
+            raise deadline.DeadlineExceeded("Request deadline exceeded") from e
+        raise
+
+def _guarded(fn):
+    """
+    Runs a datastore read or write through the breaker; raises
+    breaker.CircuitOpenError instead while the breaker is open, and
+    breaker.DatastoreUnavailable if there is no datastore client at all.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not db:
+            raise breaker.DatastoreUnavailable("Firestore not available.", retry_after=config.BREAKER_OPEN_SECONDS)
+        if not config.BREAKER_ENABLED:
+            return _within_budget(fn, *args, **kwargs)
+        return datastore_breaker.call(_within_budget, fn, *args, **kwargs)
+    return wrapper
+
+# Optional hedged reads for idempotent lookups (see app/hedging.py)
+hedger = Hedger(
+    workers=config.HEDGE_WORKERS,
+    percentile=config.HEDGE_PERCENTILE,
+    min_delay=config.HEDGE_MIN_DELAY_MS / 1000,
+)
+
+def _hedged(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not config.HEDGE_ENABLED:
+            return fn(*args, **kwargs)
+        return hedger.call(fn.__name__.lstrip("_"), fn, *args, **kwargs)
+    return wrapper
+
+# The last full product list read from the datastore, and when
+_last_known_good = {"products": None, "loaded_at": 0.0}
+# Products parsed from the inventory CSV, when nothing better is available
+_csv_products = None
+
+def _remember_products(products):
+    _last_known_good["products"] = [dict(p) for p in products]
+    _last_known_good["loaded_at"] = time.monotonic()
+
+def _fallback_products():
+    """
+    Returns (products, source, age in seconds or None) to answer catalog reads
+    without the datastore: the last-known-good list, or else the inventory CSV.
+    The products are shared; copy any that are returned to callers.
+    """
+    global _csv_products
+    if _last_known_good["products"] is not None:
+        return _last_known_good["products"], "snapshot", time.monotonic() - _last_known_good["loaded_at"]
+    if _csv_products is None:
+        _csv_products = _read_inventory_csv() or []
+    return _csv_products, "csv", None
+
+def _catalog_read(fallback):
+    """
+    Runs a catalog read through the breaker. If there is no datastore, the
+    read fails or the breaker is open, returns fallback(products, *args)
+    computed from _fallback_products() and marks the response stale.
+    """
+    def decorator(fn):
+        guarded = _guarded(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if db:
+                try:
+                    return guarded(*args, **kwargs)
+                except breaker.CircuitOpenError:
+                    pass
+                except Exception as e:
+                    log.warning("Catalog read %s failed, serving fallback data: %s", fn.__name__, e)
+            products, source, age = _fallback_products()
+            breaker.mark_stale(source, age)
+            return fallback(products, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def initial_stock(inventory_status: str):
+    """
+    Stock level to seed for a CSV inventory_status.
+    """
+    if inventory_status == "IN_STOCK":
+        return config.INITIAL_STOCK_IN_STOCK
+    if inventory_status == "LOW_STOCK":
+        return config.INITIAL_STOCK_LOW_STOCK
+    return 0
 
+def stock_status(quantity: int):
+    """
+    Derives inventory_status from a stock quantity.
+    """
+    if quantity <= 0:
+        return "OUT_OF_STOCK"
+    if quantity <= config.LOW_STOCK_THRESHOLD:
+        return "LOW_STOCK"
+    return "IN_STOCK"
+
+def _fallback_item(products, item_id):
+    return next((dict(p) for p in products if p.get("id") == item_id), None)
+
+@_catalog_read(_fallback_item)
+@coalesce()
+@_hedged
 def get_inventory_item(item_id: str):
-    if not db:
-        print("Firestore not available.")
-        return None
     doc_ref = db.collection("inventory").document(item_id)
-    doc = doc_ref.get()
+    doc = doc_ref.get(**deadline.options())
     if doc.exists:
-        return doc.to_dict()
+        return _with_stock([doc.to_dict()])[0]
     return None
 
+def _fallback_items(products, item_ids):
+    by_id = {p.get("id"): p for p in products}
+    unique_ids = list(dict.fromkeys(item_ids))
+    items = [dict(by_id[item_id]) for item_id in unique_ids if item_id in by_id]
+    return items, [item_id for item_id in unique_ids if item_id not in by_id]
+
+@_catalog_read(_fallback_items)
+@coalesce(key=lambda item_ids: tuple(item_ids))
+def get_inventory_items(item_ids):
+    """
+    Looks up several items in one get_all round trip.
+    Returns (items in the order first requested, ids that don't exist).
+    """
+    unique_ids = list(dict.fromkeys(item_ids))
+    refs = [db.collection("inventory").document(item_id) for item_id in unique_ids]
+    found = {doc.id: doc.to_dict() for doc in db.get_all(refs, **deadline.options()) if doc.exists}
+
+    items = _with_stock([found[item_id] for item_id in unique_ids if item_id in found])
+    missing = [item_id for item_id in unique_ids if item_id not in found]
+    return items, missing
+
+
+# Common synonyms/plurals mapped to canonical categories (keys are Title Case)
+CATEGORY_SYNONYMS = {
+    # Apparel
+    "Clothing": "Apparel",
+    "Clothes": "Apparel",
+    "Wear": "Apparel",
+    "Jackets": "Apparel",
+    "Shirts": "Apparel",
+    "Shirt": "Apparel",
+    "T-Shirt": "Apparel",
+    "T-Shirts": "Apparel",
+    "Pants": "Apparel",
+    
+    # Footwear
+    "Shoes": "Footwear",
+    "Shoe": "Footwear",
+    "Sneakers": "Footwear",
+    "Sneaker": "Footwear",
+    "Boots": "Footwear",
+    "Boot": "Footwear",
+    "Sandals": "Footwear",
+    "Sandal": "Footwear",
+    "Cleats": "Footwear",
+    "Cleat": "Footwear",
+    
+    # Basketball
+    "Basketballs": "Basketball",
+    "Hoops": "Basketball",
+    
+    # Baseball
+    "Baseballs": "Baseball",
+    
+    # Football
+    "Footballs": "Football",
+    "Pads": "Football",
+    
+    # Golf
+    "Golfs": "Golf",
+    "Clubs": "Golf",
+    "Club": "Golf",
+    
+    # Camping
+    "Tents": "Camping",
+    "Tent": "Camping",
+    "Gear": "Camping",
+    
+    # Fishing
+    "Fish": "Fishing",
+    "Rods": "Fishing",
+    "Rod": "Fishing",
+    "Lures": "Fishing",
+    "Lure": "Fishing",
+    
+    # Hunting
+    "Hunt": "Hunting",
+}
 
 def validate_category(category: str):
     """
@@ -35,89 +337,36 @@ def validate_category(category: str):
     # Standardize to Title Case for matching our DB (e.g. "basketball" -> "Basketball")
     normalized_cat = category.strip().title()
     
-    # Map common synonyms/plurals to canonical categories
-    synonyms = {
-        # Apparel
-        "Clothing": "Apparel",
-        "Clothes": "Apparel",
-        "Wear": "Apparel",
-        "Jackets": "Apparel",
-        "Shirts": "Apparel",
-        "Shirt": "Apparel",
-        "T-Shirt": "Apparel",
-        "T-Shirts": "Apparel",
-        "Pants": "Apparel",
-        
-        # Footwear
-        "Shoes": "Footwear",
-        "Shoe": "Footwear",
-        "Sneakers": "Footwear",
-        "Sneaker": "Footwear",
-        "Boots": "Footwear",
-        "Boot": "Footwear",
-        "Sandals": "Footwear",
-        "Sandal": "Footwear",
-        "Cleats": "Footwear",
-        "Cleat": "Footwear",
-        
-        # Basketball
-        "Basketballs": "Basketball",
-        "Hoops": "Basketball",
-        
-        # Baseball
-        "Baseballs": "Baseball",
-        
-        # Football
-        "Footballs": "Football",
-        "Pads": "Football",
-        
-        # Golf
-        "Golfs": "Golf",
-        "Clubs": "Golf",
-        "Club": "Golf",
-        
-        # Camping
-        "Tents": "Camping",
-        "Tent": "Camping",
-        "Gear": "Camping",
-        
-        # Fishing
-        "Fish": "Fishing",
-        "Rods": "Fishing",
-        "Rod": "Fishing",
-        "Lures": "Fishing",
-        "Lure": "Fishing",
-        
-        # Hunting
-        "Hunt": "Hunting",
-    }
-    
     # Check exact match or synonym
-    return synonyms.get(normalized_cat, normalized_cat)
+    return CATEGORY_SYNONYMS.get(normalized_cat, normalized_cat)
 
+def _fallback_category(products, category):
+    valid_category = validate_category(category)
+    return [dict(p) for p in products if p.get("category") == valid_category]
+
+@_catalog_read(_fallback_category)
+@coalesce(key=lambda category: validate_category(category))
 def get_products_by_category(category: str):
-    if not db:
-        print("Firestore not available.")
-        return []
-    
     # Normalize category (handle case sensitivity and synonyms)
     valid_category = validate_category(category)
     
     products_ref = db.collection("inventory")
     query = products_ref.where("category", "==", valid_category)
-    docs = query.stream()
+    docs = query.stream(**deadline.options())
     
-    return [doc.to_dict() for doc in docs]
+    return _with_stock([doc.to_dict() for doc in docs])
 
+def _fallback_search(products, search_query):
+    query_lower = search_query.lower().strip()
+    return [dict(p) for p in products if query_lower in p.get("title", "").lower()]
+
+@_catalog_read(_fallback_search)
+@coalesce(key=lambda search_query: search_query.lower().strip())
 def search_products(search_query: str):
-    if not db:
-        print("Firestore not available.")
-        return []
-    
     products_ref = db.collection("inventory")
     # Firestore doesn't support naive substring search. 
     # Since dataset is small (mock), fetch all and filter in Python.
-    docs = products_ref.stream()
+    docs = products_ref.stream(**deadline.options())
     
     results = []
     query_lower = search_query.lower().strip()
@@ -130,35 +379,43 @@ def search_products(search_query: str):
         if query_lower in title:
             results.append(data)
             
-    return results
+    return _with_stock(results)
 
-def get_top_products():
-    if not db:
-        print("Firestore not available.")
-        return []
-    
-    # Mocking "Top Products" by randomly selecting 8 items
+def _fallback_top(products, limit: int = 8):
+    return [dict(p) for p in random.sample(products, min(len(products), limit))]
+
+@_catalog_read(_fallback_top)
+def get_top_products(limit: int = 8):
+    # Mocking "Top Products" by randomly selecting `limit` items
     products_ref = db.collection("inventory")
     # For a small dataset, fetching all is fine. For larger, we'd need a better strategy.
-    docs = list(products_ref.stream())
+    docs = list(products_ref.stream(**deadline.options()))
     
     if not docs:
         return []
 
-    # Select 8 random products (or fewer if less than 8 exist)
-    count = min(len(docs), 8)
+    # Select `limit` random products (or fewer if less exist)
+    count = min(len(docs), limit)
     selected_docs = random.sample(docs, count)
     
-    return [doc.to_dict() for doc in selected_docs]
+    return _with_stock([doc.to_dict() for doc in selected_docs])
 
+@_catalog_read(lambda products: [dict(p) for p in products])
+@coalesce()
+def get_all_products():
+    """
+    Returns every inventory item with live stock, for building in-memory indexes.
+    """
+    products = _with_stock([doc.to_dict() for doc in db.collection("inventory").stream(**deadline.options())])
+    _remember_products(products)
+    return products
+
+@_catalog_read(lambda products: list({p["category"] for p in products if "category" in p}))
+@coalesce()
 def get_all_categories():
-    if not db:
-        print("Firestore not available.")
-        return []
-        
     products_ref = db.collection("inventory")
     # Get all docs but only the category field to be efficient
-    docs = products_ref.select(["category"]).stream()
+    docs = products_ref.select(["category"]).stream(**deadline.options())
     
     categories = set()
     for doc in docs:
@@ -168,11 +425,19 @@ def get_all_categories():
             
     return list(categories)
 
-def save_inventory_from_csv():
-    if not db:
-        print("Firestore not initialized. Skipping save.")
-        return False
-        
+# Callbacks run with the saved rows after the inventory is (re)loaded,
+# so in-memory indexes such as app/catalog.py can refresh.
+_inventory_listeners = []
+
+def on_inventory_change(callback):
+    _inventory_listeners.append(callback)
+    return callback
+
+def _read_inventory_csv():
+    """
+    Returns the rows of app/data/inventory.csv with numeric fields converted,
+    or None if the file can't be found.
+    """
     # Correct pathing logic for different execution contexts
     csv_path = os.path.join(os.path.dirname(__file__), "data/inventory.csv")
     if not os.path.exists(csv_path):
@@ -180,48 +445,269 @@ def save_inventory_from_csv():
         csv_path = "app/data/inventory.csv"
     
     if not os.path.exists(csv_path):
-        print(f"Error: Inventory file not found at {csv_path}")
+        log.error("Inventory file not found at %s", csv_path)
+        return None
+
+    with open(csv_path, mode='r') as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    for row in rows:
+        # Convert types
+        row["price"] = float(row["price"])
+        row["rating"] = float(row["rating"])
+    return rows
+
+# Catalog versions, for clients that mirror the catalog (see
+# get_catalog_changes). Each catalog write allocates the next version from
+# the counter document catalog_meta/version, in a transaction, so versions
+# are unique across instances. The write stamps its version on every
+# inventory document it touches (`catalog_version`) and on that document's
+# entry in catalog_changes, then releases it.
+#
+# Writes on different instances can finish out of order, so the counter also
+# keeps the versions still in flight (`pending`, version -> lease expiry).
+# `committed`, the highest version readers may see, stays below the oldest
+# of them: a sync never moves past a write that could still add entries.
+# A writer that dies without releasing its version holds syncs back until
+# the lease (CATALOG_WRITE_LEASE_SECONDS) runs out.
+#
+# The lock only keeps writers on one instance from contending for the counter.
+_catalog_write_lock = threading.Lock()
+
+def _catalog_version_ref():
+    return db.collection("catalog_meta").document("version")
+
+def _read_catalog_counter(transaction):
+    """
+    Returns (allocated, committed, pending) from the counter document, with
+    expired leases dropped from `pending`.
+    """
+    doc = _catalog_version_ref().get(transaction=transaction, **deadline.options(retry=False))
+    data = (doc.to_dict() if doc.exists else None) or {}
+    now = time.time()
+    pending = {v: expires for v, expires in (data.get("pending") or {}).items() if expires > now}
+    return data.get("allocated", 0), data.get("committed", 0), pending
+
+def _write_catalog_counter(transaction, allocated: int, committed: int, pending: dict):
+    # Everything up to just below the oldest write in flight is complete
+    ready = min(int(v) for v in pending) - 1 if pending else allocated
+    transaction.set(_catalog_version_ref(), {
+        "allocated": allocated,
+        "committed": max(committed, ready),
+        "pending": pending,
+    })
+
+@firestore.transactional
+def _allocate_catalog_version(transaction):
+    allocated, committed, pending = _read_catalog_counter(transaction)
+    version = allocated + 1
+    # Map keys are strings in Firestore
+    pending[str(version)] = time.time() + config.CATALOG_WRITE_LEASE_SECONDS
+    _write_catalog_counter(transaction, version, committed, pending)
+    return version
+
+@firestore.transactional
+def _release_catalog_version(transaction, version: int):
+    allocated, committed, pending = _read_catalog_counter(transaction)
+    pending.pop(str(version), None)
+    _write_catalog_counter(transaction, allocated, committed, pending)
+
+@contextlib.contextmanager
+def _catalog_write():
+    """
+    Yields the version for a catalog write and releases it afterwards. The
+    version is released even if the write fails part way: whatever it did
+    write is in the change log and should be synced.
+    """
+    with _catalog_write_lock:
+        version = _allocate_catalog_version(db.transaction())
+        try:
+            yield version
+        finally:
+            _release_catalog_version(db.transaction(), version)
+
+def _record_change(batch, item_id: str, version: int, deleted: bool = False):
+    batch.set(
+        db.collection("catalog_changes").document(item_id),
+        {"id": item_id, "catalog_version": version, "deleted": deleted},
+    )
+
+def catalog_version():
+    """
+    The latest committed catalog version (0 before the first load).
+    """
+    doc = _catalog_version_ref().get(**deadline.options())
+    return ((doc.to_dict() if doc.exists else None) or {}).get("committed", 0)
+
+# Firestore rejects batches of more than 500 writes
+MAX_BATCH_WRITES = 500
+
+def save_inventory_from_csv():
+    """
+    Loads app/data/inventory.csv under a new catalog version. Only items
+    whose fields or stock differ from the datastore are written; items no
+    longer in the file are deleted.
+    """
+    if not db:
+        log.warning("Firestore not initialized. Skipping save.")
         return False
 
-    batch = db.batch()
     count = 0
+    pending_writes = 0
+    saved_rows = []
     
     try:
-        with open(csv_path, mode='r') as csv_file:
-            reader = csv.DictReader(csv_file)
-            for row in reader:
+        rows = _read_inventory_csv()
+        if rows is None:
+            return False
+        with _catalog_write() as version:
+            existing = {doc.id: doc.to_dict() for doc in db.collection("inventory").stream(**deadline.options())}
+            _stock_cache.clear()
+            levels = get_stock_levels(list(existing.values()))
+            batch = db.batch()
+            for row in rows:
                 doc_ref = db.collection("inventory").document(row["id"])
-                # Convert types
-                row["price"] = float(row["price"])
-                row["rating"] = float(row["rating"])
+                row["stock_shards"] = config.STOCK_SHARD_OVERRIDES.get(row["id"], config.STOCK_SHARDS)
+                stock = initial_stock(row["inventory_status"])
+                old = existing.pop(row["id"], None)
+                old_version = old.pop("catalog_version", None) if old else None
+                if old == row and old_version and levels.get(row["id"]) == stock:
+                    saved_rows.append(dict(row, catalog_version=old_version))
+                    continue
+
+                stale_shards = _shard_refs(doc_ref, (old or {}).get("stock_shards") or 0)[row["stock_shards"]:]
+                # Item doc, change entry, shards and stale shards go in one batch
+                writes = 2 + row["stock_shards"] + len(stale_shards)
+                if pending_writes + writes > MAX_BATCH_WRITES:
+                    batch.commit(**deadline.options())
+                    batch = db.batch()
+                    pending_writes = 0
+
+                row["catalog_version"] = version
                 batch.set(doc_ref, row)
+                _write_stock_shards(batch, doc_ref, stock, row["stock_shards"])
+                for shard_ref in stale_shards:
+                    batch.delete(shard_ref)
+                _record_change(batch, row["id"], version)
+                saved_rows.append(row)
                 count += 1
-                
-                # Firestore batch limit is 500
-                if count % 400 == 0:
-                    batch.commit()
+                pending_writes += writes
+
+            # Whatever is left was dropped from the file
+            for item_id, old in existing.items():
+                doc_ref = db.collection("inventory").document(item_id)
+                shard_refs = _shard_refs(doc_ref, old.get("stock_shards") or 0)
+                writes = 2 + len(shard_refs)
+                if pending_writes + writes > MAX_BATCH_WRITES:
+                    batch.commit(**deadline.options())
                     batch = db.batch()
-                    
-        if count % 400 != 0:
-            batch.commit()
+                    pending_writes = 0
+
+                batch.delete(doc_ref)
+                for shard_ref in shard_refs:
+                    batch.delete(shard_ref)
+                _record_change(batch, item_id, version, deleted=True)
+                count += 1
+                pending_writes += writes
+
+            if pending_writes:
+                batch.commit(**deadline.options())
             
-        print(f"Saved {count} items to Firestore.")
+        _stock_cache.clear()
+        _remember_products(saved_rows)
+        for callback in _inventory_listeners:
+            callback(saved_rows)
+        log.info("Saved %d changed items to Firestore (catalog version %d).", count, version)
         return True
     except Exception as e:
-        print(f"Error saving inventory: {e}")
+        log.exception("Error saving inventory: %s", e)
         return False
 
+def _encode_changes_cursor(version: int, last_change: dict):
+    payload = {"version": version, "after_version": last_change["catalog_version"], "after_id": last_change["id"]}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def _decode_changes_cursor(cursor: str):
+    """
+    Returns (version, after_version, after_id) from a cursor token. Raises ValueError if malformed.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(payload["version"]), int(payload["after_version"]), str(payload["after_id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+@_guarded
+def get_catalog_changes(since: int, limit: int = None, cursor: str = None):
+    """
+    Returns (changes, version, next_cursor): the items added, changed or
+    deleted after catalog version `since`, oldest change first. `version` is
+    the committed version the page was read at; a client that has applied
+    every page can sync from it next time. Each change is {id, version,
+    deleted, item}, with item None for deletions.
+
+    Only catalog writes are versioned. Stock taken by checkouts isn't, so
+    stock_quantity and inventory_status changes from sales don't appear here.
+
+    Raises ValueError if `since` is ahead of the catalog or the cursor is malformed.
+    """
+    limit = limit or config.CHANGES_PAGE_SIZE
+    if cursor:
+        # Later pages stay pinned to the version the first page was read at
+        version, after_version, after_id = _decode_changes_cursor(cursor)
+    else:
+        version = catalog_version()
+    if since > version:
+        raise ValueError(f"Version {since} is ahead of the catalog (version {version})")
+
+    query = (
+        db.collection("catalog_changes")
+        .where("catalog_version", ">", since)
+        .where("catalog_version", "<=", version)
+        .order_by("catalog_version")
+        .order_by("__name__")
+    )
+    if cursor:
+        query = query.start_after({"catalog_version": after_version, "__name__": after_id})
+
+    # Fetch one extra entry to know whether there is another page
+    docs = list(query.limit(limit + 1).stream(**deadline.options()))
+    entries = [doc.to_dict() for doc in docs[:limit]]
+    refs = [db.collection("inventory").document(e["id"]) for e in entries if not e["deleted"]]
+    items = {}
+    if refs:
+        for doc in db.get_all(refs, **deadline.options()):
+            if doc.exists:
+                items[doc.id] = doc.to_dict()
+        _with_stock(list(items.values()))
+
+    changes = [
+        {
+            "id": e["id"],
+            "version": e["catalog_version"],
+            # An item deleted since this entry was written reads as a deletion
+            "deleted": e["id"] not in items,
+            "item": items.get(e["id"]),
+        }
+        for e in entries
+    ]
+    next_cursor = _encode_changes_cursor(version, entries[-1]) if len(docs) > limit else None
+    return changes, version, next_cursor
+
+@_guarded
 def add_item_to_cart(user_id: str, item_id: str, quantity: int):
-    if not db:
-        print("Firestore not available.")
-        return False
+    """
+    Adds to an item's quantity in the cart.
+    Returns the updated cart ({"items": {item_id: quantity}}), or None on failure.
+    """
+    if cart_buffer:
+        return {"items": cart_buffer.add(_cart_key(user_id), item_id, quantity)}
 
-    cart_ref = db.collection("carts").document(user_id)
+    cart_ref = tenancy.collection(db, "carts").document(user_id)
     
     # Check if item exists in inventory first? (Optional but good)
     # Skipping for performance/simplicity or assume valid input
     
-    cart_doc = cart_ref.get()
+    cart_doc = cart_ref.get(**deadline.options())
     current_data = cart_doc.to_dict() if cart_doc.exists else {"items": {}}
     
     items = current_data.get("items", {})
@@ -229,43 +715,55 @@ def add_item_to_cart(user_id: str, item_id: str, quantity: int):
     current_qty = items.get(item_id, 0)
     items[item_id] = current_qty + quantity
     
-    cart_ref.set({"items": items}, merge=True)
-    return True
+    cart_ref.set(_cart_document(items), merge=True, **deadline.options())
+    return {"items": items}
 
+@_guarded
 def remove_item_from_cart(user_id: str, item_id: str):
-    if not db:
-        return False
+    """
+    Removes an item from the cart.
+    Returns the updated cart, or None if the item wasn't in the cart.
+    """
+    if cart_buffer:
+        items = cart_buffer.remove(_cart_key(user_id), item_id)
+        return {"items": items} if items is not None else None
         
-    cart_ref = db.collection("carts").document(user_id)
-    cart_doc = cart_ref.get()
+    cart_ref = tenancy.collection(db, "carts").document(user_id)
+    cart_doc = cart_ref.get(**deadline.options())
     
     if not cart_doc.exists:
-        return False
+        return None
         
     current_data = cart_doc.to_dict()
     items = current_data.get("items", {})
     
     if item_id in items:
         del items[item_id]
-        cart_ref.set({"items": items}) # Overwrite items
-        return True
+        if items:
+            cart_ref.set(_cart_document(items), **deadline.options()) # Overwrite items
+        else:
+            cart_ref.delete(**deadline.options()) # Don't keep empty carts around
+        return {"items": items}
         
-    return False
+    return None
 
+@_guarded
 def clear_cart(user_id: str):
-    if not db:
-        return False
-        
-    cart_ref = db.collection("carts").document(user_id)
-    cart_ref.set({"items": {}})
+    cart_ref = tenancy.collection(db, "carts").document(user_id)
+    with cart_buffer.hold(_cart_key(user_id)) if cart_buffer else contextlib.nullcontext():
+        cart_ref.delete(**deadline.options())
     return True
 
+@_guarded
 def get_cart(user_id: str):
-    if not db:
-        return {"items": {}}
-    
-    cart_ref = db.collection("carts").document(user_id)
-    doc = cart_ref.get()
+    if cart_buffer:
+        return {"items": cart_buffer.get(_cart_key(user_id))}
+    return _read_cart(user_id)
+
+@_hedged
+def _read_cart(user_id: str):
+    cart_ref = tenancy.collection(db, "carts").document(user_id)
+    doc = cart_ref.get(**deadline.options())
     if doc.exists:
         data = doc.to_dict()
         return {"items": data.get("items", {})}
@@ -275,28 +773,27 @@ def get_cart_details(user_id: str):
     """
     Returns full cart with product details (title, price, image) joined in.
     """
-    if not db:
-        return {"user_id": user_id, "items": [], "total_price": 0.0}
-    
-    # 1. Get Cart
-    cart_ref = db.collection("carts").document(user_id)
-    doc = cart_ref.get()
-    if not doc.exists:
-        return {"user_id": user_id, "items": [], "total_price": 0.0}
-    
-    data = doc.to_dict()
-    items_map = data.get("items", {}) # { "SKU-123": 2 }
-    
+    # Get Cart (from the write-behind buffer when enabled)
+    return enrich_cart(user_id, get_cart(user_id)["items"])
+
+@_guarded
+def enrich_cart(user_id: str, items_map: dict):
+    """
+    Joins product details into a cart's { "SKU-123": 2 } items map,
+    reading all of its products in one get_all round trip.
+    """
     if not items_map:
         return {"user_id": user_id, "items": [], "total_price": 0.0}
         
     enriched_items = []
     total = 0.0
     
+    product_refs = [db.collection("inventory").document(item_id) for item_id in items_map]
+    products = {doc.id: doc.to_dict() for doc in db.get_all(product_refs, **deadline.options()) if doc.exists}
+    
     for item_id, qty in items_map.items():
-        p_doc = db.collection("inventory").document(item_id).get()
-        if p_doc.exists:
-            p_data = p_doc.to_dict()
+        p_data = products.get(item_id)
+        if p_data:
             price = float(p_data.get("price", 0.0))
             
             enrich = {
@@ -314,77 +811,309 @@ def get_cart_details(user_id: str):
         "items": enriched_items,
         "total_price": round(total, 2)
     }
-    
-def get_cart_details(user_id: str):
+
+# (tenant, username) -> whether an account exists
+_known_users = LRUCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+
+@_guarded
+def get_user(username):
     """
-    Returns full cart with product details (title, price, image) joined in.
+    Returns a user's account document, or None if there is no such account.
+    """
+    doc = tenancy.collection(db, "users").document(username).get(**deadline.options())
+    exists = doc.exists
+    _known_users.set((tenancy.current(), username), exists)
+    return doc.to_dict() if exists else None
+
+def user_exists(username):
+    """
+    Whether `username` has an account, cached for USER_CACHE_TTL seconds.
+    Without a datastore there are no accounts.
     """
     if not db:
-        return {"user_id": user_id, "items": [], "total_price": 0.0}
-    
-    # 1. Get Cart
-    cart_ref = db.collection("carts").document(user_id)
-    doc = cart_ref.get()
-    if not doc.exists:
-        return {"user_id": user_id, "items": [], "total_price": 0.0}
-    
-    data = doc.to_dict()
-    items_map = data.get("items", {}) # { "SKU-123": 2 }
-    
-    if not items_map:
-        return {"user_id": user_id, "items": [], "total_price": 0.0}
-        
-    # 2. Get All Products in one go (or loop if small list)
-    # Ideally use IN query, but Firestore limits IN to 10-30 items.
-    # For a cart, user usually has few items, so loop is okay for mock.
-    
-    enriched_items = []
-    total = 0.0
-    
-    for item_id, qty in items_map.items():
-        # Optimization: Could cache products or use getAll
-        p_doc = db.collection("inventory").document(item_id).get()
-        if p_doc.exists:
-            p_data = p_doc.to_dict()
-            price = float(p_data.get("price", 0.0))
-            if "total_price" not in p_data:
-                # Helper calculation fix
-                pass
-            
-            enrich = {
-                "item_id": item_id,
-                "quantity": qty,
-                "title": p_data.get("title", "Unknown"),
-                "price": price,
-                "image_url": p_data.get("image_url", "")
-            }
-            enriched_items.append(enrich)
-            total += price * qty
-            
-    return {
+        return False
+    exists = _known_users.get((tenancy.current(), username))
+    if exists is None:
+        exists = get_user(username) is not None
+    return exists
+
+@_guarded
+def create_user(username, password_hash):
+    """
+    Creates an account with an auth.hash_password() hash. Returns False if the username is taken.
+    """
+    user_ref = tenancy.collection(db, "users").document(username)
+    try:
+        user_ref.create({
+            "username": username,
+            "password_hash": password_hash,
+            "created_at": firestore.SERVER_TIMESTAMP,
+        }, **deadline.options(retry=False))
+    except gcp_exceptions.Conflict:
+        return False # Already exists
+    _known_users.set((tenancy.current(), username), True)
+    return True
+
+@_guarded
+def set_password_hash(username, password_hash):
+    """
+    Stores a new password hash for a user, dropping any plain-text password
+    left from accounts created before hashing was added.
+    """
+    tenancy.collection(db, "users").document(username).update(
+        {"password_hash": password_hash, "password": firestore.DELETE_FIELD}, **deadline.options())
+
+# Recently read or written orders, keyed by (tenant, order_id)
+_order_cache = LRUCache(maxsize=config.ORDER_CACHE_SIZE, ttl=config.ORDER_CACHE_TTL)
+
+def _encode_order_cursor(order):
+    payload = {"created_at": order["created_at"].isoformat(), "order_id": order["order_id"]}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def _decode_order_cursor(cursor: str):
+    """
+    Returns (created_at, order_id) from a cursor token. Raises ValueError if malformed.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(payload["created_at"]), payload["order_id"]
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+@_guarded
+def place_order(user_id: str):
+    """
+    Checks out the user's cart in one Firestore transaction: reads the cart and
+    its SKUs, validates and decrements stock, writes the order and deletes the cart.
+    The transaction is retried on contention, so stock is never oversold.
+
+    Returns the new order.
+    Raises CartEmptyError, OutOfStockError or CheckoutContentionError.
+    """
+    transaction = db.transaction(max_attempts=config.CHECKOUT_MAX_ATTEMPTS)
+    # Buffered cart writes must reach Firestore before the transaction reads the cart
+    with cart_buffer.hold(_cart_key(user_id)) if cart_buffer else contextlib.nullcontext():
+        try:
+            order = _checkout_in_transaction(transaction, user_id)
+        except ValueError as e:
+            # Raised by firestore.transactional once every attempt was aborted
+            raise CheckoutContentionError(str(e)) from e
+
+    _order_cache.set((tenancy.current(), order["order_id"]), order)
+    for item_id in order["items"]:
+        _stock_cache.pop(item_id)
+    return order
+
+@firestore.transactional
+def _checkout_in_transaction(transaction, user_id: str):
+    cart_ref = tenancy.collection(db, "carts").document(user_id)
+    cart_doc = cart_ref.get(transaction=transaction, **deadline.options(retry=False))
+    items = cart_doc.to_dict().get("items", {}) if cart_doc.exists else {}
+    items = {item_id: qty for item_id, qty in items.items() if qty > 0}
+    if not items:
+        raise CartEmptyError(user_id)
+
+    # Read every SKU in the cart in a single round trip
+    item_refs = [db.collection("inventory").document(item_id) for item_id in items]
+    products = {doc.id: doc for doc in db.get_all(item_refs, transaction=transaction, **deadline.options(retry=False))}
+
+    unavailable = []
+    tracked = {}  # item_id -> list of shard refs
+    for item_ref in item_refs:
+        doc = products.get(item_ref.id)
+        if doc is None or not doc.exists:
+            unavailable.append(item_ref.id)
+            continue
+        shards = doc.to_dict().get("stock_shards")
+        # Items loaded before stock tracking have no shards and aren't limited
+        if shards:
+            tracked[item_ref.id] = _shard_refs(item_ref, shards)
+
+    # Probe one random shard per SKU, so concurrent checkouts of the same SKU
+    # mostly read and write different documents.
+    probes = {item_id: random.choice(refs) for item_id, refs in tracked.items()}
+    counts = _read_shard_counts(list(probes.values()), transaction)
+    # Only SKUs whose probed shard can't cover the quantity read their other shards
+    short = [item_id for item_id, ref in probes.items() if counts[ref.path] < items[item_id]]
+    if short:
+        others = [ref for item_id in short for ref in tracked[item_id] if ref.path not in counts]
+        counts.update(_read_shard_counts(others, transaction))
+
+    decrements = []
+    for item_id, refs in tracked.items():
+        needed = items[item_id]
+        candidates = [probes[item_id]] + [ref for ref in refs if ref.path != probes[item_id].path and ref.path in counts]
+        for ref in candidates:
+            take = min(needed, counts[ref.path])
+            if take > 0:
+                decrements.append((ref, counts[ref.path] - take))
+                needed -= take
+            if needed == 0:
+                break
+        if needed > 0:
+            unavailable.append(item_id)
+    if unavailable:
+        raise OutOfStockError(unavailable)
+
+    created_at = datetime.now(timezone.utc)
+    order = {
+        "order_id": str(uuid.uuid4()),
         "user_id": user_id,
-        "items": enriched_items,
-        "total_price": round(total, 2)
+        "items": items,
+        "status": "PROCESSING",
+        "created_at": created_at,
+        "estimated_delivery": (created_at + timedelta(days=config.DELIVERY_DAYS)).date().isoformat(),
     }
 
-def create_user(username, password):
-    if not db:
+    for shard_ref, remaining in decrements:
+        transaction.set(shard_ref, {"count": remaining})
+    transaction.set(tenancy.collection(db, "orders").document(order["order_id"]), order)
+    # The cart is empty now; delete it rather than keep an empty document
+    transaction.delete(cart_ref)
+    return order
+
+def get_order(order_id: str):
+    """
+    Returns a copy of an order by ID, served from the LRU cache when possible.
+    """
+    order = _order_cache.get((tenancy.current(), order_id))
+    if order is None:
+        order = _fetch_order(order_id)
+    return copy.deepcopy(order)
+
+@_guarded
+def _fetch_order(order_id: str):
+    doc = tenancy.collection(db, "orders").document(order_id).get(**deadline.options())
+    if not doc.exists:
+        return None
+    order = doc.to_dict()
+    _order_cache.set((tenancy.current(), order_id), order)
+    return order
+
+@_guarded
+def get_user_orders(user_id: str, limit: int = None, cursor: str = None):
+    """
+    Returns (orders, next_cursor) for a user's order history, newest first.
+    Backed by the (user_id ASC, created_at DESC) composite index on `orders`.
+    """
+    limit = limit or config.ORDER_HISTORY_PAGE_SIZE
+    query = (
+        tenancy.collection(db, "orders")
+        .where("user_id", "==", user_id)
+        .order_by("created_at", direction=firestore.Query.DESCENDING)
+        .order_by("__name__", direction=firestore.Query.DESCENDING)
+    )
+    if cursor:
+        created_at, order_id = _decode_order_cursor(cursor)
+        query = query.start_after({"created_at": created_at, "__name__": order_id})
+
+    # Fetch one extra document to know whether there is another page
+    docs = list(query.limit(limit + 1).stream(**deadline.options()))
+    orders = [doc.to_dict() for doc in docs[:limit]]
+    next_cursor = _encode_order_cursor(orders[-1]) if len(docs) > limit else None
+    return orders, next_cursor
+
+@_guarded
+def update_order_status(order_id: str, status: str):
+    try:
+        tenancy.collection(db, "orders").document(order_id).update({"status": status}, **deadline.options())
+    except gcp_exceptions.NotFound:
         return False
-    # Simple store, plain text password for mock
-    user_ref = db.collection("users").document(username)
-    if user_ref.get().exists:
-        return False # Already exists
-    
-    user_ref.set({"username": username, "password": password})
+    _order_cache.pop((tenancy.current(), order_id))
     return True
 
-def verify_user(username, password):
-    if not db:
-        return True # Mock success if DB down? No, fail secure.
-    user_ref = db.collection("users").document(username)
-    doc = user_ref.get()
-    if doc.exists:
-        data = doc.to_dict()
-        return data.get("password") == password 
-    return False
+# Stock levels live in sharded counters (inventory/{item_id}/stock_shards/{n}),
+# so writes for a popular SKU are spread over several documents instead of
+# serializing on one. The inventory doc records its shard count in `stock_shards`.
+_stock_cache = LRUCache(maxsize=config.STOCK_CACHE_SIZE, ttl=config.STOCK_CACHE_TTL)
+
+def _split_stock(quantity: int, shards: int):
+    base, extra = divmod(quantity, shards)
+    return [base + (1 if i < extra else 0) for i in range(shards)]
+
+def _shard_refs(item_ref, shards: int):
+    shards_ref = item_ref.collection("stock_shards")
+    return [shards_ref.document(str(i)) for i in range(shards)]
+
+def _write_stock_shards(batch, item_ref, quantity: int, shards: int):
+    for shard_ref, count in zip(_shard_refs(item_ref, shards), _split_stock(quantity, shards)):
+        batch.set(shard_ref, {"count": count})
 
+def _read_shard_counts(shard_refs, transaction=None):
+    """
+    Returns {shard_path: count} for the given shard refs in one round trip.
+    """
+    if not shard_refs:
+        return {}
+    counts = {ref.path: 0 for ref in shard_refs}
+    # Reads in a transaction are retried by the transaction, not per call
+    for doc in db.get_all(shard_refs, transaction=transaction, **deadline.options(retry=transaction is None)):
+        if doc.exists:
+            counts[doc.reference.path] = doc.to_dict().get("count", 0)
+    return counts
+
+def get_stock_levels(products):
+    """
+    Returns {item_id: quantity} for the stock-tracked inventory dicts given.
+    Levels come from the cache, or are summed from their shards in one get_all.
+    """
+    levels = {}
+    uncached = {}
+    for product in products:
+        if not product.get("stock_shards"):
+            continue
+        quantity = _stock_cache.get(product["id"])
+        if quantity is None:
+            uncached[product["id"]] = product["stock_shards"]
+        else:
+            levels[product["id"]] = quantity
+
+    if uncached and db:
+        shard_owner = {}
+        for item_id, shards in uncached.items():
+            for ref in _shard_refs(db.collection("inventory").document(item_id), shards):
+                shard_owner[ref.path] = (item_id, ref)
+        totals = dict.fromkeys(uncached, 0)
+        counts = _read_shard_counts([ref for _, ref in shard_owner.values()])
+        for path, count in counts.items():
+            totals[shard_owner[path][0]] += count
+        for item_id, quantity in totals.items():
+            _stock_cache.set(item_id, quantity)
+            levels[item_id] = quantity
+    return levels
+
+def _with_stock(products):
+    """
+    Sets stock_quantity and the derived inventory_status on stock-tracked products.
+    """
+    levels = get_stock_levels(products)
+    for product in products:
+        if product.get("id") in levels:
+            product["stock_quantity"] = levels[product["id"]]
+            product["inventory_status"] = stock_status(product["stock_quantity"])
+    return products
+
+@_guarded
+def set_stock_level(item_id: str, quantity: int, shards: int = None):
+    """
+    Resets an item's stock to `quantity`, spread evenly over `shards` counters
+    (by default the item's current shard count). Returns False if the item doesn't exist.
+    """
+    item_ref = db.collection("inventory").document(item_id)
+    doc = item_ref.get(**deadline.options())
+    if not doc.exists:
+        return False
+
+    old_shards = doc.to_dict().get("stock_shards") or 0
+    shards = shards or old_shards or config.STOCK_SHARDS
+    with _catalog_write() as version:
+        batch = db.batch()
+        _write_stock_shards(batch, item_ref, quantity, shards)
+        for shard_ref in _shard_refs(item_ref, old_shards)[shards:]:
+            batch.delete(shard_ref)
+        batch.update(item_ref, {"stock_shards": shards, "catalog_version": version})
+        _record_change(batch, item_id, version)
+        batch.commit(**deadline.options())
+
+    _stock_cache.set(item_id, quantity)
+    return True
@@ -0,0 +1,145 @@
+"""
+Per-request deadlines, propagated to datastore calls.
+
+Each request gets a time budget from its route class (see
+ratelimit.route_class) or a DEADLINE_ROUTE_OVERRIDES prefix, shortened if
+the caller asks for less with an `X-Request-Timeout` header (seconds, at
+least DEADLINE_MIN_SECONDS) or the request is a sub-request of a batch with
+less time left. The deadline lives
+in a context variable, so it follows the request into worker threads.
+
+Datastore calls take their `timeout` and `retry` from options(): the RPC
+times out when the budget does, and idempotent calls retry transient errors
+with backoff only while budget remains. A datastore timeout that comes from
+the request's own budget running out is the caller's outcome, not the
+datastore's, and doesn't count against the circuit breaker (see
+database._guarded). Outside a request (background threads) calls get
+DATASTORE_TIMEOUT_SECONDS.
+"""
+import contextlib
+import contextvars
+import time
+
+from google.api_core import exceptions as gcp_exceptions
+from google.api_core import retry as retries
+
+from app import config
+from app.ratelimit import route_class
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """
+    The request's budget ran out before a datastore call could start.
+    """
+
+
+def _parse_overrides(spec: str):
+    overrides = []
+    for part in spec.split(","):
+        prefix, _, seconds = part.partition("=")
+        try:
+            overrides.append((prefix.strip(), float(seconds)))
+        except ValueError:
+            continue
+    # Longest prefix first, so the most specific override wins
+    return sorted((o for o in overrides if o[0]), key=lambda o: -len(o[0]))
+
+
+_overrides = _parse_overrides(config.DEADLINE_ROUTE_OVERRIDES)
+
+
+def budget(method: str, path: str):
+    """
+    Seconds a request to `path` may take.
+    """
+    for prefix, seconds in _overrides:
+        if path.startswith(prefix):
+            return seconds
+    return {
+        "read": config.DEADLINE_READ_SECONDS,
+        "write": config.DEADLINE_WRITE_SECONDS,
+        "admin": config.DEADLINE_ADMIN_SECONDS,
+    }[route_class(method, path)]
+
+
+def remaining():
+    """
+    Seconds left before the current request's deadline, or None outside a request.
+    """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def ran_out(error: BaseException):
+    """
+    Whether `error` is a timeout caused by the current request's own budget
+    running out, rather than by the datastore.
+    """
+    if isinstance(error, DeadlineExceeded):
+        return True
+    left = remaining()
+    return (left is not None and left <= 0
+            and isinstance(error, (gcp_exceptions.DeadlineExceeded, gcp_exceptions.RetryError)))
+
+
+@contextlib.contextmanager
+def within(seconds: float):
+    """
+    Runs the block with a deadline `seconds` from now (or the current one, if sooner).
+    """
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def options(retry: bool = True):
+    """
+    Keyword arguments (`timeout`, `retry`) for a Firestore call under the
+    current deadline. Pass retry=False for calls that aren't safe to repeat.
+    Raises DeadlineExceeded if no time is left.
+    """
+    left = remaining()
+    if left is None:
+        left = config.DATASTORE_TIMEOUT_SECONDS
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    if not retry:
+        return {"timeout": left, "retry": None}
+    policy = retries.Retry(
+        predicate=retries.if_transient_error,
+        initial=config.DATASTORE_RETRY_INITIAL_SECONDS,
+        maximum=max(config.DATASTORE_RETRY_INITIAL_SECONDS, left / 4),
+        multiplier=2.0,
+        timeout=left,
+    )
+    return {"timeout": left, "retry": policy}
+
+
+class DeadlineMiddleware:
+    """
+    Sets the deadline for each /api request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api"):
+            await self.app(scope, receive, send)
+            return
+
+        seconds = budget(scope["method"], scope["path"])
+        requested = dict(scope["headers"]).get(b"x-request-timeout")
+        if requested:
+            try:
+                seconds = min(seconds, max(config.DEADLINE_MIN_SECONDS, float(requested)))
+            except ValueError:
+                pass
+        with within(seconds):
+            await self.app(scope, receive, send)
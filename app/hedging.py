@@ -0,0 +1,92 @@
+"""
+Hedged reads for idempotent datastore lookups.
+
+A hedged call starts the lookup on a worker thread. If it hasn't finished
+after the recent p95 latency of that lookup (HEDGE_PERCENTILE), a second
+identical lookup starts, and whichever finishes first wins; the other is
+left to finish and discarded. Only about one call in twenty sends a second
+request, but one slow replica or RPC no longer sets the tail latency.
+
+Lookups must be safe to run twice. Until a lookup has MIN_SAMPLES recorded
+latencies, it isn't hedged.
+"""
+import contextvars
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from app import deadline
+
+
+class Hedger:
+    def __init__(self, workers: int = 64, percentile: float = 95, min_delay: float = 0.002,
+                 min_samples: int = 50, window: int = 500):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedge")
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+        # name -> {"calls": n, "hedged": n, "hedge_wins": n}
+        self._stats = defaultdict(lambda: {"calls": 0, "hedged": 0, "hedge_wins": 0})
+
+    def delay(self, name: str):
+        """
+        Seconds to wait before hedging `name`, or None if there's too little history.
+        """
+        with self._lock:
+            samples = sorted(self._latencies[name])
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return max(self.min_delay, samples[index])
+
+    def _timed(self, name, fn, args, kwargs):
+        start = time.monotonic()
+        result = fn(*args, **kwargs)
+        with self._lock:
+            self._latencies[name].append(time.monotonic() - start)
+        return result
+
+    def _submit(self, name, fn, args, kwargs):
+        # Each attempt runs in its own copy of the caller's context (tenant, deadline)
+        context = contextvars.copy_context()
+        return self._pool.submit(context.run, self._timed, name, fn, args, kwargs)
+
+    def call(self, name: str, fn, *args, **kwargs):
+        """
+        Returns fn(*args, **kwargs), hedging it with a second call if the first is slow.
+        """
+        stats = self._stats[name]
+        stats["calls"] += 1
+        delay = self.delay(name)
+        primary = self._submit(name, fn, args, kwargs)
+        if delay is None:
+            return primary.result()
+
+        left = deadline.remaining()
+        done, _ = wait([primary], timeout=delay if left is None else max(0.0, min(delay, left)))
+        if done or (left is not None and left <= delay):
+            # Finished, or no budget for a second attempt
+            return primary.result()
+
+        stats["hedged"] += 1
+        pending = {primary, self._submit(name, fn, args, kwargs)}
+        error = None
+        while pending:
+            left = deadline.remaining()
+            done, pending = wait(pending, timeout=None if left is None else max(0.0, left), return_when=FIRST_COMPLETED)
+            if not done:
+                # Out of time; surface the deadline like an unhedged call would
+                raise deadline.DeadlineExceeded("Request deadline exceeded")
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        stats["hedge_wins"] += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self):
+        return {name: dict(counts) for name, counts in self._stats.items()}
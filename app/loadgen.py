@@ -0,0 +1,332 @@
+"""
+Load generator that replays scripted shopper/agent sessions.
+
+Each virtual user repeatedly picks a session script (weighted), runs its
+steps in order with a random think time between them, and records the
+latency and outcome of every request per step. A shared pacer caps the total
+request rate. With no --url the API runs in-process on the in-memory
+datastore (inventory loaded from the CSV), so no server or Firestore is
+needed:
+
+    python -m app.loadgen --users 2000 --rate 400 --duration 60
+    python -m app.loadgen --url http://localhost:8080 --scripts sessions.json
+
+A scripts file maps script names to {"weight": w, "steps": [...]}, using the
+step names in STEPS. The report has per-step request counts, error rates,
+percentiles and a latency histogram; --json also writes it as JSON.
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+
+# Latency histogram bucket upper bounds, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+DEFAULT_SCRIPTS = {
+    "browse": {"weight": 5, "steps": ["categories", "category", "category", "product"]},
+    "search": {"weight": 3, "steps": ["search", "product", "add_to_cart", "view_cart"]},
+    "purchase": {
+        "weight": 2,
+        "steps": ["categories", "category", "add_to_cart", "add_to_cart", "view_cart", "checkout", "order_status"],
+    },
+}
+
+
+class Catalog:
+    """
+    Categories, product ids and title words to pick request parameters from.
+    """
+
+    def __init__(self, categories, products):
+        self.categories = categories
+        self.product_ids = [p["id"] for p in products]
+        words = {w for p in products for w in re.findall(r"[a-z]{4,}", p.get("title", "").lower())}
+        self.words = sorted(words) or ["ball"]
+
+
+class VirtualUser:
+    def __init__(self, index: int, tenant: str = None):
+        self.user_id = f"loadgen-{index}"
+        # A client address of its own, as a proxy would report it, so each
+        # virtual user gets its own rate-limit bucket
+        self.headers = {"X-Forwarded-For": f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"}
+        if tenant:
+            self.headers["X-Tenant-ID"] = tenant
+        self.cart_items = 0
+        self.order_id = None
+
+
+# Step name -> fn(user, catalog, rng) returning (method, path, body, expected statuses),
+# or None to skip the step (e.g. checkout with an empty cart)
+def _categories(user, catalog, rng):
+    return "GET", "/api/products/categories", None, {200}
+
+
+def _category(user, catalog, rng):
+    return "GET", f"/api/products/category/{rng.choice(catalog.categories)}", None, {200}
+
+
+def _search(user, catalog, rng):
+    return "GET", f"/api/products/search?q={rng.choice(catalog.words)}", None, {200}
+
+
+def _product(user, catalog, rng):
+    return "GET", f"/api/products/{rng.choice(catalog.product_ids)}", None, {200}
+
+
+def _add_to_cart(user, catalog, rng):
+    body = {"user_id": user.user_id, "item_id": rng.choice(catalog.product_ids), "quantity": 1}
+    return "POST", "/api/cart/add", body, {200}
+
+
+def _view_cart(user, catalog, rng):
+    return "GET", f"/api/cart/{user.user_id}", None, {200}
+
+
+def _checkout(user, catalog, rng):
+    if not user.cart_items:
+        return None
+    # 409: out of stock, a normal outcome once popular items sell out
+    return "POST", "/api/cart/checkout", {"user_id": user.user_id}, {200, 409}
+
+
+def _order_status(user, catalog, rng):
+    if not user.order_id:
+        return None
+    return "GET", f"/api/orders/{user.order_id}", None, {200}
+
+
+STEPS = {
+    "categories": _categories,
+    "category": _category,
+    "search": _search,
+    "product": _product,
+    "add_to_cart": _add_to_cart,
+    "view_cart": _view_cart,
+    "checkout": _checkout,
+    "order_status": _order_status,
+}
+
+
+def _after(step, user, status, response):
+    """
+    Updates the user's session state from a response.
+    """
+    if step == "add_to_cart" and status == 200:
+        user.cart_items += 1
+    elif step == "checkout":
+        user.cart_items = 0
+        if status == 200:
+            user.order_id = response.json()["order_id"]
+
+
+class StepStats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def record(self, seconds: float, status, ok: bool):
+        ms = seconds * 1000
+        self.latencies.append(ms)
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.statuses[str(status)] += 1
+        if not ok:
+            self.errors += 1
+
+    def percentile(self, pct: float):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+    def summary(self):
+        count = len(self.latencies)
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "error_rate": self.errors / count if count else 0.0,
+            "statuses": dict(self.statuses),
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": max(self.latencies, default=0.0),
+            "histogram": {
+                (f"<={bound}ms" if i < len(BUCKETS_MS) else f">{BUCKETS_MS[-1]}ms"): n
+                for i, (bound, n) in enumerate(zip(BUCKETS_MS + (None,), self.buckets))
+            },
+        }
+
+
+class Pacer:
+    """
+    Spaces request starts to at most `rate` per second across all users (0: unlimited).
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        # No catching up: slots missed while every user was busy are dropped
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def _pick_script(scripts, rng):
+    names = list(scripts)
+    return rng.choices(names, weights=[scripts[n]["weight"] for n in names])[0]
+
+
+async def _run_user(client, user, scripts, catalog, stats, pacer, args, deadline, seed):
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        for step in scripts[_pick_script(scripts, rng)]["steps"]:
+            if time.monotonic() >= deadline:
+                return
+            request = STEPS[step](user, catalog, rng)
+            if request is None:
+                continue
+            method, path, body, expected = request
+            await pacer.wait()
+            if time.monotonic() >= deadline:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body, headers=user.headers)
+                status = response.status_code
+            except Exception as e:
+                status, response = type(e).__name__, None
+            stats[step].record(time.perf_counter() - start, status, status in expected)
+            if response is not None:
+                _after(step, user, status, response)
+            if args.think_time:
+                pause = rng.expovariate(1.0 / args.think_time)
+                await asyncio.sleep(min(pause, max(0.0, deadline - time.monotonic())))
+
+
+async def _load_catalog(client):
+    categories = (await client.get("/api/products/categories")).json()
+    products = (await client.get("/api/products/filter?limit=200&sort=rating_desc")).json()["items"]
+    if not categories or not products:
+        raise SystemExit("The catalog is empty; load it with /api/save_inventory first.")
+    return Catalog(categories, products)
+
+
+def _client(args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    if args.url:
+        return httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits)
+
+    # In-process: the app on the in-memory datastore, seeded from the inventory CSV
+    os.environ.setdefault("DATASTORE", "memory")
+    from app import database
+    from app.main import app
+
+    if not database.save_inventory_from_csv():
+        raise SystemExit("Could not load the inventory into the in-memory datastore.")
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://loadgen", timeout=args.timeout)
+
+
+async def run(args, scripts):
+    stats = {step: StepStats() for step in STEPS}
+    async with _client(args) as client:
+        catalog = await _load_catalog(client)
+        pacer = Pacer(args.rate)
+        started = time.monotonic()
+        deadline = started + args.ramp_up + args.duration
+
+        async def delayed(i):
+            # Spread user start times over the ramp-up period
+            await asyncio.sleep(args.ramp_up * i / args.users)
+            tenant = f"loadgen-{i % args.tenants}" if args.tenants else None
+            await _run_user(client, VirtualUser(i, tenant), scripts, catalog, stats, pacer, args, deadline, args.seed + i)
+
+        await asyncio.gather(*[delayed(i) for i in range(args.users)])
+        elapsed = time.monotonic() - started
+
+    steps = {step: s.summary() for step, s in stats.items() if s.latencies}
+    total = sum(s["requests"] for s in steps.values())
+    return {
+        "users": args.users,
+        "duration_s": elapsed,
+        "requests": total,
+        "requests_per_s": total / elapsed if elapsed else 0.0,
+        "errors": sum(s["errors"] for s in steps.values()),
+        "steps": steps,
+    }
+
+
+def print_report(report, out=sys.stdout):
+    print(
+        f"{report['users']} users, {report['requests']} requests in {report['duration_s']:.1f}s "
+        f"({report['requests_per_s']:.1f} req/s), {report['errors']} errors",
+        file=out,
+    )
+    print(f"\n{'step':<14}{'requests':>9}{'errors':>8}{'err %':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}", file=out)
+    for step, s in report["steps"].items():
+        print(
+            f"{step:<14}{s['requests']:>9}{s['errors']:>8}{s['error_rate'] * 100:>8.2f}"
+            f"{s['p50_ms']:>9.1f}{s['p90_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}",
+            file=out,
+        )
+    for step, s in report["steps"].items():
+        print(f"\n{step}  statuses: {s['statuses']}", file=out)
+        peak = max(s["histogram"].values()) or 1
+        for label, n in s["histogram"].items():
+            if n:
+                print(f"  {label:>9} {n:>8} {'#' * max(1, round(40 * n / peak))}", file=out)
+
+
+def load_scripts(path: str = None):
+    if not path:
+        return DEFAULT_SCRIPTS
+    with open(path) as f:
+        scripts = json.load(f)
+    for name, script in scripts.items():
+        unknown = [s for s in script.get("steps", []) if s not in STEPS]
+        if unknown or not script.get("steps") or script.get("weight", 0) <= 0:
+            raise SystemExit(f"Script {name!r} needs a positive weight and steps from: {', '.join(STEPS)}")
+    return scripts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.loadgen", description="Replay scripted sessions against the API.")
+    parser.add_argument("--url", help="Base URL of a running instance (default: run the app in-process)")
+    parser.add_argument("--users", type=int, default=100, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run after ramp-up")
+    parser.add_argument("--ramp-up", type=float, default=5, help="Seconds over which users start")
+    parser.add_argument("--rate", type=float, default=0, help="Target requests/second across all users (0: unlimited)")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean pause between steps, seconds")
+    parser.add_argument("--scripts", help="JSON file of session scripts")
+    parser.add_argument("--tenants", type=int, default=0, help="Spread users over this many tenants")
+    parser.add_argument("--connections", type=int, default=100, help="HTTP connection pool size")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args, load_scripts(args.scripts)))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Structured JSON logging that stays off the request path.
+
+Loggers hand records to a QueueHandler, which only stamps the request ID
+and tenant (context variables, so they're read on the calling thread) and
+enqueues the record. A QueueListener thread formats each record as one
+JSON line and writes it to stdout, where Cloud Run picks up `severity`,
+`message` and the other fields. Formatting and I/O never run on the request
+thread.
+
+Repeated messages are sampled: each (logger, message template) may log
+LOG_SAMPLE_BURST records per LOG_SAMPLE_INTERVAL_SECONDS; later ones are
+dropped and counted, and the next record let through reports the count in
+`suppressed`. Use %-style arguments (`log.warning("x %s", y)`) so that
+messages differing only in their arguments share a template.
+
+Levels: LOG_LEVEL for everything, LOG_LEVELS for per-module overrides, e.g.
+`LOG_LEVELS=app.database=DEBUG,app.cartsweeper=WARNING`.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "tenant"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if getattr(record, "tenant", None):
+            entry["tenant"] = record.tenant
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class Sampler(logging.Filter):
+    """
+    Lets through at most `burst` records per message template every `interval` seconds.
+    """
+
+    def __init__(self, burst: int, interval: float):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}  # (logger, template) -> [window start, passed, dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.interval <= 0:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            if len(self._windows) > 10000:
+                # Templates built with f-strings never repeat; don't let them pile up
+                self._windows.clear()
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                dropped = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.burst:
+                window[1] += 1
+                dropped, window[2] = window[2], 0
+            else:
+                window[2] += 1
+                return False
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records unformatted; only the request context is captured here.
+    """
+
+    def __init__(self, queue, tenant=None):
+        super().__init__(queue)
+        self._tenant = tenant or (lambda: None)
+
+    def prepare(self, record):
+        record.request_id = request_id.get()
+        record.tenant = self._tenant()
+        return record
+
+
+def _parse_levels(spec: str):
+    levels = {}
+    for part in spec.split(","):
+        name, _, level = part.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure():
+    """
+    Routes all logging through the queue and starts the writer thread. Safe to call twice.
+    """
+    # Imported here: config calls configure() while it is being imported
+    from app import config
+    from app import tenancy
+
+    global _listener
+    if _listener is not None:
+        return
+
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(shutdown)
+
+    # tenancy may still be importing (it imports config), so look it up per call
+    handler = ContextQueueHandler(records, tenant=lambda: tenancy.current())
+    handler.addFilter(Sampler(config.LOG_SAMPLE_BURST, config.LOG_SAMPLE_INTERVAL_SECONDS))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(config.LOG_LEVEL.upper())
+    for name, level in _parse_levels(config.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+
+def shutdown():
+    """
+    Writes out queued records and stops the writer thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestIdMiddleware:
+    """
+    Gives each request an ID (the caller's X-Request-ID, the parent request's
+    for in-process sub-requests, or a new one), makes it available to log
+    records and echoes it in the response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        value = dict(scope["headers"]).get(b"x-request-id", b"").decode()[:64]
+        rid = value or request_id.get() or uuid.uuid4().hex
+        header = (b"x-request-id", rid.encode())
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", [])) + [header])
+            await send(message)
+
+        token = request_id.set(rid)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
@@ -1,26 +1,67 @@
-import os
-import random
-import uuid
-from typing import List
-from fastapi import FastAPI, HTTPException, Request, APIRouter
+import hmac
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request, APIRouter, Header
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html, get_swagger_ui_oauth2_redirect_html
+from fastapi.responses import JSONResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from google.api_core import exceptions as gcp_exceptions
 from app.models import (
-    InventoryItem, CartItem, User, LoginRequest, 
-    CartAddRequest, CartRemoveRequest, CheckoutRequest, OrderStatusResponse, 
-    ReturnOrderRequest, ReturnOrderResponse, CartModel
+    InventoryItem, User, LoginRequest, 
+    CartAddRequest, CartRemoveRequest, CheckoutRequest, OrderStatusResponse, OrderHistoryResponse,
+    ReturnOrderRequest, ReturnOrderResponse, CartModel, StoreLocation, NearbyStore,
+    StockUpdateRequest, StockLevelResponse, CartMutationResponse, ProductFilterResponse, Suggestion,
+    BatchRequest, BatchResponse, ProductLookupRequest, ProductLookupResponse, ProductQueryResponse,
+    CatalogChangesResponse
 )
 from app import database
+from app import catalog
+from app import suggest
+from app import nlquery
+from app import semantic
+from app import related
+from app import stores
 from app import config
+from app import singleflight
+from app import apispec
+from app import batch
+from app import auth
+from app import tenancy
+from app import breaker
+from app import deadline
+from app.ratelimit import RateLimitMiddleware
+from app.tenancy import TenantMiddleware
+from app.logs import RequestIdMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serialize and compress the OpenAPI documents once, before serving
+    apispec.build(app)
+    if config.CART_SWEEP_ENABLED:
+        database.cart_sweeper.start()
+    yield
+    database.cart_sweeper.stop()
+    # Don't lose buffered cart writes on shutdown
+    database.flush_carts()
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Cymbal Sports Mock API",
     description="Mock API for Cymbal Sports store for CX Agent Studio training.",
     version="1.0.0",
-    servers=[{"url": config.SERVICE_URL, "description": "Cloud Run Service URL"}]
+    servers=[{"url": config.SERVICE_URL, "description": "Cloud Run Service URL"}],
+    # Served below from the prebuilt documents in app/apispec.py
+    openapi_url=None,
+    docs_url=None,
+    redoc_url=None,
 )
 
+# Added before CORS so that 429 responses still carry CORS headers
+if config.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -29,6 +70,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Time budget for each request, passed down to datastore calls (see app/deadline.py)
+app.add_middleware(deadline.DeadlineMiddleware)
+
+# Flags responses served from fallback catalog data (see app/breaker.py)
+app.add_middleware(breaker.StaleHeaderMiddleware)
+
+# Runs before the other middleware, so they see the tenant and the unprefixed path
+app.add_middleware(TenantMiddleware)
+# Request IDs for log records (see app/logs.py)
+app.add_middleware(RequestIdMiddleware)
+
+@app.exception_handler(breaker.DatastoreUnavailable)
+async def datastore_unavailable(request: Request, exc: breaker.DatastoreUnavailable):
+    # Writes fail fast while the datastore circuit is open; tell clients when to retry
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The datastore is temporarily unavailable, please retry shortly"},
+        headers={"Retry-After": str(int(exc.retry_after + 0.999))},
+    )
+
+@app.exception_handler(deadline.DeadlineExceeded)
+@app.exception_handler(gcp_exceptions.DeadlineExceeded)
+@app.exception_handler(gcp_exceptions.RetryError)
+async def deadline_exceeded(request: Request, exc: Exception):
+    # The request's budget ran out waiting on the datastore
+    return JSONResponse(status_code=504, content={"detail": "The request took too long, please retry"})
+
 # Mount static directory for the frontend
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
@@ -36,6 +104,43 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 async def root():
     return FileResponse('app/static/index.html')
 
+@app.get("/openapi.json", include_in_schema=False)
+async def openapi_document(request: Request, profile: str = apispec.FULL):
+    """
+    The OpenAPI document, prebuilt and precompressed. `?profile=agent` leaves
+    out the admin and UI routes, for importing the API as agent tools.
+    """
+    try:
+        document = apispec.get_document(app, profile)
+    except KeyError:
+        raise HTTPException(status_code=400, detail="profile must be 'full' or 'agent'")
+
+    encoding, body, etag = document.negotiate(request.headers.get("accept-encoding", ""))
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in (t.strip().removeprefix("W/") for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.get("/docs", include_in_schema=False)
+async def swagger_ui():
+    return get_swagger_ui_html(
+        openapi_url="/openapi.json",
+        title=f"{app.title} - Swagger UI",
+        oauth2_redirect_url="/docs/oauth2-redirect",
+    )
+
+@app.get("/docs/oauth2-redirect", include_in_schema=False)
+async def swagger_ui_redirect():
+    return get_swagger_ui_oauth2_redirect_html()
+
+@app.get("/redoc", include_in_schema=False)
+async def redoc():
+    return get_redoc_html(openapi_url="/openapi.json", title=f"{app.title} - ReDoc")
+
 # Create a router for the API endpoints
 api_router = APIRouter()
 
@@ -43,8 +148,22 @@ api_router = APIRouter()
 async def api_root():
     return {"message": "Welcome to the Cymbal Sports Mock API"}
 
+@api_router.post("/batch", tags=["General"], response_model=BatchResponse)
+async def run_batch(request: Request, batch_request: BatchRequest):
+    """
+    Run several API calls in one round trip, e.g. product details for a few
+    SKUs plus the cart. Each sub-request has a method, an /api/ path (with
+    any query string) and an optional JSON body. Consecutive GETs run
+    concurrently; other requests run one at a time, in order. Returns one
+    status and body per sub-request, in the same order.
+    """
+    if len(batch_request.requests) > config.BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"A batch can have at most {config.BATCH_MAX_REQUESTS} requests")
+    responses = await batch.run_batch(request.app, request.scope, batch_request.requests)
+    return {"responses": responses}
+
 @api_router.get("/save_inventory", tags=["Admin"], summary="Initialize Inventory")
-async def save_inventory():
+def save_inventory():
     """
     Load the inventory from the CSV file into Firestore. 
     This is a one-time management function.
@@ -55,33 +174,109 @@ async def save_inventory():
     else:
         raise HTTPException(status_code=500, detail="Failed to save inventory")
 
+@api_router.post("/inventory/{item_id}/stock", tags=["Admin"], response_model=StockLevelResponse)
+def set_stock_level(item_id: str, request: StockUpdateRequest):
+    """
+    Set an item's stock level, optionally changing how many counter shards it uses.
+    Use more shards for items expecting many concurrent checkouts.
+    """
+    if request.quantity < 0:
+        raise HTTPException(status_code=400, detail="Quantity must not be negative")
+    if request.shards is not None and not 1 <= request.shards <= config.MAX_STOCK_SHARDS:
+        raise HTTPException(status_code=400, detail=f"Shards must be between 1 and {config.MAX_STOCK_SHARDS}")
+    if not database.set_stock_level(item_id, request.quantity, request.shards):
+        raise HTTPException(status_code=404, detail="Item not found")
+    return {
+        "item_id": item_id,
+        "stock_quantity": request.quantity,
+        "inventory_status": database.stock_status(request.quantity)
+    }
+
+@api_router.post("/carts/sweep", tags=["Admin"])
+def sweep_carts():
+    """
+    Delete expired carts now instead of waiting for the background sweeper.
+    """
+    return {"deleted": database.cart_sweeper.sweep()}
+
+@api_router.get("/metrics", tags=["Admin"])
+async def get_metrics():
+    """
+    Internal counters, e.g. how many datastore reads were coalesced.
+    """
+    metrics = {
+        "singleflight": singleflight.group.stats(),
+        "cart_sweeper": dict(database.cart_sweeper.stats),
+        "datastore_breaker": database.datastore_breaker.snapshot(),
+    }
+    if config.HEDGE_ENABLED:
+        metrics["hedging"] = database.hedger.stats()
+    if database.cart_buffer:
+        metrics["cart_buffer"] = dict(database.cart_buffer.stats)
+    return metrics
+
+# Catalog reads below are plain `def` endpoints: FastAPI runs them in its
+# threadpool, so they don't block the event loop and identical concurrent
+# requests coalesce into one datastore read (see app/singleflight.py).
+def _lookup_products(ids: List[str]):
+    ids = [i.strip() for i in ids if i.strip()]
+    if not ids:
+        raise HTTPException(status_code=400, detail="No product ids given")
+    if len(ids) > config.BULK_LOOKUP_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {config.BULK_LOOKUP_MAX_IDS} ids per lookup")
+    items, missing = database.get_inventory_items(ids)
+    return {"items": items, "missing": missing}
+
+@api_router.get("/products", tags=["Products"], response_model=ProductLookupResponse)
+def get_products(ids: str):
+    """
+    Get details for several products at once, e.g. `?ids=SKU-10000,SKU-10001`.
+    Items come back in the order requested; unknown ids are listed in `missing`.
+    """
+    return _lookup_products(ids.split(","))
+
+@api_router.post("/products/lookup", tags=["Products"], response_model=ProductLookupResponse)
+def lookup_products(request: ProductLookupRequest):
+    """
+    Same as `GET /products?ids=...`, for lists too long for a URL.
+    """
+    return _lookup_products(request.ids)
+
 @api_router.get("/products/categories", tags=["Products"], response_model=List[str])
-async def get_categories():
+def get_categories():
     """
     Get all unique object categories from the inventory.
     """
     return database.get_all_categories()
 
 @api_router.get("/products/top", tags=["Products"], response_model=List[InventoryItem])
-async def get_top_products():
+def get_top_products(limit: int = 8):
     """
-    Get 8 random products representing top sellers from the store.
+    Get random products (8 unless `limit` says otherwise) representing top sellers from the store.
     """
-    products = database.get_top_products()
+    products = database.get_top_products(limit=max(1, min(limit, config.FILTER_MAX_LIMIT)))
     return products
 
 
 @api_router.get("/products/search", tags=["Products"], response_model=List[InventoryItem])
-async def search_products(q: str):
+def search_products(q: str, mode: str = "title", limit: int = 10):
     """
-    Search for products by name.
+    Search for products. `mode=title` (default) matches product names;
+    `mode=semantic` ranks products by similarity of a natural-language query
+    to their title, description and category (e.g. "something warm for
+    winter camping") and returns the best `limit` matches.
     """
+    if mode not in ("title", "semantic"):
+        raise HTTPException(status_code=400, detail="mode must be 'title' or 'semantic'")
     if not q:
         return []
+    if mode == "semantic":
+        limit = max(1, min(limit, config.FILTER_MAX_LIMIT))
+        return [product for product, _ in semantic.get_index().search(q, k=limit)]
     return database.search_products(q)
 
 @api_router.get("/products/category/{category}", tags=["Products"], response_model=List[InventoryItem])
-async def get_products_by_category(category: str):
+def get_products_by_category(category: str):
     """
     Get all products in a specific category.
     """
@@ -92,8 +287,109 @@ async def get_products_by_category(category: str):
         return []
     return products
 
+@api_router.get("/products/suggest", tags=["Products"], response_model=List[Suggestion])
+def suggest_products(prefix: str, limit: int = 10):
+    """
+    Type-ahead suggestions for a partially typed query: matching categories
+    (including synonyms such as "sneakers"), then products whose title has a
+    word starting with the prefix, best rated first.
+    """
+    return suggest.get_index().suggest(prefix, limit=max(1, limit))
+
+@api_router.get("/products/query", tags=["Products"], response_model=ProductQueryResponse)
+def query_products(text: str, sort: Optional[str] = None, limit: int = 20, offset: int = 0):
+    """
+    Answer a shopper's request in plain words, e.g. "basketball shoes under
+    $100 in stock" or "top rated golf polos 4+ stars", in one call. The
+    category, price bounds, minimum rating, stock requirement, sort order and
+    remaining keywords are extracted from `text`; the response shows how it
+    was understood (`query`) and which words were `ignored`.
+    Answered from the in-memory catalog, without datastore reads.
+    """
+    if sort is not None and sort not in catalog.SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(catalog.SORTS)}")
+    parsed = nlquery.parse(text)
+    total, items, ignored = nlquery.execute(
+        parsed,
+        catalog.get_catalog(),
+        offset=max(0, offset),
+        limit=max(1, min(limit, config.FILTER_MAX_LIMIT)),
+        sort=sort,
+    )
+    return {"query": parsed, "total": total, "items": items, "ignored": ignored}
+
+@api_router.get("/products/changes", tags=["Products"], response_model=CatalogChangesResponse)
+def get_product_changes(since: int = 0, limit: int = config.CHANGES_PAGE_SIZE, cursor: Optional[str] = None):
+    """
+    Catalog delta sync: the items added, changed or deleted after catalog
+    version `since` (0 for everything), oldest change first. Pass
+    `next_cursor` for the next page; once the last page is applied, sync
+    from the returned `version` next time. An item changed several times
+    appears once, at its latest version.
+    Inventory reloads and stock resets are reported; stock sold through
+    checkout is not, so read `stock_quantity` and `inventory_status` live.
+    """
+    limit = max(1, min(limit, config.CHANGES_MAX_PAGE_SIZE))
+    try:
+        changes, version, next_cursor = database.get_catalog_changes(max(0, since), limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"since": since, "version": version, "changes": changes, "next_cursor": next_cursor}
+
+def _split(values: Optional[str]):
+    if not values:
+        return None
+    return [v.strip() for v in values.split(",") if v.strip()]
+
+@api_router.get("/products/filter", tags=["Products"], response_model=ProductFilterResponse)
+def filter_products(
+    q: Optional[str] = None,
+    categories: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_rating: Optional[float] = None,
+    status: Optional[str] = None,
+    sort: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+    facets: bool = False,
+):
+    """
+    Search, filter and sort the catalog. `q` matches product titles;
+    `categories` and `status` take comma-separated values (e.g.
+    `categories=Running,Tennis&status=IN_STOCK,LOW_STOCK`); `sort` is one of
+    price_asc, price_desc, rating_desc, rating_asc or title_asc.
+    With `facets=true` the response also counts all matches per category,
+    inventory_status, price bucket and rating band, to help refine the query.
+    Answered from the in-memory catalog, without datastore reads.
+    """
+    if sort is not None and sort not in catalog.SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(catalog.SORTS)}")
+    category_list = _split(categories)
+    if category_list is not None:
+        category_list = [database.validate_category(c) for c in category_list]
+    status_list = _split(status)
+    if status_list is not None:
+        status_list = [s.upper() for s in status_list]
+    filters = dict(
+        q=q or None,
+        categories=category_list,
+        min_price=min_price,
+        max_price=max_price,
+        min_rating=min_rating,
+        statuses=status_list,
+    )
+
+    snapshot = catalog.get_catalog()
+    rows = snapshot.select(**filters)
+    return {
+        "total": len(rows),
+        "items": snapshot.page(rows, sort, offset=max(0, offset), limit=max(1, min(limit, config.FILTER_MAX_LIMIT))),
+        "facets": snapshot.facets(rows, **filters) if facets else None,
+    }
+
 @api_router.get("/products/{item_id}", tags=["Products"], response_model=InventoryItem)
-async def get_product_details(item_id: str):
+def get_product_details(item_id: str):
     """
     Get details for a specific product by its ID (SKU).
     """
@@ -102,63 +398,109 @@ async def get_product_details(item_id: str):
         return item
     raise HTTPException(status_code=404, detail="Item not found")
 
+@api_router.get("/products/{item_id}/related", tags=["Products"], response_model=List[InventoryItem])
+def get_related_products(item_id: str, limit: int = 5):
+    """
+    Products that go with this one: same category, similar description and
+    price range, best match first (e.g. a sleeping bag and lantern for a tent).
+    """
+    products = related.get_related_products(item_id, limit=max(1, min(limit, config.RELATED_K)))
+    if products is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return products
+
 @api_router.get("/orders/{order_id}", tags=["Orders"], response_model=OrderStatusResponse)
-async def get_order_status(order_id: str):
-    """
-    Get the status of an order. 
-    Mocks the response for any order ID.
-    """
-    # Mock logic: Deterministic based on order_id hash or just random
-    # To be consistent for demos, let's hash it slightly
-    statuses = ["SHIPPED", "DELIVERED", "PROCESSING", "CANCELLED"]
-    # unique status based on order_id characters
-    idx = sum(ord(c) for c in order_id) % len(statuses)
-    status = statuses[idx]
-    
+def get_order_status(order_id: str, authorization: Optional[str] = Header(None)):
+    """
+    Get the status of an order.
+    """
+    order = database.get_order(order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    _authorize(authorization, order.get("user_id"))
+
     return {
         "order_id": order_id,
-        "status": status,
-        "estimated_delivery": "2023-12-01" # Mock date
+        "status": order["status"],
+        "estimated_delivery": order["estimated_delivery"]
     }
 
 @api_router.post("/orders/{order_id}/return", tags=["Orders"], response_model=ReturnOrderResponse)
-async def return_order(order_id: str, request: ReturnOrderRequest):
+def return_order(order_id: str, request: ReturnOrderRequest, authorization: Optional[str] = Header(None)):
     """
     Process a return for an order.
     """
-    # Mock logic
+    order = database.get_order(order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    _authorize(authorization, order.get("user_id"))
+    if not database.update_order_status(order_id, "RETURN_INITIATED"):
+        raise HTTPException(status_code=404, detail="Order not found")
+
     return {
         "order_id": order_id,
         "status": "RETURN_INITIATED",
         "message": f"Return initiated for order {order_id}. Reason: {request.reason}"
     }
 
-@api_router.post("/cart/add", tags=["Cart"])
-async def add_item_to_cart(request: CartAddRequest):
+def _authorize(authorization: Optional[str], user_id: str):
+    """
+    Checks the session token, if any, against the user the call acts for.
+    Tokens are verified from memory; no user lookup is needed.
+    Without a token the call is allowed for guests (users with no account)
+    unless AUTH_REQUIRED is set; a registered user always needs their token.
+    """
+    if not authorization:
+        if config.AUTH_REQUIRED or (user_id and database.user_exists(user_id)):
+            raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+        return
+    scheme, _, token = authorization.partition(" ")
+    try:
+        if scheme.lower() != "bearer":
+            raise auth.InvalidToken("Unsupported scheme")
+        username = auth.verify_token(token.strip(), tenant=tenancy.current())
+    except auth.InvalidToken:
+        raise HTTPException(status_code=401, detail="Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+    if username != user_id:
+        raise HTTPException(status_code=403, detail="Token does not belong to this user")
+
+def _cart_mutation_response(message: str, user_id: str, cart: dict, detail: bool):
+    response = {"message": message, "cart": cart}
+    if detail:
+        response["cart_details"] = database.enrich_cart(user_id, cart["items"])
+    return response
+
+@api_router.post("/cart/add", tags=["Cart"], response_model=CartMutationResponse, response_model_exclude_none=True)
+def add_item_to_cart(request: CartAddRequest, detail: bool = False, authorization: Optional[str] = Header(None)):
     """
     Add an item to a user's cart.
+    Returns the updated cart. With `detail=true`, `cart_details` also has product details and the total.
     """
-    success = database.add_item_to_cart(request.user_id, request.item_id, request.quantity)
-    if success:
-        return {"message": "Item added to cart", "cart": database.get_cart(request.user_id)}
+    _authorize(authorization, request.user_id)
+    cart = database.add_item_to_cart(request.user_id, request.item_id, request.quantity)
+    if cart:
+        return _cart_mutation_response("Item added to cart", request.user_id, cart, detail)
     raise HTTPException(status_code=400, detail="Failed to add item (Item might not exist)")
 
-@api_router.post("/cart/remove", tags=["Cart"])
-async def remove_item_from_cart(request: CartRemoveRequest):
+@api_router.post("/cart/remove", tags=["Cart"], response_model=CartMutationResponse, response_model_exclude_none=True)
+def remove_item_from_cart(request: CartRemoveRequest, detail: bool = False, authorization: Optional[str] = Header(None)):
     """
     Remove an item from a user's cart.
+    Returns the updated cart. With `detail=true`, `cart_details` also has product details and the total.
     """
-    success = database.remove_item_from_cart(request.user_id, request.item_id)
-    if success:
-        return {"message": "Item removed from cart", "cart": database.get_cart(request.user_id)}
+    _authorize(authorization, request.user_id)
+    cart = database.remove_item_from_cart(request.user_id, request.item_id)
+    if cart:
+        return _cart_mutation_response("Item removed from cart", request.user_id, cart, detail)
     raise HTTPException(status_code=400, detail="Failed to remove item (Item might not be in cart)")
 
 @api_router.get("/cart/{user_id}", tags=["Cart"], response_model=CartModel)
-async def get_cart(user_id: str):
+def get_cart(user_id: str, authorization: Optional[str] = Header(None)):
     """
     Get the current user's cart with full product details (title, price, image).
     Useful for displaying the cart to the user in a rich response.
     """
+    _authorize(authorization, user_id)
     cart_data = database.get_cart_details(user_id)
     # Map dictionary to Pydantic model
     return CartModel(
@@ -168,37 +510,126 @@ async def get_cart(user_id: str):
     )
 
 @api_router.post("/cart/checkout", tags=["Cart"])
-async def checkout(request: CheckoutRequest):
+def checkout(request: CheckoutRequest, authorization: Optional[str] = Header(None)):
     """
     Checkout the current user's cart.
-    Generates a random order ID and clears the cart.
+    Reserves stock, creates an order from the cart and clears the cart.
     """
-    cart = database.get_cart(request.user_id)
-    if not cart or not cart.get('items'):
-       raise HTTPException(status_code=400, detail="Cart is empty")
+    _authorize(authorization, request.user_id)
+    try:
+        order = database.place_order(request.user_id)
+    except database.CartEmptyError:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    except database.OutOfStockError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except database.CheckoutContentionError:
+        raise HTTPException(status_code=503, detail="Checkout is busy, please retry", headers={"Retry-After": "1"})
 
-    order_id = str(uuid.uuid4())
-    success = database.clear_cart(request.user_id)
-    
-    if success:
-        return {"message": "Checkout successful", "order_id": order_id}
-    raise HTTPException(status_code=500, detail="Failed to clear cart")
+    if not order:
+        raise HTTPException(status_code=500, detail="Failed to checkout")
+
+    return {"message": "Checkout successful", "order_id": order["order_id"]}
+
+@api_router.get("/stores", tags=["Stores"], response_model=List[StoreLocation])
+async def find_stores(city: Optional[str] = None, state: Optional[str] = None, zip: Optional[str] = None):
+    """
+    Find stores by city, state code and/or ZIP code prefix.
+    Returns all stores if no filter is given.
+    """
+    return stores.get_directory().find(city=city, state=state, zip_prefix=zip)
+
+@api_router.get("/stores/nearest", tags=["Stores"], response_model=List[NearbyStore])
+async def find_nearest_stores(
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    city: Optional[str] = None,
+    limit: int = 5,
+):
+    """
+    Find the stores closest to a point (lat/lon) or to a city, nearest first.
+    """
+    if lat is None or lon is None:
+        if not city:
+            raise HTTPException(status_code=400, detail="Provide lat and lon, or city")
+        coords = stores.geocode_city(city)
+        if not coords:
+            raise HTTPException(status_code=404, detail="Unknown city")
+        lat, lon = coords
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(status_code=400, detail="Invalid coordinates")
+    return stores.get_directory().nearest(lat, lon, limit=max(1, min(limit, 50)))
+
+@api_router.get("/stores/{store_id}", tags=["Stores"], response_model=StoreLocation)
+async def get_store(store_id: str):
+    """
+    Get a single store by its ID.
+    """
+    store = stores.get_directory().get(store_id)
+    if store:
+        return store
+    raise HTTPException(status_code=404, detail="Store not found")
 
 @api_router.post("/users", tags=["Users"])
 async def create_account(user: User):
     """
     Create a new user account.
     """
-    # Mock behavior: Always detailed success without DB
+    password_hash = await auth.run_hashing(auth.hash_password, user.password)
+    if not await run_in_threadpool(database.create_user, user.username, password_hash):
+        raise HTTPException(status_code=400, detail="User already exists")
     return {"message": "User created successfully", "username": user.username}
 
+@api_router.get("/users/{user_id}/orders", tags=["Orders"], response_model=OrderHistoryResponse)
+def get_order_history(
+    user_id: str,
+    limit: int = config.ORDER_HISTORY_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Get a user's orders, newest first.
+    Pass the returned `next_cursor` to fetch the next page.
+    """
+    _authorize(authorization, user_id)
+    limit = max(1, min(limit, config.ORDER_HISTORY_MAX_PAGE_SIZE))
+    try:
+        orders, next_cursor = database.get_user_orders(user_id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"user_id": user_id, "orders": orders, "next_cursor": next_cursor}
+
+async def _check_login(username: str, password: str):
+    """
+    Checks a username and password. The account is read in the threadpool and
+    only the hashing runs on the hashing pool. Accounts created before hashing
+    was added store the password in plain text; they're upgraded to a hash on
+    their next login.
+    """
+    user = await run_in_threadpool(database.get_user, username) or {}
+    legacy = user.get("password")
+    if "password_hash" in user or legacy is None:
+        return await auth.run_hashing(auth.check_password, password, user.get("password_hash"))
+    if not hmac.compare_digest(str(legacy).encode(), password.encode()):
+        # Take as long as a wrong password for a hashed account
+        return await auth.run_hashing(auth.check_password, password, None)
+    password_hash = await auth.run_hashing(auth.hash_password, password)
+    await run_in_threadpool(database.set_password_hash, username, password_hash)
+    return True
+
 @api_router.post("/login", tags=["Users"])
 async def login(request: LoginRequest):
     """
     Log in a user.
+    Returns a session token; send it as `Authorization: Bearer <token>` on cart and order calls.
     """
-    # Mock behavior: Always allow login
-    return {"message": "Login successful", "token": "mock-token-123"}
+    if not await _check_login(request.username, request.password):
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+    return {
+        "message": "Login successful",
+        "token": auth.issue_token(request.username, tenant=tenancy.current()),
+        "token_type": "bearer",
+        "expires_in": config.AUTH_TOKEN_TTL_SECONDS,
+    }
 
 # Include the router with the /api prefix
 app.include_router(api_router, prefix="/api")
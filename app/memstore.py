@@ -0,0 +1,491 @@
+"""
+In-memory stand-in for the Firestore client.
+
+Implements the subset of the google-cloud-firestore API this app uses
+(documents, subcollections, simple and collection-group queries, batches,
+get_all and transactions) so the service and its tests can run without a
+Firestore backend. Select it with DATASTORE=memory.
+
+Transactions are optimistic: reads record the document version and commit
+raises Aborted if any of them changed, so they can be driven by the real
+`firestore.transactional` decorator, which retries on Aborted.
+
+A snapshot's `update_time` is the document's version, so it can be passed
+to `write_option(last_update_time=...)` as a precondition on updates and
+deletes; a write whose document has changed since raises FailedPrecondition.
+"""
+import copy
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from google.api_core import exceptions as gcp_exceptions
+from google.cloud.firestore_v1 import transforms
+
+DOCUMENT_ID = "__name__"
+# Firestore's limit on writes per batch or transaction
+MAX_WRITES = 500
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+def _get_field(data, field_path):
+    for part in field_path.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+def _apply_value(target, key, value):
+    if value is transforms.DELETE_FIELD:
+        target.pop(key, None)
+    elif value is transforms.SERVER_TIMESTAMP:
+        target[key] = _now()
+    elif isinstance(value, transforms.Increment):
+        target[key] = (target.get(key) or 0) + value.value
+    else:
+        target[key] = copy.deepcopy(value)
+
+
+def _merge(target, data):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            _apply_value(target, key, value)
+
+
+def _update(target, data):
+    # update() treats dotted keys as nested field paths
+    for key, value in data.items():
+        parts = key.split(".")
+        node = target
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        _apply_value(node, parts[-1], value)
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data, version=0):
+        self.reference = reference
+        self._data = data
+        self._version = version
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    @property
+    def update_time(self):
+        return self._version if self._data is not None else None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        node = self._data
+        for part in field_path.split("."):
+            if not isinstance(node, dict) or part not in node:
+                raise KeyError(field_path)
+            node = node[part]
+        return copy.deepcopy(node)
+
+
+class DocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+
+    @property
+    def id(self):
+        return self.path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def collection(self, name):
+        return CollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None, retry=None, timeout=None):
+        return self._client._read([self], transaction)[0]
+
+    def set(self, document_data, merge=False, retry=None, timeout=None):
+        self._client._commit([("set", self, document_data, merge)])
+
+    def create(self, document_data, retry=None, timeout=None):
+        self._client._commit([("create", self, document_data, False)])
+
+    def update(self, field_updates, option=None, retry=None, timeout=None):
+        self._client._commit([("update", self, field_updates, False)], preconditions=_preconditions(self, option))
+
+    def delete(self, option=None, retry=None, timeout=None):
+        self._client._commit([("delete", self, None, False)], preconditions=_preconditions(self, option))
+
+
+class LastUpdateOption:
+    """
+    Write precondition: the document was last written at `last_update_time`.
+    """
+
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+
+def _preconditions(reference, option):
+    return {reference.path: option.last_update_time} if option is not None else {}
+
+
+class Query:
+    def __init__(self, collection, filters=(), orders=(), limit=None, cursor=None, projection=None):
+        self._collection = collection
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit
+        self._cursor = cursor
+        self._projection = projection
+
+    def _copy(self, **changes):
+        fields = dict(
+            filters=self._filters,
+            orders=self._orders,
+            limit=self._limit,
+            cursor=self._cursor,
+            projection=self._projection,
+        )
+        fields.update(changes)
+        return Query(self._collection, **fields)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + [(field_path, direction == "DESCENDING")])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    def start_after(self, document_fields):
+        return self._copy(cursor=document_fields)
+
+    def _sort_key(self, snapshot):
+        key = []
+        for field_path, _ in self._orders:
+            value = snapshot.id if field_path == DOCUMENT_ID else _get_field(snapshot._data, field_path)
+            key.append(value)
+        return key
+
+    def _cursor_values(self):
+        cursor = self._cursor
+        if isinstance(cursor, DocumentSnapshot):
+            return self._sort_key(cursor)
+        values = []
+        for field_path, _ in self._orders:
+            value = cursor.get(field_path) if field_path in cursor else _get_field(cursor, field_path)
+            if isinstance(value, DocumentReference):
+                value = value.id
+            values.append(value)
+        return values
+
+    def _after_cursor(self, key, cursor_key):
+        for (_, descending), value, bound in zip(self._orders, key, cursor_key):
+            if value == bound:
+                continue
+            return value < bound if descending else value > bound
+        return False
+
+    def stream(self, transaction=None, retry=None, timeout=None):
+        snapshots = self._collection._snapshots(transaction)
+        snapshots = [
+            s for s in snapshots
+            if all(
+                _OPERATORS[op](s.id if field == DOCUMENT_ID else _get_field(s._data, field), value)
+                for field, op, value in self._filters
+            )
+        ]
+        # Stable multi-key sort, applied from the last key to the first
+        for index in reversed(range(len(self._orders))):
+            descending = self._orders[index][1]
+            snapshots.sort(key=lambda s: self._sort_key(s)[index], reverse=descending)
+        if self._cursor is not None:
+            cursor_key = self._cursor_values()
+            snapshots = [s for s in snapshots if self._after_cursor(self._sort_key(s), cursor_key)]
+        if self._limit is not None:
+            snapshots = snapshots[:self._limit]
+        for snapshot in snapshots:
+            if self._projection is not None:
+                data = {k: v for k, v in snapshot._data.items() if k in self._projection}
+                snapshot = DocumentSnapshot(snapshot.reference, data, snapshot._version)
+            yield snapshot
+
+    def get(self, transaction=None, retry=None, timeout=None):
+        return list(self.stream(transaction=transaction))
+
+
+class CollectionReference(Query):
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        super().__init__(self)
+
+    @property
+    def id(self):
+        return self.path.rsplit("/", 1)[-1]
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, f"{self.path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, document_data, document_id=None, retry=None, timeout=None):
+        ref = self.document(document_id)
+        ref.create(document_data)
+        return _now(), ref
+
+    def list_documents(self, page_size=None, retry=None, timeout=None):
+        return [s.reference for s in self._client._scan(self.path, None)]
+
+    def _snapshots(self, transaction):
+        return self._client._scan(self.path, transaction)
+
+
+class CollectionGroup(Query):
+    """
+    Every collection with the given ID, at any depth.
+    """
+
+    def __init__(self, client, collection_id):
+        self._client = client
+        self.collection_id = collection_id
+        super().__init__(self)
+
+    def _snapshots(self, transaction):
+        return self._client._scan_group(self.collection_id, transaction)
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+        self._preconditions = {}
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(("set", reference, document_data, merge))
+
+    def create(self, reference, document_data):
+        self._writes.append(("create", reference, document_data, False))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(("update", reference, field_updates, False))
+        self._preconditions.update(_preconditions(reference, option))
+
+    def delete(self, reference, option=None):
+        self._writes.append(("delete", reference, None, False))
+        self._preconditions.update(_preconditions(reference, option))
+
+    def commit(self, retry=None, timeout=None):
+        writes, self._writes = self._writes, []
+        preconditions, self._preconditions = self._preconditions, {}
+        self._client._commit(writes, preconditions=preconditions)
+        return [None] * len(writes)
+
+    def __len__(self):
+        return len(self._writes)
+
+
+class Transaction(WriteBatch):
+    """
+    Optimistic transaction compatible with `firestore.transactional`.
+    """
+
+    def __init__(self, client, max_attempts=5, read_only=False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+        self._read_versions = {}
+
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def in_progress(self):
+        return self._id is not None
+
+    def _clean_up(self):
+        self._writes = []
+        self._preconditions = {}
+        self._read_versions = {}
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = uuid.uuid4().bytes
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        writes, reads = self._writes, self._read_versions
+        try:
+            self._client._commit(writes, expected_versions=reads, preconditions=self._preconditions)
+        finally:
+            self._clean_up()
+        return [None] * len(writes)
+
+    def get_all(self, references, field_paths=None, retry=None, timeout=None):
+        return self._client.get_all(references, transaction=self)
+
+    def get(self, ref_or_query, retry=None, timeout=None):
+        if isinstance(ref_or_query, DocumentReference):
+            return iter(self._client._read([ref_or_query], self))
+        return ref_or_query.stream(transaction=self)
+
+
+class Client:
+    """
+    Thread-safe in-memory document store.
+
+    `latency` (seconds) is slept before each read and write round trip to
+    mimic network RPCs, which also lets concurrent callers interleave.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._docs = {}  # path -> (data, version)
+        self._lock = threading.Lock()
+        self._clock = 0
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def document(self, path):
+        return DocumentReference(self, path)
+
+    def collection_group(self, collection_id):
+        return CollectionGroup(self, collection_id)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def write_option(self, last_update_time=None):
+        return LastUpdateOption(last_update_time)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return Transaction(self, max_attempts=max_attempts, read_only=read_only)
+
+    def get_all(self, references, field_paths=None, transaction=None, retry=None, timeout=None):
+        return iter(self._read(list(references), transaction))
+
+    def close(self):
+        pass
+
+    def _sleep(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _read(self, references, transaction):
+        self._sleep()
+        with self._lock:
+            snapshots = []
+            for ref in references:
+                data, version = self._docs.get(ref.path, (None, 0))
+                snapshots.append(DocumentSnapshot(ref, copy.deepcopy(data), version))
+        if transaction is not None:
+            for snapshot in snapshots:
+                transaction._read_versions.setdefault(snapshot.reference.path, snapshot._version)
+        return snapshots
+
+    def _scan(self, collection_path, transaction):
+        self._sleep()
+        prefix = collection_path + "/"
+        with self._lock:
+            snapshots = [
+                DocumentSnapshot(DocumentReference(self, path), copy.deepcopy(data), version)
+                for path, (data, version) in self._docs.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+            ]
+        snapshots.sort(key=lambda s: s.id)
+        if transaction is not None:
+            for snapshot in snapshots:
+                transaction._read_versions.setdefault(snapshot.reference.path, snapshot._version)
+        return snapshots
+
+    def _scan_group(self, collection_id, transaction):
+        self._sleep()
+        with self._lock:
+            snapshots = []
+            for path, (data, version) in self._docs.items():
+                parts = path.split("/")
+                if parts[-2] == collection_id:
+                    snapshots.append(DocumentSnapshot(DocumentReference(self, path), copy.deepcopy(data), version))
+        snapshots.sort(key=lambda s: s.reference.path)
+        if transaction is not None:
+            for snapshot in snapshots:
+                transaction._read_versions.setdefault(snapshot.reference.path, snapshot._version)
+        return snapshots
+
+    def _commit(self, writes, expected_versions=None, preconditions=None):
+        if len(writes) > MAX_WRITES:
+            raise gcp_exceptions.InvalidArgument(f"maximum {MAX_WRITES} writes allowed per request")
+        self._sleep()
+        with self._lock:
+            for path, version in (expected_versions or {}).items():
+                if self._docs.get(path, (None, 0))[1] != version:
+                    raise gcp_exceptions.Aborted(f"Transaction contention on {path}")
+            for path, version in (preconditions or {}).items():
+                if self._docs.get(path, (None, 0))[1] != version:
+                    raise gcp_exceptions.FailedPrecondition(f"Document changed since {version}: {path}")
+            for op, ref, data, merge in writes:
+                current = self._docs.get(ref.path, (None, 0))[0]
+                if op == "create" and current is not None:
+                    raise gcp_exceptions.Conflict(f"Document already exists: {ref.path}")
+                if op == "update" and current is None:
+                    raise gcp_exceptions.NotFound(f"No document to update: {ref.path}")
+
+            # All checks passed; apply the writes atomically
+            for op, ref, data, merge in writes:
+                self._clock += 1
+                if op == "delete":
+                    self._docs.pop(ref.path, None)
+                    continue
+                current = self._docs.get(ref.path, (None, 0))[0]
+                if op == "update":
+                    new_data = copy.deepcopy(current)
+                    _update(new_data, data)
+                elif merge:
+                    new_data = copy.deepcopy(current) if current is not None else {}
+                    _merge(new_data, data)
+                else:
+                    new_data = {}
+                    _merge(new_data, data)
+                self._docs[ref.path] = (new_data, self._clock)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from datetime import datetime
+from typing import Any, Optional, List, Dict
 
 class InventoryItem(BaseModel):
     id: str
@@ -10,6 +11,73 @@ class InventoryItem(BaseModel):
     inventory_status: str
     rating: float
     image_url: str
+    stock_quantity: Optional[int] = None
+
+class FacetBucket(BaseModel):
+    label: str
+    min: Optional[float] = None
+    max: Optional[float] = None
+    count: int
+
+class ProductFacets(BaseModel):
+    category: Dict[str, int]
+    inventory_status: Dict[str, int]
+    price: List[FacetBucket]
+    rating: List[FacetBucket]
+
+class ProductFilterResponse(BaseModel):
+    total: int
+    items: List[InventoryItem]
+    facets: Optional[ProductFacets] = None
+
+class ParsedQuery(BaseModel):
+    categories: Optional[List[str]] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    min_rating: Optional[float] = None
+    statuses: Optional[List[str]] = None
+    sort: Optional[str] = None
+    keywords: List[List[str]]  # a title must contain one word of each list
+
+class ProductQueryResponse(BaseModel):
+    query: ParsedQuery
+    total: int
+    items: List[InventoryItem]
+    ignored: List[List[str]]  # keywords no product title contains
+
+class CatalogChange(BaseModel):
+    id: str
+    version: int
+    deleted: bool
+    item: Optional[InventoryItem] = None
+
+class CatalogChangesResponse(BaseModel):
+    since: int
+    version: int  # sync from this version once every page is applied
+    changes: List[CatalogChange]
+    next_cursor: Optional[str] = None
+
+class ProductLookupRequest(BaseModel):
+    ids: List[str]
+
+class ProductLookupResponse(BaseModel):
+    items: List[InventoryItem]
+    missing: List[str]
+
+class Suggestion(BaseModel):
+    text: str
+    type: str  # "category" or "product"
+    id: Optional[str] = None
+    category: str
+
+class StockUpdateRequest(BaseModel):
+    quantity: int
+    shards: Optional[int] = None
+
+class StockLevelResponse(BaseModel):
+    item_id: str
+    stock_quantity: int
+    inventory_status: str
 
 class CartItem(BaseModel):
     item_id: str
@@ -40,6 +108,19 @@ class OrderStatusResponse(BaseModel):
     status: str
     estimated_delivery: str
 
+class Order(BaseModel):
+    order_id: str
+    user_id: str
+    items: Dict[str, int]
+    status: str
+    created_at: datetime
+    estimated_delivery: str
+
+class OrderHistoryResponse(BaseModel):
+    user_id: str
+    orders: List[Order]
+    next_cursor: Optional[str] = None
+
 class ReturnOrderRequest(BaseModel):
     reason: str
 
@@ -59,3 +140,41 @@ class CartModel(BaseModel):
     user_id: str
     items: List[CartItemDetail]
     total_price: float
+
+class StoreLocation(BaseModel):
+    store_id: str
+    name: str
+    address: str
+    city: str
+    state: str
+    zip_code: str
+    phone: str
+    hours: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+class NearbyStore(StoreLocation):
+    distance_miles: float
+
+class CartItems(BaseModel):
+    items: Dict[str, int]
+
+class CartMutationResponse(BaseModel):
+    message: str
+    cart: CartItems
+    cart_details: Optional[CartModel] = None
+
+class BatchRequestItem(BaseModel):
+    method: str = "GET"
+    path: str  # e.g. "/api/products/SKU-10000" (may include a query string)
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: List[BatchRequestItem]
+
+class BatchResponseItem(BaseModel):
+    status: int
+    body: Optional[Any] = None
+
+class BatchResponse(BaseModel):
+    responses: List[BatchResponseItem]
@@ -0,0 +1,268 @@
+"""
+Understanding free-text product queries such as "basketball shoes under $100
+in stock".
+
+A lexicon of phrases is compiled once into a token trie. The phrases are:
+- the categories and the synonyms in database.CATEGORY_SYNONYMS;
+- price and rating comparisons with number slots ("under <num>",
+  "<num> stars and up");
+- stock phrases and sort words.
+A query is tokenized, and the trie is walked from each token taking the
+longest phrase that matches. Whatever no phrase claims, apart from filler
+words, is kept as keywords. Parsing a typical query takes microseconds.
+
+A parsed query runs as a single catalog selection (category, price, rating
+and stock), and its keywords then narrow the result by title. Category
+names and their variants ("basketballs") set the category. Synonyms that
+name a product type become keywords matching that type's title words: in
+"basketball shoes", the category is Basketball, and "shoes" matches titles
+such as "Basketball Sneakers". Keywords that appear in no title in the
+catalog are ignored and reported, so filler the lexicon doesn't know
+can't empty the answer.
+"""
+import itertools
+import re
+
+from app import config
+from app import database
+
+_TOKEN = re.compile(r"\$?\d[\d,]*(?:\.\d+)?|[a-z]+(?:-[a-z]+)*|[+<>-]")
+_NUM = "<num>"
+
+IN_STOCK = ["IN_STOCK", "LOW_STOCK"]
+
+# Words that carry no constraint in a shopping request
+STOPWORDS = frozenset("""
+    a an the i im me my we our you your show find get give buy want need
+    looking look search searching for some any with and or of in on to at by
+    is are that which please can could would like something things stuff
+    pair pairs set one ones item items product products dollars dollar bucks usd
+    price priced cost costs costing rating rated stars star good nice new
+    under below over above than less more most least up max from between
+""".split())
+
+# Synonyms too broad to narrow titles; they set the category if nothing else does
+BROAD_SYNONYMS = frozenset({"gear", "wear", "clothing", "clothe", "hoop"})
+
+# Title words that satisfy a product-type synonym (keys are stemmed)
+_SHOES = {"shoe", "sneaker", "cleat", "boot", "sandal", "slide"}
+PRODUCT_TYPES = {
+    "shoe": _SHOES,
+    "sneaker": {"sneaker", "shoe"},
+    "shirt": {"shirt", "t-shirt", "jersey", "polo"},
+    "t-shirt": {"t-shirt", "shirt"},
+    "pant": {"pants", "legging", "short"},
+    "jacket": {"jacket", "hoodie", "vest"},
+}
+
+
+def _set(field, value):
+    def action(query, numbers):
+        query[field] = value
+    return action
+
+
+def _price_max(query, numbers):
+    query["max_price"] = numbers[0]
+
+
+def _price_min(query, numbers):
+    query["min_price"] = numbers[0]
+
+
+def _price_range(query, numbers):
+    query["min_price"], query["max_price"] = min(numbers), max(numbers)
+
+
+def _rating_min(query, numbers):
+    if numbers[0] <= 5:
+        query["min_rating"] = numbers[0]
+
+
+def _top_rated(query, numbers):
+    query["min_rating"] = config.QUERY_TOP_RATED
+    query.setdefault("sort", "rating_desc")
+
+
+# Phrase -> action(query, numbers captured by <num> slots)
+PHRASES = {}
+for phrase in ("under", "below", "less than", "cheaper than", "up to", "at most", "no more than",
+               "max", "maximum", "within", "<", "for less than", "for under"):
+    PHRASES[f"{phrase} <num>"] = _price_max
+for phrase in ("<num> or less", "<num> and under", "<num> or under", "<num> max"):
+    PHRASES[phrase] = _price_max
+for phrase in ("over", "above", "more than", "at least", "min", "minimum", ">", "from", "starting at"):
+    PHRASES[f"{phrase} <num>"] = _price_min
+for phrase in ("<num> or more", "<num> and up", "<num> and over", "<num> +"):
+    PHRASES[phrase] = _price_min
+for phrase in ("between <num> and <num>", "<num> - <num>", "<num> to <num>", "from <num> to <num>"):
+    PHRASES[phrase] = _price_range
+for stars in ("stars", "star", "- star", "- stars"):
+    for phrase in ("<num> {}", "<num> + {}", "<num> {} and up", "<num> {} or more", "<num> {} or higher",
+                   "<num> {} or better", "<num> {} +", "at least <num> {}", "over <num> {}", "above <num> {}",
+                   "minimum <num> {}", "min <num> {}"):
+        PHRASES[phrase.format(stars)] = _rating_min
+for phrase in ("rated <num>", "rated <num> +", "rated <num> or higher", "rated <num> or better", "rated <num> and up",
+               "rated at least <num>", "rated above <num>", "rated over <num>", "rating <num>", "rating <num> +",
+               "rating above <num>", "rating over <num>", "rating of <num>", "rating of at least <num>"):
+    PHRASES[phrase] = _rating_min
+for phrase in ("top rated", "top-rated", "highly rated", "highly-rated", "best rated", "best-rated",
+               "well rated", "well-rated", "best reviewed"):
+    PHRASES[phrase] = _top_rated
+for phrase in ("in stock", "in-stock", "available", "available now", "on hand", "ready to ship"):
+    PHRASES[phrase] = _set("statuses", IN_STOCK)
+for phrase in ("low stock", "almost gone", "limited stock", "running low"):
+    PHRASES[phrase] = _set("statuses", ["LOW_STOCK"])
+for phrase in ("out of stock", "sold out", "out-of-stock"):
+    PHRASES[phrase] = _set("statuses", ["OUT_OF_STOCK"])
+for phrase in ("cheap", "cheapest", "budget", "affordable", "inexpensive", "lowest price", "least expensive",
+               "low price", "low cost"):
+    PHRASES[phrase] = _set("sort", "price_asc")
+for phrase in ("most expensive", "priciest", "highest price"):
+    PHRASES[phrase] = _set("sort", "price_desc")
+
+
+def _tokenize(text: str):
+    return _TOKEN.findall(text.lower())
+
+
+def _number(token: str):
+    """
+    The value of a numeric token ("$1,200.50" -> 1200.5), or None.
+    """
+    if token[0] == "$" or token[0].isdigit():
+        try:
+            return float(token.lstrip("$").replace(",", ""))
+        except ValueError:
+            return None
+    return None
+
+
+class Lexicon:
+    """
+    Phrases compiled into a token trie. Each node is a dict from token (or
+    the "<num>" slot) to child node; a node ending a phrase holds its payload
+    under the None key.
+    """
+
+    def __init__(self, phrases, synonyms):
+        self.root = {}
+        for phrase, action in phrases.items():
+            self._add(phrase.split(), ("action", action))
+        categories = set(synonyms.values())
+        for category in categories:
+            self._add(_tokenize(category), ("category", category))
+        for synonym, category in synonyms.items():
+            tokens = _tokenize(synonym)
+            if tokens and _tokenize(category) != tokens:
+                self._add(tokens, ("synonym", category))
+
+    def _add(self, tokens, payload):
+        node = self.root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node.setdefault(None, payload)
+
+    def longest_match(self, tokens, start):
+        """
+        Returns (end, payload, numbers) for the longest phrase starting at
+        tokens[start], or None.
+        """
+        node = self.root
+        numbers = []
+        best = None
+        for i in range(start, len(tokens)):
+            token = tokens[i]
+            child = node.get(token)
+            if child is None:
+                value = _number(token)
+                if value is None or _NUM not in node:
+                    break
+                child = node[_NUM]
+                numbers = numbers + [value]
+            node = child
+            if None in node:
+                best = (i + 1, node[None], numbers)
+        return best
+
+
+LEXICON = Lexicon(PHRASES, database.CATEGORY_SYNONYMS)
+
+
+def _stem(word: str):
+    if len(word) > 3 and word.endswith("es") and word[:-2].endswith(("sh", "ch", "x", "ss")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    return word
+
+
+def parse(text: str, lexicon: Lexicon = LEXICON):
+    """
+    Extracts structured constraints from a free-text query. Returns a dict
+    with `categories`, `min_price`, `max_price`, `min_rating`, `statuses`,
+    `sort` (each None if not mentioned) and `keywords`, a list of
+    alternative-word lists of which a title must contain one each.
+    """
+    tokens = _tokenize(text)
+    query = {}
+    categories = []
+    broad = []  # categories named only by a broad word such as "gear"
+    keywords = []
+    i = 0
+    while i < len(tokens):
+        match = lexicon.longest_match(tokens, i)
+        if match is None:
+            token = tokens[i]
+            if token not in STOPWORDS and token[0].isalpha():
+                keywords.append(sorted({token, _stem(token)}))
+            i += 1
+            continue
+        end, (kind, value), numbers = match
+        if kind == "action":
+            value(query, numbers)
+        elif kind == "category":
+            categories.append(value)
+        else:
+            word = _stem(" ".join(tokens[i:end]))
+            if value.lower().startswith(word):
+                # A variant of the category's name, e.g. "basketballs", "fish"
+                categories.append(value)
+            elif word in BROAD_SYNONYMS:
+                broad.append(value)
+            else:
+                # A product type, e.g. the "shoes" in "golf shoes"
+                keywords.append(sorted(PRODUCT_TYPES.get(word, {word})))
+        i = end
+
+    categories = list(dict.fromkeys(categories or broad[:1]))
+    return {
+        "categories": categories or None,
+        "min_price": query.get("min_price"),
+        "max_price": query.get("max_price"),
+        "min_rating": query.get("min_rating"),
+        "statuses": query.get("statuses"),
+        "sort": query.get("sort"),
+        "keywords": [k for k, _ in itertools.groupby(keywords)],
+    }
+
+
+def execute(parsed, snapshot, offset: int = 0, limit: int = 20, sort: str = None):
+    """
+    Runs a parsed query against a catalog snapshot. Returns (total, page of
+    products, keyword groups ignored because no title in the catalog has them).
+    """
+    rows = snapshot.select(
+        categories=parsed["categories"],
+        min_price=parsed["min_price"],
+        max_price=parsed["max_price"],
+        min_rating=parsed["min_rating"],
+        statuses=parsed["statuses"],
+    )
+    ignored = []
+    for alternatives in parsed["keywords"]:
+        if not any(snapshot.has_title_word(word) for word in alternatives):
+            ignored.append(alternatives)
+        elif len(rows):
+            rows = rows[snapshot.title_matches(rows, alternatives)]
+    return len(rows), snapshot.page(rows, sort or parsed["sort"], offset, limit), ignored
@@ -0,0 +1,172 @@
+"""
+Per-client rate limiting and load shedding for the /api routes.
+
+Every request is charged to a token bucket keyed by the user of its
+session token (or, for anonymous calls, the client address), and every
+route class has a cap on
+in-flight requests. Requests over either limit get an immediate 429 with a
+Retry-After header instead of queueing in front of Firestore. When the
+latency of datastore-backed requests rises above SHED_LATENCY_MS, the
+concurrency caps shrink in proportion, shedding load until it recovers.
+"""
+import json
+import math
+import time
+
+from app import auth
+from app import config
+from app import tenancy
+from app.cache import LRUCache
+
+READ = "read"
+WRITE = "write"
+ADMIN = "admin"
+
+# Routes answered from in-memory indexes; they don't feed the latency monitor
+DATASTORE_FREE_PREFIXES = ("/api/stores",)
+
+
+def route_class(method: str, path: str):
+    if path.startswith(("/api/save_inventory", "/api/inventory/", "/api/carts/sweep")):
+        return ADMIN
+    if method in ("GET", "HEAD"):
+        return READ
+    return WRITE
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by client: `rate` tokens per second, up to `burst`.
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = LRUCache(maxsize=max_keys)
+
+    def acquire(self, key: str, now: float = None):
+        """
+        Takes a token for `key`. Returns 0 if allowed, otherwise the seconds
+        until a token will be available.
+        """
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(self.burst), now]
+            self._buckets.set(key, bucket)
+
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate
+
+
+class LatencyMonitor:
+    """
+    Exponentially weighted moving average of request latency, in seconds.
+    """
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.value = 0.0
+
+    def observe(self, seconds: float):
+        self.value = self.alpha * seconds + (1 - self.alpha) * self.value
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware applying the token buckets and per-class concurrency caps.
+    """
+
+    def __init__(self, app, rate: float = None, burst: int = None, concurrency: dict = None, shed_latency_ms: float = None):
+        self.app = app
+        self.limiter = TokenBucketLimiter(
+            rate if rate is not None else config.RATE_LIMIT_RPS,
+            burst if burst is not None else config.RATE_LIMIT_BURST,
+        )
+        self.concurrency = concurrency or {
+            READ: config.CONCURRENCY_LIMIT_READ,
+            WRITE: config.CONCURRENCY_LIMIT_WRITE,
+            ADMIN: config.CONCURRENCY_LIMIT_ADMIN,
+        }
+        self.shed_latency = (shed_latency_ms if shed_latency_ms is not None else config.SHED_LATENCY_MS) / 1000
+        self.latency = LatencyMonitor()
+        self.in_flight = {cls: 0 for cls in self.concurrency}
+
+    def effective_limit(self, cls: str):
+        """
+        Concurrency cap for a route class, scaled down while datastore latency is high.
+        """
+        limit = self.concurrency[cls]
+        if self.shed_latency and self.latency.value > self.shed_latency:
+            return max(1, int(limit * self.shed_latency / self.latency.value))
+        return limit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = self.limiter.acquire(_client_key(scope))
+        if retry_after:
+            await self._reject(send, retry_after, "Rate limit exceeded")
+            return
+
+        cls = route_class(scope["method"], scope["path"])
+        if self.in_flight[cls] >= self.effective_limit(cls):
+            await self._reject(send, 1, "Server busy, please retry")
+            return
+
+        self.in_flight[cls] += 1
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight[cls] -= 1
+            if cls != ADMIN and not scope["path"].startswith(DATASTORE_FREE_PREFIXES):
+                self.latency.observe(time.monotonic() - start)
+
+    async def _reject(self, send, retry_after: float, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def _client_key(scope):
+    """
+    The bucket for a request: the user of a valid session token, else the
+    client address. Headers a client can set freely (a user_id, the start of
+    X-Forwarded-For) aren't used, so nobody can pick a fresh bucket per
+    request or drain someone else's.
+    """
+    headers = dict(scope["headers"])
+    tenant = tenancy.current()
+    scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+    if scheme.lower() == "bearer" and token.strip():
+        try:
+            username = auth.verify_token(token.strip(), tenant=tenant)
+            # The same username in two tenants is two different users
+            return f"user:{tenant}:{username}" if tenant else f"user:{username}"
+        except auth.InvalidToken:
+            pass
+
+    # Each trusted proxy appends the address it received the request from, so
+    # the entry TRUSTED_PROXY_HOPS from the end is the one our edge saw;
+    # anything before it came from the client
+    forwarded = [hop.strip() for hop in headers.get(b"x-forwarded-for", b"").decode("latin-1").split(",")]
+    hops = config.TRUSTED_PROXY_HOPS
+    if hops and len(forwarded) >= hops and forwarded[-hops]:
+        return f"client:{forwarded[-hops]}"
+    return f"client:{(scope.get('client') or ('unknown',))[0]}"
@@ -0,0 +1,184 @@
+"""
+Precomputed "related products" recommendations.
+
+For every product the table stores the ids of its top-k neighbours in one
+int32 matrix (one row per product, -1 padded), so a lookup is a dict lookup
+plus an array slice. Neighbours come from the same category and are scored
+by text similarity of title and description (the hashing vectors from
+app/semantic.py) plus a bonus for a similar price band; products with the
+same title are skipped, so a listing isn't "related" to its own duplicates.
+
+The table is computed when first needed, outside the request path of later
+lookups. After an inventory reload only the categories containing changed
+or removed rows are recomputed, into a new table that replaces the old one.
+"""
+import logging
+import threading
+
+import numpy as np
+
+from app import catalog
+from app import config
+from app import database
+from app import semantic
+
+log = logging.getLogger(__name__)
+
+_FIELDS = ("category", "title", "description", "price")
+
+
+def _fields(record):
+    return tuple(record.get(f) for f in _FIELDS)
+
+
+class RelatedTable:
+    def __init__(self, records, k: int = None, dimensions: int = None):
+        self.k = k or config.RELATED_K
+        self.dimensions = dimensions or config.SEMANTIC_DIMENSIONS
+        # (ids, row_of, fields, neighbors), replaced as a whole by update() so
+        # lookups never see a table half way through an update
+        self._state = ([], {}, [], np.full((0, self.k), -1, dtype=np.int32))
+
+        records = list(records)
+        # IDF from the full catalog; kept for incremental updates
+        rows, cols, _ = semantic.term_weights(records, self.dimensions)
+        self.idf = semantic.inverse_document_frequency(rows, cols, len(records), self.dimensions)
+        self.update(records)
+
+    @property
+    def ids(self):
+        return self._state[0]
+
+    @property
+    def row_of(self):
+        return self._state[1]
+
+    @property
+    def fields(self):
+        return self._state[2]
+
+    @property
+    def neighbors(self):
+        return self._state[3]
+
+    def update(self, records):
+        """
+        Brings the table in line with `records`, the full catalog: adds,
+        updates and drops rows, and recomputes the categories they touch.
+        Returns the number of products whose neighbours were recomputed.
+        """
+        old_ids, old_row_of, old_fields, old_neighbors = self._state
+        current = {record["id"] for record in records}
+        affected = {old_fields[row][0] for item_id, row in old_row_of.items() if item_id not in current}
+
+        # Surviving rows keep their order; neighbours are renumbered
+        keep = [row for row, item_id in enumerate(old_ids) if item_id in current]
+        ids = [old_ids[row] for row in keep]
+        fields = [old_fields[row] for row in keep]
+        row_of = {item_id: row for row, item_id in enumerate(ids)}
+        if len(keep) == len(old_ids):
+            neighbors = old_neighbors.copy()
+        else:
+            renumber = np.full(len(old_ids) + 1, -1, dtype=np.int32)  # the last slot maps -1 to -1
+            renumber[keep] = np.arange(len(keep), dtype=np.int32)
+            neighbors = renumber[old_neighbors[keep]]
+
+        for record in records:
+            record_fields = _fields(record)
+            row = row_of.get(record["id"])
+            if row is None:
+                row_of[record["id"]] = len(ids)
+                ids.append(record["id"])
+                fields.append(record_fields)
+            elif fields[row] != record_fields:
+                affected.add(fields[row][0])
+                fields[row] = record_fields
+            else:
+                continue
+            affected.add(record_fields[0])
+
+        if len(ids) > len(neighbors):
+            padding = np.full((len(ids) - len(neighbors), self.k), -1, dtype=np.int32)
+            neighbors = np.vstack([neighbors, padding])
+
+        recomputed = 0
+        for category in affected:
+            members = np.array([i for i, f in enumerate(fields) if f[0] == category], dtype=np.int32)
+            if len(members):
+                self._compute(members, fields, neighbors)
+                recomputed += len(members)
+        self._state = (ids, row_of, fields, neighbors)
+        return recomputed
+
+    def _compute(self, members, fields, neighbors):
+        records = [dict(zip(_FIELDS, fields[i])) for i in members]
+        rows, cols, vals = semantic.term_weights(records, self.dimensions)
+        vectors = semantic.normalize_rows(
+            semantic.dense_rows(rows, cols, vals, 0, len(records), self.dimensions), self.idf
+        )
+        bands = np.searchsorted(config.PRICE_FACET_EDGES, [float(r["price"] or 0) for r in records], side="right")
+        titles = np.array([(r["title"] or "").strip().lower() for r in records], dtype=object)
+
+        k = min(self.k, len(members) - 1)
+        for start in range(0, len(members), config.RELATED_BLOCK_ROWS):
+            end = min(len(members), start + config.RELATED_BLOCK_ROWS)
+            scores = vectors[start:end] @ vectors.T
+            # Same price band +weight, adjacent band +weight/2
+            gap = np.abs(bands[start:end, None] - bands[None, :])
+            scores += np.where(gap == 0, config.RELATED_PRICE_WEIGHT, np.where(gap == 1, config.RELATED_PRICE_WEIGHT / 2, 0))
+            scores[titles[start:end, None] == titles[None, :]] = -np.inf
+
+            block = np.full((end - start, self.k), -1, dtype=np.int32)
+            if k > 0:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                top_scores = np.take_along_axis(scores, top, axis=1)
+                order = np.argsort(-top_scores, axis=1, kind="stable")
+                top = np.take_along_axis(top, order, axis=1)
+                valid = np.isfinite(np.take_along_axis(top_scores, order, axis=1))
+                block[:, :k] = np.where(valid, members[top], -1)
+            neighbors[members[start:end]] = block
+
+    def related(self, item_id: str, limit: int = None):
+        """
+        Returns the related product ids, best first, or None for an unknown item.
+        """
+        ids, row_of, _, table = self._state
+        row = row_of.get(item_id)
+        if row is None:
+            return None
+        neighbors = table[row, :limit]
+        return [ids[i] for i in neighbors[neighbors >= 0]]
+
+
+_table = None
+_lock = threading.Lock()
+
+
+def get_table():
+    global _table
+    if _table is None:
+        with _lock:
+            if _table is None:
+                _table = RelatedTable(catalog.get_catalog().records)
+    return _table
+
+
+def _on_inventory_change(rows):
+    with _lock:
+        if _table is not None:
+            recomputed = _table.update(rows)
+            log.info("Related products: recomputed %d rows.", recomputed)
+
+
+database.on_inventory_change(_on_inventory_change)
+
+
+def get_related_products(item_id: str, limit: int = None):
+    """
+    Returns the related products with current catalog data, or None for an unknown item.
+    """
+    ids = get_table().related(item_id, limit)
+    if ids is None:
+        return None
+    snapshot = catalog.get_catalog()
+    return [snapshot.records[snapshot.row_of[i]] for i in ids if i in snapshot.row_of]
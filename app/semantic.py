@@ -0,0 +1,281 @@
+"""
+Offline semantic product search.
+
+Each product's title, description and category are turned into a TF-IDF
+weighted hashing vector (words are hashed into a fixed number of
+dimensions, so no vocabulary or model has to be shipped) and L2-normalized.
+The vectors live in a float32 matrix saved as a .npy file and memory-mapped,
+so large catalogs don't have to fit in the Python heap. A query is vectorized
+the same way and scored against the matrix with NumPy dot products,
+`SEMANTIC_CHUNK_ROWS` rows at a time.
+
+Catalogs larger than SEMANTIC_IVF_THRESHOLD also get an inverted-file index:
+rows are clustered around k-means centroids and stored contiguously by
+cluster, and a query only scores the clusters whose centroids are closest.
+Query words that are category synonyms (e.g. "tent") also match their
+canonical category. Everything runs locally on CPU.
+"""
+import array
+import functools
+import math
+import os
+import re
+import tempfile
+import threading
+import weakref
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from app import catalog
+from app import config
+from app import database
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its me my of on "
+    "or our something that the their this to was we with you your".split()
+)
+
+
+@functools.lru_cache(maxsize=100000)
+def _normalize_word(word: str):
+    if word in STOPWORDS:
+        return None
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str):
+    """
+    Lowercased words without stopwords, with plural "s" stripped.
+    """
+    words = (_normalize_word(word) for word in _WORD.findall(text.lower()))
+    return [word for word in words if word]
+
+
+@functools.lru_cache(maxsize=100000)
+def _bucket(word: str, dimensions: int):
+    """
+    Returns (index, sign) for a word; crc32 keeps it stable across processes.
+    """
+    h = zlib.crc32(word.encode())
+    return h % dimensions, 1.0 if h & 0x80000000 else -1.0
+
+
+def _record_text(record):
+    return " ".join(str(record.get(f, "")) for f in ("title", "description", "category"))
+
+
+def term_weights(records, dimensions: int):
+    """
+    Hashed term weights of each record's text as (row, bucket, value) arrays,
+    sorted by row.
+    """
+    rows, cols, vals = array.array("i"), array.array("i"), array.array("f")
+    for row, record in enumerate(records):
+        for word, count in Counter(tokenize(_record_text(record))).items():
+            index, sign = _bucket(word, dimensions)
+            rows.append(row)
+            cols.append(index)
+            vals.append(sign * (1 + math.log(count)))
+    return tuple(np.frombuffer(a, dtype=a.typecode) for a in (rows, cols, vals))
+
+
+def inverse_document_frequency(rows, cols, n: int, dimensions: int):
+    pairs = np.unique(rows.astype(np.int64) * dimensions + cols)
+    df = np.bincount(pairs % dimensions, minlength=dimensions)
+    return (np.log((n + 1) / (df + 1)) + 1).astype(np.float32)
+
+
+def dense_rows(rows, cols, vals, start: int, end: int, dimensions: int):
+    """
+    Unweighted dense vectors for rows [start, end) of term_weights() output.
+    """
+    lo, hi = np.searchsorted(rows, [start, end])
+    matrix = np.zeros((end - start, dimensions), dtype=np.float32)
+    np.add.at(matrix, (rows[lo:hi] - start, cols[lo:hi]), vals[lo:hi])
+    return matrix
+
+
+def normalize_rows(matrix, idf):
+    """
+    Applies IDF weights and L2-normalizes rows, in place.
+    """
+    matrix *= idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+class SemanticIndex:
+    def __init__(self, records, dimensions: int = None, path: str = None, synonyms=None, ivf_threshold: int = None):
+        self.dimensions = dimensions or config.SEMANTIC_DIMENSIONS
+        self.records = list(records)
+        self.synonyms = {k.lower(): v.lower() for k, v in (synonyms or {}).items()}
+        n = len(self.records)
+
+        rows, cols, vals = term_weights(self.records, self.dimensions)
+        self.idf = inverse_document_frequency(rows, cols, n, self.dimensions)
+
+        self.path = path or os.path.join(tempfile.gettempdir(), f"cymbal-semantic-{os.getpid()}-{id(self)}.npy")
+        vectors = np.lib.format.open_memmap(self.path, mode="w+", dtype=np.float32, shape=(n, self.dimensions))
+        for start in range(0, n, config.SEMANTIC_CHUNK_ROWS):
+            end = min(n, start + config.SEMANTIC_CHUNK_ROWS)
+            vectors[start:end] = self._weight(dense_rows(rows, cols, vals, start, end, self.dimensions))
+        vectors.flush()
+
+        # Row order in the matrix; the IVF build regroups rows by cluster
+        self.order = np.arange(n)
+        self.centroids = None
+        self.offsets = None
+        threshold = ivf_threshold if ivf_threshold is not None else config.SEMANTIC_IVF_THRESHOLD
+        if n >= threshold:
+            self._build_ivf(vectors)
+        del vectors
+        self.vectors = np.load(self.path, mmap_mode="r")
+        # Delete the file once the index is dropped (the mapping stays valid until then)
+        self._finalizer = weakref.finalize(self, _remove, self.path)
+
+    def _weight(self, matrix):
+        return normalize_rows(matrix, self.idf)
+
+    def vectorize_query(self, text: str):
+        words = tokenize(text)
+        words += [self.synonyms[w] for w in words if w in self.synonyms]
+        words += [self.synonyms[w + "s"] for w in words if w + "s" in self.synonyms]
+        vector = np.zeros((1, self.dimensions), dtype=np.float32)
+        for word, count in Counter(words).items():
+            index, sign = _bucket(word, self.dimensions)
+            vector[0, index] += sign * (1 + math.log(count))
+        return self._weight(vector)[0]
+
+    def _build_ivf(self, vectors):
+        """
+        Spherical k-means over a sample, then stores rows grouped by nearest centroid.
+        """
+        n = len(self.records)
+        nlist = max(1, int(math.sqrt(n)))
+        rng = np.random.default_rng(0)
+        sample = np.asarray(vectors[np.sort(rng.choice(n, size=min(n, nlist * 32), replace=False))])
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(config.SEMANTIC_KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            by_cluster = np.argsort(assignment, kind="stable")
+            bounds = np.searchsorted(assignment[by_cluster], np.arange(nlist + 1))
+            filled = bounds[1:] > bounds[:-1]
+            # Empty clusters keep their old centroid
+            sums = np.add.reduceat(sample[by_cluster], np.minimum(bounds[:-1], len(sample) - 1))[filled]
+            centroids[filled] = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        assignment = np.empty(n, dtype=np.int64)
+        for start in range(0, n, config.SEMANTIC_CHUNK_ROWS):
+            chunk = vectors[start:start + config.SEMANTIC_CHUNK_ROWS]
+            assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+
+        # Rewrite the matrix grouped by cluster, so each cluster is one slice
+        self.order = np.argsort(assignment, kind="stable")
+        grouped_path = self.path + ".ivf.npy"
+        grouped = np.lib.format.open_memmap(grouped_path, mode="w+", dtype=np.float32, shape=vectors.shape)
+        for start in range(0, n, config.SEMANTIC_CHUNK_ROWS):
+            rows = self.order[start:start + config.SEMANTIC_CHUNK_ROWS]
+            grouped[start:start + len(rows)] = vectors[rows]
+        grouped.flush()
+        del grouped
+        os.replace(grouped_path, self.path)
+
+        self.centroids = centroids
+        self.offsets = np.searchsorted(assignment[self.order], np.arange(nlist + 1))
+
+    def _candidate_ranges(self, query):
+        if self.centroids is None:
+            return [(0, len(self.records))]
+        nprobe = min(config.SEMANTIC_NPROBE, len(self.centroids))
+        closest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return [(self.offsets[c], self.offsets[c + 1]) for c in sorted(closest)]
+
+    def search(self, text: str, k: int = 10):
+        """
+        Returns up to k (product, score) pairs, best first.
+        """
+        return self.search_many([text], k)[0]
+
+    def search_many(self, texts, k: int = 10):
+        """
+        Scores a batch of queries with one matrix product per chunk of rows.
+        """
+        queries = np.stack([self.vectorize_query(t) for t in texts]) if texts else np.zeros((0, self.dimensions), np.float32)
+        best_rows = [np.empty(0, dtype=np.int64) for _ in texts]
+        best_scores = [np.empty(0, dtype=np.float32) for _ in texts]
+
+        ranges = {}
+        for q, query in enumerate(queries):
+            for span in self._candidate_ranges(query):
+                ranges.setdefault(span, []).append(q)
+        for (start, end), members in ranges.items():
+            for lo in range(start, end, config.SEMANTIC_CHUNK_ROWS):
+                hi = min(end, lo + config.SEMANTIC_CHUNK_ROWS)
+                scores = np.asarray(self.vectors[lo:hi]) @ queries[members].T
+                for column, q in enumerate(members):
+                    rows = np.concatenate([best_rows[q], np.arange(lo, hi)])
+                    merged = np.concatenate([best_scores[q], scores[:, column]])
+                    if len(merged) > k:
+                        keep = np.argpartition(-merged, k - 1)[:k]
+                        rows, merged = rows[keep], merged[keep]
+                    best_rows[q], best_scores[q] = rows, merged
+
+        results = []
+        for rows, scores in zip(best_rows, best_scores):
+            ranked = sorted(zip(scores, rows), key=lambda pair: (-pair[0], pair[1]))
+            results.append([
+                (self.records[self.order[row]], float(score))
+                for score, row in ranked if score > 0
+            ])
+        return results
+
+    def close(self):
+        self._finalizer()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# (catalog version, index built from that snapshot)
+_built = (None, None)
+_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Returns the semantic index, rebuilding it when the catalog snapshot has
+    changed since the last build (an inventory reload, a TTL refresh, or
+    recovery from fallback data).
+    """
+    global _built
+    snapshot = catalog.get_catalog()
+    version, index = _built
+    if index is None or version != snapshot.version:
+        with _lock:
+            version, index = _built
+            if index is None or version != snapshot.version:
+                # A replaced index's file is removed once no search holds it (see _finalizer)
+                index = SemanticIndex(snapshot.records, synonyms=database.CATEGORY_SYNONYMS)
+                _built = (snapshot.version, index)
+    return index
+
+
+def invalidate(rows=None):
+    global _built
+    old, _built = _built[1], (None, None)
+    if old is not None:
+        old.close()
+
+
+database.on_inventory_change(invalidate)
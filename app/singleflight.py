@@ -0,0 +1,155 @@
+"""
+Single-flight coalescing of identical concurrent calls.
+
+While a call for a key is in flight, other callers with the same key wait
+for it and share its result (or exception) instead of running their own.
+This keeps a burst of identical catalog reads from each streaming the same
+Firestore query. Shared results must be treated as read-only.
+
+A leader that fails because its own request deadline ran out doesn't pass
+that on: its followers may have budget left, so they try again, one of them
+as the new leader.
+
+Threads coalesce through `SingleFlight.do`; coroutines on one event loop
+coalesce through `SingleFlight.do_async`.
+"""
+import asyncio
+import functools
+import threading
+from collections import defaultdict
+
+from app import deadline
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "retry")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.retry = False
+
+
+class _LeaderRanOut(Exception):
+    """
+    Set on an async call's future when the leader's deadline ran out.
+    """
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        # name -> {"executions": n, "coalesced": n}
+        self._stats = defaultdict(lambda: {"executions": 0, "coalesced": 0})
+
+    def _count(self, key, field):
+        self._stats[key[0]][field] += 1
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) unless a call with the same key is already
+        running in another thread, in which case waits for and returns its result.
+        `key` is a tuple whose first element names the operation (used for stats).
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                self._count(key, "executions" if leader else "coalesced")
+            if leader:
+                break
+            call.event.wait()
+            if call.retry:
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            call.retry = deadline.ran_out(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def do_async(self, key, fn, *args, **kwargs):
+        """
+        Async variant of `do`. `fn` may be a coroutine function, or a blocking
+        function that is then run in a worker thread.
+        """
+        loop = asyncio.get_running_loop()
+        loop_key = (id(loop), key)
+        while True:
+            with self._lock:
+                future = self._async_calls.get(loop_key)
+                leader = future is None
+                if leader:
+                    future = self._async_calls[loop_key] = loop.create_future()
+                self._count(key, "executions" if leader else "coalesced")
+            if leader:
+                break
+            try:
+                # shield: one waiter being cancelled must not cancel the shared call
+                return await asyncio.shield(future)
+            except _LeaderRanOut:
+                continue
+
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                result = await fn(*args, **kwargs)
+            else:
+                result = await asyncio.to_thread(fn, *args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(_LeaderRanOut() if deadline.ran_out(e) else e)
+            # Mark the exception retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                del self._async_calls[loop_key]
+
+    def stats(self):
+        """
+        Returns {name: {"executions": n, "coalesced": n}} since startup.
+        """
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._stats.items()}
+
+
+# Process-wide instance used by the data layer
+group = SingleFlight()
+
+
+def coalesce(key=None):
+    """
+    Decorator that coalesces concurrent calls with the same normalized arguments.
+    `key(*args, **kwargs)` normalizes the arguments; by default they are used as-is.
+    The async variant is available as `decorated.aio(...)`.
+    """
+    def decorator(fn):
+        def make_key(args, kwargs):
+            normalized = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            return (fn.__name__, normalized)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return group.do(make_key(args, kwargs), fn, *args, **kwargs)
+
+        async def aio(*args, **kwargs):
+            return await group.do_async(make_key(args, kwargs), fn, *args, **kwargs)
+
+        wrapper.aio = aio
+        return wrapper
+    return decorator
@@ -0,0 +1,270 @@
+"""
+Store locator built from the locations directory (rag_data/locations.txt).
+
+The directory is parsed once into structured records and indexed by city,
+state and ZIP prefix. The directory only carries street addresses, so store
+coordinates come from the CITY_COORDINATES table and nearest-store lookups
+use a small k-d tree over them.
+"""
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+
+log = logging.getLogger(__name__)
+
+LOCATIONS_PATH = os.path.join(os.path.dirname(__file__), "..", "rag_data", "locations.txt")
+
+EARTH_RADIUS_MILES = 3958.8
+
+# Approximate city centers for every city create_rag_data.py can generate.
+CITY_COORDINATES = {
+    "New York": (40.7128, -74.0060),
+    "Los Angeles": (34.0522, -118.2437),
+    "Chicago": (41.8781, -87.6298),
+    "Houston": (29.7604, -95.3698),
+    "Phoenix": (33.4484, -112.0740),
+    "Philadelphia": (39.9526, -75.1652),
+    "San Antonio": (29.4241, -98.4936),
+    "San Diego": (32.7157, -117.1611),
+    "Dallas": (32.7767, -96.7970),
+    "San Jose": (37.3382, -121.8863),
+    "Austin": (30.2672, -97.7431),
+    "Jacksonville": (30.3322, -81.6557),
+    "Fort Worth": (32.7555, -97.3308),
+    "Columbus": (39.9612, -82.9988),
+    "San Francisco": (37.7749, -122.4194),
+    "Charlotte": (35.2271, -80.8431),
+    "Indianapolis": (39.7684, -86.1581),
+    "Seattle": (47.6062, -122.3321),
+    "Denver": (39.7392, -104.9903),
+    "Washington": (38.9072, -77.0369),
+    "Boston": (42.3601, -71.0589),
+    "El Paso": (31.7619, -106.4850),
+    "Nashville": (36.1627, -86.7816),
+    "Detroit": (42.3314, -83.0458),
+    "Oklahoma City": (35.4676, -97.5164),
+    "Portland": (45.5152, -122.6784),
+    "Las Vegas": (36.1699, -115.1398),
+    "Memphis": (35.1495, -90.0490),
+    "Louisville": (38.2527, -85.7585),
+    "Baltimore": (39.2904, -76.6122),
+    "Milwaukee": (43.0389, -87.9065),
+    "Albuquerque": (35.0844, -106.6504),
+    "Tucson": (32.2226, -110.9747),
+    "Fresno": (36.7378, -119.7871),
+    "Sacramento": (38.5816, -121.4944),
+    "Mesa": (33.4152, -111.8315),
+    "Kansas City": (39.0997, -94.5786),
+    "Atlanta": (33.7490, -84.3880),
+    "Long Beach": (33.7701, -118.1937),
+    "Omaha": (41.2565, -95.9345),
+    "Raleigh": (35.7796, -78.6382),
+    "Miami": (25.7617, -80.1918),
+    "Virginia Beach": (36.8529, -75.9780),
+    "Oakland": (37.8044, -122.2712),
+    "Minneapolis": (44.9778, -93.2650),
+    "Tulsa": (36.1540, -95.9928),
+    "Tampa": (27.9506, -82.4572),
+    "Arlington": (32.7357, -97.1081),
+    "New Orleans": (29.9511, -90.0715),
+}
+
+# "7108 Washington St, Miami, PA 81136"
+_ADDRESS_RE = re.compile(r"^(?P<street>.+), (?P<city>[^,]+), (?P<state>[A-Z]{2}) (?P<zip_code>\d{5})$")
+
+
+def parse_locations(text: str):
+    """
+    Parses the locations directory text into a list of store dicts.
+    Blocks that don't carry a parseable address are skipped.
+    """
+    stores = []
+    current = {}
+
+    def flush():
+        match = _ADDRESS_RE.match(current.get("Address", ""))
+        if "Store" in current and match:
+            city = match.group("city")
+            lat, lon = CITY_COORDINATES.get(city, (None, None))
+            stores.append({
+                "store_id": f"STORE-{len(stores) + 1:03d}",
+                "name": current["Store"],
+                "address": match.group("street"),
+                "city": city,
+                "state": match.group("state"),
+                "zip_code": match.group("zip_code"),
+                "phone": current.get("Phone", ""),
+                "hours": current.get("Hours", ""),
+                "latitude": lat,
+                "longitude": lon,
+            })
+        current.clear()
+
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("---"):
+            flush()
+        elif ": " in line:
+            key, value = line.split(": ", 1)
+            current[key] = value
+    flush()
+    return stores
+
+
+def _normalize_city(city: str):
+    return " ".join(city.split()).lower()
+
+
+def _to_unit_vector(lat: float, lon: float):
+    lat_r, lon_r = math.radians(lat), math.radians(lon)
+    return (
+        math.cos(lat_r) * math.cos(lon_r),
+        math.cos(lat_r) * math.sin(lon_r),
+        math.sin(lat_r),
+    )
+
+
+def _chord_to_miles(chord_sq: float):
+    # Straight-line distance between unit vectors -> great-circle distance
+    chord = min(math.sqrt(chord_sq), 2.0)
+    return 2 * math.asin(chord / 2) * EARTH_RADIUS_MILES
+
+
+def _build_kdtree(points, depth=0):
+    """
+    Builds a k-d tree over (vector, index) pairs.
+    Nodes are (vector, index, axis, left, right) tuples.
+    """
+    if not points:
+        return None
+    axis = depth % 3
+    points = sorted(points, key=lambda p: p[0][axis])
+    mid = len(points) // 2
+    vec, idx = points[mid]
+    return (
+        vec,
+        idx,
+        axis,
+        _build_kdtree(points[:mid], depth + 1),
+        _build_kdtree(points[mid + 1:], depth + 1),
+    )
+
+
+def _kdtree_nearest(node, target, k, heap):
+    """
+    Collects the k nearest points into `heap` as (-distance_sq, index) pairs.
+    """
+    if node is None:
+        return
+    vec, idx, axis, left, right = node
+    dist_sq = sum((a - b) ** 2 for a, b in zip(vec, target))
+    if len(heap) < k:
+        heapq.heappush(heap, (-dist_sq, idx))
+    elif dist_sq < -heap[0][0]:
+        heapq.heapreplace(heap, (-dist_sq, idx))
+
+    diff = target[axis] - vec[axis]
+    near, far = (left, right) if diff < 0 else (right, left)
+    _kdtree_nearest(near, target, k, heap)
+    # Only cross the splitting plane if it's closer than the current k-th best
+    if len(heap) < k or diff * diff < -heap[0][0]:
+        _kdtree_nearest(far, target, k, heap)
+
+
+class StoreDirectory:
+    """
+    In-memory store directory with city, state, ZIP prefix and proximity indexes.
+    """
+
+    def __init__(self, stores):
+        self.stores = list(stores)
+        self._by_id = {s["store_id"]: i for i, s in enumerate(self.stores)}
+        self._by_city = defaultdict(list)
+        self._by_state = defaultdict(list)
+        self._by_zip_prefix = defaultdict(list)
+
+        points = []
+        for i, store in enumerate(self.stores):
+            self._by_city[_normalize_city(store["city"])].append(i)
+            self._by_state[store["state"]].append(i)
+            # Index every prefix length so "80", "802" and "80202" are all single lookups
+            for n in range(1, len(store["zip_code"]) + 1):
+                self._by_zip_prefix[store["zip_code"][:n]].append(i)
+            if store["latitude"] is not None:
+                points.append((_to_unit_vector(store["latitude"], store["longitude"]), i))
+        self._tree = _build_kdtree(points)
+
+    def get(self, store_id: str):
+        idx = self._by_id.get(store_id)
+        return None if idx is None else self.stores[idx]
+
+    def find(self, city: str = None, state: str = None, zip_prefix: str = None):
+        """
+        Returns stores matching every given filter (all stores if none given).
+        """
+        candidates = None
+        for index, key in (
+            (self._by_city, _normalize_city(city) if city else None),
+            (self._by_state, state.strip().upper() if state else None),
+            (self._by_zip_prefix, zip_prefix.strip() if zip_prefix else None),
+        ):
+            if key is None:
+                continue
+            matches = set(index.get(key, ()))
+            candidates = matches if candidates is None else candidates & matches
+
+        if candidates is None:
+            return list(self.stores)
+        return [self.stores[i] for i in sorted(candidates)]
+
+    def nearest(self, latitude: float, longitude: float, limit: int = 5):
+        """
+        Returns up to `limit` stores closest to the given point, nearest first,
+        each with a `distance_miles` field.
+        """
+        heap = []
+        if limit > 0:
+            _kdtree_nearest(self._tree, _to_unit_vector(latitude, longitude), limit, heap)
+        results = []
+        for neg_dist_sq, idx in sorted(heap, reverse=True):
+            store = dict(self.stores[idx])
+            store["distance_miles"] = round(_chord_to_miles(-neg_dist_sq), 1)
+            results.append(store)
+        return results
+
+
+def geocode_city(city: str):
+    """
+    Returns (latitude, longitude) for a known city name, or None.
+    """
+    wanted = _normalize_city(city)
+    for name, coords in CITY_COORDINATES.items():
+        if name.lower() == wanted:
+            return coords
+    return None
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_directory():
+    """
+    Returns the process-wide StoreDirectory, parsing the locations file on first use.
+    """
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                stores = []
+                if os.path.exists(LOCATIONS_PATH):
+                    with open(LOCATIONS_PATH) as f:
+                        stores = parse_locations(f.read())
+                else:
+                    log.warning("Locations file not found at %s", LOCATIONS_PATH)
+                _directory = StoreDirectory(stores)
+    return _directory
@@ -0,0 +1,181 @@
+"""
+Type-ahead suggestions for product titles and categories.
+
+Distinct title words are kept in one sorted array, so the words starting
+with a prefix form a contiguous range found with two bisects. Each word
+points at its products in rank order (best rating first), so the best
+matches come from merging the heads of those lists. The best matches for
+short prefixes, which cover many words, are precomputed.
+
+Category names and the synonyms understood by `validate_category` suggest
+their canonical category. The index is built from the in-memory catalog on
+first use and rebuilt only after the inventory is reloaded.
+"""
+import bisect
+import heapq
+import itertools
+import re
+import threading
+
+from app import catalog
+from app import config
+from app import database
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str):
+    return " ".join(_TOKEN.findall(text.lower()))
+
+
+class SuggestIndex:
+    def __init__(self, records, synonyms=None, depth: int = None, max_results: int = None):
+        self.depth = depth if depth is not None else config.SUGGEST_PRECOMPUTED_PREFIX_LEN
+        self.max_results = max_results if max_results is not None else config.SUGGEST_MAX_LIMIT
+
+        # Products in rank order (best rating first); a row's rank is its index
+        self.products = sorted(records, key=lambda r: (-float(r.get("rating", 0.0)), r.get("title", "")))
+        self.tokens = [set(_TOKEN.findall(r.get("title", "").lower())) for r in self.products]
+        # " word1 word2 " per row, for quick word and word-prefix checks
+        self.padded = [f" {' '.join(tokens)} " for tokens in self.tokens]
+
+        # Sorted distinct words; postings[i] lists the rows containing words[i], best first
+        postings = {}
+        for row, tokens in enumerate(self.tokens):
+            for token in tokens:
+                postings.setdefault(token, []).append(row)
+        self.words = sorted(postings)
+        self.postings = [postings[word] for word in self.words]
+
+        # Top rows for every prefix up to `depth` characters
+        self.top = {}
+        for row, tokens in enumerate(self.tokens):
+            prefixes = {token[:n] for token in tokens for n in range(1, self.depth + 1)}
+            for prefix in prefixes:
+                best = self.top.setdefault(prefix, [])
+                if len(best) < self.max_results:
+                    best.append(row)
+
+        categories = {r.get("category") for r in records if r.get("category")}
+        names = {normalize(c): c for c in categories}
+        for synonym, category in (synonyms or {}).items():
+            if category in categories:
+                names.setdefault(normalize(synonym), category)
+        self.category_keys = sorted(names)
+        self.category_of = names
+
+    def _product_rows(self, words, limit):
+        prefix = words[-1]
+        required = words[:-1]
+        if not required and len(prefix) <= self.depth:
+            return self.top.get(prefix, [])[:limit]
+
+        lo = bisect.bisect_left(self.words, prefix)
+        hi = bisect.bisect_left(self.words, prefix + "\uffff", lo)
+        if not required:
+            # A lower row is a better match, so only the first `limit` rows of
+            # each posting list can make the cut
+            return _first_unique(heapq.merge(*[p[:limit] for p in self.postings[lo:hi]]), limit)
+
+        # Walk whichever is shorter: the rarest earlier word's rows, or the
+        # rows of every word starting with the prefix
+        required_rows = []
+        for word in required:
+            i = bisect.bisect_left(self.words, word)
+            if i == len(self.words) or self.words[i] != word:
+                return []
+            required_rows.append(self.postings[i])
+        rarest = min(required_rows, key=len)
+        needles = [f" {word} " for word in required]
+        if len(rarest) <= sum(len(p) for p in self.postings[lo:hi]):
+            needles.append(f" {prefix}")
+            candidates = rarest
+        else:
+            # One C-level sort beats a k-way merge over many short lists
+            candidates = sorted(itertools.chain.from_iterable(self.postings[lo:hi]))
+        padded = self.padded
+        return _first_unique(
+            (row for row in candidates if all(needle in padded[row] for needle in needles)),
+            limit,
+        )
+
+    def _categories(self, query):
+        lo = bisect.bisect_left(self.category_keys, query)
+        hi = bisect.bisect_left(self.category_keys, query + "\uffff", lo)
+        matched = []
+        for key in self.category_keys[lo:hi]:
+            category = self.category_of[key]
+            if category not in matched:
+                matched.append(category)
+        return matched
+
+    def suggest(self, prefix: str, limit: int = 10):
+        """
+        Returns up to `limit` suggestions: matching categories first, then
+        products whose title has a word starting with the last word typed
+        (and contains the earlier words), best rated first.
+        """
+        query = normalize(prefix)
+        if not query:
+            return []
+        limit = min(limit, self.max_results)
+
+        suggestions = [
+            {"text": category, "type": "category", "category": category}
+            for category in self._categories(query)
+        ][:limit]
+        for row in self._product_rows(query.split(" "), limit - len(suggestions)):
+            product = self.products[row]
+            suggestions.append({
+                "text": product.get("title", ""),
+                "type": "product",
+                "id": product.get("id"),
+                "category": product.get("category", ""),
+            })
+        return suggestions
+
+
+def _first_unique(rows, limit):
+    """
+    First `limit` distinct values of an ascending iterator.
+    """
+    if limit <= 0:
+        return []
+    result = []
+    for row in rows:
+        if not result or result[-1] != row:
+            result.append(row)
+            if len(result) == limit:
+                break
+    return result
+
+
+# (catalog version, index built from that snapshot)
+_built = (None, None)
+_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Returns the suggestion index, rebuilding it when the catalog snapshot has
+    changed since the last build (an inventory reload, a TTL refresh, or
+    recovery from fallback data).
+    """
+    global _built
+    snapshot = catalog.get_catalog()
+    version, index = _built
+    if index is None or version != snapshot.version:
+        with _lock:
+            version, index = _built
+            if index is None or version != snapshot.version:
+                index = SuggestIndex(snapshot.records, synonyms=database.CATEGORY_SYNONYMS)
+                _built = (snapshot.version, index)
+    return index
+
+
+def invalidate(rows=None):
+    global _built
+    _built = (None, None)
+
+
+database.on_inventory_change(invalidate)
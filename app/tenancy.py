@@ -0,0 +1,114 @@
+"""
+Tenant namespaces ("classroom mode").
+
+One deployment can serve many training cohorts. A request names its tenant
+with the X-Tenant-ID header or a `/t/{tenant}` path prefix (so the
+storefront works at `/t/{tenant}/`). Per-user data (`carts`, `users` and
+`orders`) then lives in the tenant's subcollections under
+`tenants/{tenant}/`, while the product catalog (`inventory`), its caches and
+the in-memory indexes are shared by every tenant.
+
+Subcollections keep their collection IDs, so the existing composite index on
+`orders` covers every tenant, and the cart sweeper reaches all tenants with
+one collection-group query. Requests without a tenant use the top-level
+collections, as before.
+"""
+import contextlib
+import contextvars
+import json
+import re
+
+from app import config
+
+_TENANT_ID = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+_PATH_PREFIX = re.compile(r"^/t/([^/]+)(/.*)?$")
+
+_current = contextvars.ContextVar("tenant", default=None)
+
+
+def current():
+    """
+    The tenant of the running request, or None for the default namespace.
+    """
+    return _current.get()
+
+
+def validate(tenant: str):
+    """
+    Returns the normalized tenant id. Raises ValueError if it isn't allowed.
+    """
+    tenant = tenant.strip().lower()
+    if not _TENANT_ID.match(tenant):
+        raise ValueError("Tenant ids are 1-63 lowercase letters, digits, '-' or '_'")
+    if config.TENANTS and tenant not in config.TENANTS:
+        raise ValueError(f"Unknown tenant: {tenant}")
+    return tenant
+
+
+@contextlib.contextmanager
+def use(tenant):
+    """
+    Runs a block as the given tenant (None for the default namespace).
+    """
+    token = _current.set(tenant)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def collection(client, name: str):
+    """
+    The current tenant's copy of a per-tenant collection.
+    """
+    tenant = _current.get()
+    if tenant is None:
+        return client.collection(name)
+    return client.collection(f"tenants/{tenant}/{name}")
+
+
+class TenantMiddleware:
+    """
+    Reads the tenant from a `/t/{tenant}` path prefix (which is stripped) or
+    the tenant header, and sets it for the rest of the request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.header = config.TENANT_HEADER.lower().encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tenant = None
+        match = _PATH_PREFIX.match(scope["path"])
+        if match:
+            tenant = match.group(1)
+            path = match.group(2) or "/"
+            scope = dict(scope, path=path, raw_path=path.encode())
+        else:
+            value = dict(scope["headers"]).get(self.header)
+            if value:
+                tenant = value.decode()
+
+        if tenant is None:
+            # Sub-requests (e.g. from /api/batch) keep their parent's tenant
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            tenant = validate(tenant)
+        except ValueError as e:
+            body = json.dumps({"detail": str(e)}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 400,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        with use(tenant):
+            await self.app(scope, receive, send)
@@ -0,0 +1,85 @@
+"""
+Login throughput benchmark.
+
+Runs the API in-process against the in-memory datastore, creates test
+accounts, then fires concurrent logins and reports throughput and latency.
+A probe request to a cheap endpoint runs alongside the logins: since hashing
+happens on the hashing pool, its latency should stay low however many logins
+are queued.
+
+    python benchmark_login.py --users 50 --logins 400 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("DATASTORE", "memory")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx  # noqa: E402
+
+from app import config  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def _probe(client, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/api/")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+async def run(users: int, logins: int, concurrency: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        names = [f"bench-user-{i}" for i in range(users)]
+        await asyncio.gather(*[
+            client.post("/api/users", json={"username": name, "password": f"pw-{name}"}) for name in names
+        ])
+
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, probe_latencies, failures = [], [], 0
+
+        async def login(i):
+            nonlocal failures
+            name = names[i % users]
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/api/login", json={"username": name, "password": f"pw-{name}"})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    failures += 1
+
+        stop = asyncio.Event()
+        probe = asyncio.ensure_future(_probe(client, stop, probe_latencies))
+        start = time.perf_counter()
+        await asyncio.gather(*[login(i) for i in range(logins)])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await probe
+
+    print(f"scrypt N={config.AUTH_SCRYPT_N} r={config.AUTH_SCRYPT_R} p={config.AUTH_SCRYPT_P}, "
+          f"{config.AUTH_HASH_WORKERS} hashing workers, concurrency {concurrency}")
+    print(f"{logins} logins in {elapsed:.2f}s: {logins / elapsed:.1f} logins/s, {failures} failed")
+    print(f"login latency  p50 {_percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p99 {_percentile(latencies, 99) * 1000:.1f} ms")
+    if probe_latencies:
+        print(f"probe latency  p50 {statistics.median(probe_latencies) * 1000:.1f} ms, "
+              f"max {max(probe_latencies) * 1000:.1f} ms ({len(probe_latencies)} probes)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.logins, args.concurrency))
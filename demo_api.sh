@@ -92,18 +92,26 @@ run_api_call "Get Full Cart Details" "GET" "/api/cart/$USER_ID"
 run_api_call "Remove SKU-10001 from Cart" "POST" "/api/cart/remove" \
     "{\"user_id\": \"$USER_ID\", \"item_id\": \"SKU-10001\"}"
 
-# 11. Check Order Status (Mock)
-run_api_call "Check Order Status (Mock Order ID)" "GET" "/api/orders/ORDER-999"
+# 11. Checkout
+run_api_call "Checkout Cart" "POST" "/api/cart/checkout" \
+    "{\"user_id\": \"$USER_ID\"}"
+ORDER_ID=$(echo "$response" | sed -n 's/.*"order_id":"\([^"]*\)".*/\1/p')
 
-# 12. Return Mock Order
-run_api_call "Return Order" "POST" "/api/orders/ORDER-999/return" \
-    "{\"order_id\": \"ORDER-999\", \"reason\": \"Wrong size\"}"
+# 12. Check Order Status
+run_api_call "Check Order Status" "GET" "/api/orders/$ORDER_ID"
 
-# 13. Create User Account
+# 13. Order History
+run_api_call "List Order History" "GET" "/api/users/$USER_ID/orders"
+
+# 14. Return Order
+run_api_call "Return Order" "POST" "/api/orders/$ORDER_ID/return" \
+    "{\"reason\": \"Wrong size\"}"
+
+# 15. Create User Account
 run_api_call "Create User Account" "POST" "/api/users" \
     "{\"username\": \"$USER_ID\", \"password\": \"password123\"}"
 
-# 14. Login
+# 16. Login
 run_api_call "Login User" "POST" "/api/login" \
     "{\"username\": \"$USER_ID\", \"password\": \"password123\"}"
 
@@ -0,0 +1,5 @@
+import os
+
+# The unit tests issue many requests from one TestClient address; rate limiting
+# has its own tests in test_ratelimit.py.
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
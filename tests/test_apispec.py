@@ -0,0 +1,75 @@
+import gzip
+import json
+from fastapi.testclient import TestClient
+from app.main import app
+from app.apispec import Document, agent_profile
+
+client = TestClient(app)
+
+
+def test_openapi_served_gzipped_with_etag():
+    response = client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.headers["etag"].endswith('-gz"')
+    assert "/api/products/{item_id}" in response.json()["paths"]
+
+
+def test_openapi_not_modified():
+    etag = client.get("/openapi.json", headers={"Accept-Encoding": "identity"}).headers["etag"]
+    response = client.get("/openapi.json", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_agent_profile_leaves_out_admin_and_ui_routes():
+    full = client.get("/openapi.json").json()
+    agent = client.get("/openapi.json?profile=agent").json()
+    assert "/api/save_inventory" in full["paths"]
+    assert "/api/save_inventory" not in agent["paths"]
+    assert "/api/metrics" not in agent["paths"]
+    assert "/" not in agent["paths"]
+    assert "/api/cart/checkout" in agent["paths"]
+    # Models only used by admin routes are dropped too
+    assert "StockUpdateRequest" in full["components"]["schemas"]
+    assert "StockUpdateRequest" not in agent["components"]["schemas"]
+    assert "InventoryItem" in agent["components"]["schemas"]
+
+
+def test_unknown_profile():
+    assert client.get("/openapi.json?profile=mobile").status_code == 400
+
+
+def test_docs_still_served():
+    assert client.get("/docs").status_code == 200
+    assert client.get("/redoc").status_code == 200
+
+
+def test_document_negotiation():
+    document = Document({"openapi": "3.1.0", "paths": {}})
+    encoding, body, etag = document.negotiate("gzip;q=0, deflate")
+    assert encoding == "identity"
+    assert json.loads(body) == {"openapi": "3.1.0", "paths": {}}
+    encoding, body, gz_etag = document.negotiate("deflate, gzip")
+    assert encoding == "gzip"
+    assert json.loads(gzip.decompress(body)) == {"openapi": "3.1.0", "paths": {}}
+    assert gz_etag != etag
+
+
+def test_agent_profile_keeps_shared_schemas():
+    schema = {
+        "paths": {
+            "/a": {"get": {"tags": ["Admin"], "responses": {"200": {"$ref": "#/components/schemas/AdminOnly"}}}},
+            "/b": {"get": {"tags": ["Products"], "responses": {"200": {"$ref": "#/components/schemas/Item"}}}},
+        },
+        "components": {"schemas": {
+            "AdminOnly": {"properties": {"item": {"$ref": "#/components/schemas/Item"}}},
+            "Item": {"properties": {"tag": {"$ref": "#/components/schemas/Tag"}}},
+            "Tag": {},
+        }},
+    }
+    trimmed = agent_profile(schema)
+    assert list(trimmed["paths"]) == ["/b"]
+    assert sorted(trimmed["components"]["schemas"]) == ["Item", "Tag"]
+    assert "/a" in schema["paths"]
@@ -0,0 +1,192 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import auth, config, database, memstore
+from app.main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def cheap_scrypt():
+    # Keep the tests fast; the format records the parameters used
+    with patch.object(config, "AUTH_SCRYPT_N", 1024):
+        yield
+
+
+def test_hash_round_trip():
+    stored = auth.hash_password("s3cret")
+    assert stored.startswith("scrypt$1024$8$1$")
+    assert "s3cret" not in stored
+    assert auth.verify_password("s3cret", stored)
+    assert not auth.verify_password("wrong", stored)
+    # Salted: the same password hashes differently each time
+    assert auth.hash_password("s3cret") != stored
+
+
+def test_verify_password_rejects_garbage():
+    assert not auth.verify_password("x", "plaintext")
+    assert not auth.verify_password("x", "md5$1$2$3$aa$bb")
+
+
+def test_token_round_trip():
+    token = auth.issue_token("alice")
+    assert auth.verify_token(token) == "alice"
+
+
+def test_token_tampering_and_expiry():
+    token = auth.issue_token("alice")
+    payload, signature = token.split(".")
+    forged = auth.issue_token("mallory").split(".")[0] + "." + signature
+    with pytest.raises(auth.InvalidToken):
+        auth.verify_token(forged)
+    with pytest.raises(auth.InvalidToken):
+        auth.verify_token("not-a-token")
+
+    expired = auth.issue_token("alice", ttl=1)
+    with patch("app.auth.time.time", return_value=time.time() + 5):
+        with pytest.raises(auth.InvalidToken):
+            auth.verify_token(expired)
+
+
+def test_verified_tokens_are_cached():
+    token = auth.issue_token("alice")
+    auth._token_cache.clear()
+    assert auth.verify_token(token) == "alice"
+    with patch("app.auth.hmac.new") as mock_hmac:
+        assert auth.verify_token(token) == "alice"
+        mock_hmac.assert_not_called()
+
+
+def test_create_user_stores_only_the_hash():
+    store = memstore.Client()
+    with patch("app.database.db", store):
+        assert database.create_user("alice", auth.hash_password("pw"))
+        assert not database.create_user("alice", auth.hash_password("other"))
+        assert database.get_user("bob") is None
+        data = database.get_user("alice")
+        assert "password" not in data and auth.verify_password("pw", data["password_hash"])
+
+
+def test_legacy_plaintext_password_is_upgraded():
+    store = memstore.Client()
+    store.collection("users").document("old").set({"username": "old", "password": "pw"})
+    with patch("app.database.db", store):
+        assert client.post("/api/login", json={"username": "old", "password": "nope"}).status_code == 401
+        assert client.post("/api/login", json={"username": "old", "password": "pw"}).status_code == 200
+        data = store.collection("users").document("old").get().to_dict()
+        assert "password" not in data
+        assert client.post("/api/login", json={"username": "old", "password": "pw"}).status_code == 200
+
+
+def test_unknown_users_are_checked_against_a_dummy_hash():
+    store = memstore.Client()
+    with patch("app.database.db", store), patch("app.auth.verify_password", wraps=auth.verify_password) as verify:
+        assert client.post("/api/login", json={"username": "nobody", "password": "pw"}).status_code == 401
+        verify.assert_called_once()
+        assert verify.call_args.args[1].startswith("scrypt$1024$")
+
+
+def test_datastore_calls_stay_off_the_hashing_pool():
+    store = memstore.Client()
+    threads = []
+
+    def record(fn):
+        def wrapper(*args):
+            threads.append(threading.current_thread().name)
+            return fn(*args)
+        return wrapper
+
+    with patch("app.database.db", store), \
+            patch("app.database.get_user", record(database.get_user)), \
+            patch("app.database.create_user", record(database.create_user)):
+        assert client.post("/api/users", json={"username": "frank", "password": "pw"}).status_code == 200
+        assert client.post("/api/login", json={"username": "frank", "password": "pw"}).status_code == 200
+    assert len(threads) == 2
+    assert not any(name.startswith("auth-hash") for name in threads)
+
+
+def test_signup_and_login_endpoints():
+    store = memstore.Client()
+    with patch("app.database.db", store):
+        response = client.post("/api/users", json={"username": "carol", "password": "pw"})
+        assert response.status_code == 200
+        response = client.post("/api/users", json={"username": "carol", "password": "pw"})
+        assert response.status_code == 400
+
+        response = client.post("/api/login", json={"username": "carol", "password": "bad"})
+        assert response.status_code == 401
+        response = client.post("/api/login", json={"username": "carol", "password": "pw"})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["token_type"] == "bearer"
+        assert auth.verify_token(body["token"]) == "carol"
+
+
+def test_same_username_in_two_tenants():
+    store = memstore.Client()
+    with patch("app.database.db", store):
+        for tenant in ("class-a", "class-b"):
+            response = client.post(f"/t/{tenant}/api/users", json={"username": "alice", "password": tenant})
+            assert response.status_code == 200
+        assert not store.collection("users").document("alice").get().exists
+
+        response = client.post("/t/class-b/api/login", json={"username": "alice", "password": "class-a"})
+        assert response.status_code == 401
+        response = client.post("/t/class-b/api/login", json={"username": "alice", "password": "class-b"})
+        assert response.status_code == 200
+        assert auth.verify_token(response.json()["token"], tenant="class-b") == "alice"
+
+
+@patch("app.database.get_cart_details")
+def test_cart_authorization(mock_details):
+    mock_details.return_value = {"user_id": "alice", "items": [], "total_price": 0}
+    headers = {"Authorization": "Bearer " + auth.issue_token("alice")}
+
+    assert client.get("/api/cart/alice", headers=headers).status_code == 200
+    assert client.get("/api/cart/bob", headers=headers).status_code == 403
+    assert client.get("/api/cart/alice", headers={"Authorization": "Bearer junk"}).status_code == 401
+    # Guests without a token are allowed unless AUTH_REQUIRED is set
+    assert client.get("/api/cart/alice").status_code == 200
+    with patch.object(config, "AUTH_REQUIRED", True):
+        assert client.get("/api/cart/alice").status_code == 401
+        assert client.get("/api/cart/alice", headers=headers).status_code == 200
+
+
+def test_registered_users_need_their_token():
+    store = memstore.Client()
+    with patch("app.database.db", store):
+        database._known_users.clear()
+        assert client.get("/api/cart/dave").status_code == 200
+        assert client.post("/api/users", json={"username": "dave", "password": "pw"}).status_code == 200
+        headers = {"Authorization": "Bearer " + auth.issue_token("dave")}
+        assert client.get("/api/cart/dave").status_code == 401
+        assert client.post("/api/cart/checkout", json={"user_id": "dave"}).status_code == 401
+        assert client.get("/api/users/dave/orders").status_code == 401
+        assert client.get("/api/cart/dave", headers=headers).status_code == 200
+
+        # Accounts created by another instance are found in the datastore
+        store.collection("users").document("erin").set({"username": "erin"})
+        assert client.get("/api/cart/erin").status_code == 401
+
+
+def test_orders_are_checked_against_their_user():
+    store = memstore.Client()
+    store.collection("orders").document("ORDER-1").set(
+        {"order_id": "ORDER-1", "user_id": "alice", "status": "DELIVERED", "estimated_delivery": "soon"})
+    store.collection("users").document("alice").set({"username": "alice"})
+    alice = {"Authorization": "Bearer " + auth.issue_token("alice")}
+    bob = {"Authorization": "Bearer " + auth.issue_token("bob")}
+    with patch("app.database.db", store):
+        database._order_cache.clear()
+        database._known_users.clear()
+        assert client.get("/api/orders/ORDER-1").status_code == 401
+        assert client.get("/api/orders/ORDER-1", headers=bob).status_code == 403
+        assert client.post("/api/orders/ORDER-1/return", json={"reason": "x"}, headers=bob).status_code == 403
+        assert store.collection("orders").document("ORDER-1").get().to_dict()["status"] == "DELIVERED"
+        assert client.get("/api/orders/ORDER-1", headers=alice).json()["status"] == "DELIVERED"
+        assert client.post("/api/orders/ORDER-1/return", json={"reason": "x"}, headers=alice).status_code == 200
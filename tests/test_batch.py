@@ -0,0 +1,122 @@
+import time
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app import deadline
+from app.main import app
+
+client = TestClient(app)
+
+ITEM = {"id": "SKU-1", "category": "Golf", "title": "Golf Balls", "description": "", "price": 30.0,
+        "inventory_status": "IN_STOCK", "rating": 4.5, "image_url": ""}
+
+
+def slow_item(item_id):
+    time.sleep(0.2)
+    return dict(ITEM, id=item_id) if item_id != "SKU-404" else None
+
+
+@patch("app.database.get_inventory_item", side_effect=slow_item)
+def test_batch_runs_reads_concurrently(mock_get_item):
+    start = time.monotonic()
+    response = client.post("/api/batch", json={"requests": [
+        {"path": "/api/products/SKU-1"},
+        {"path": "/api/products/SKU-2"},
+        {"path": "/api/products/SKU-404"},
+    ]})
+    elapsed = time.monotonic() - start
+
+    assert response.status_code == 200
+    responses = response.json()["responses"]
+    assert [r["status"] for r in responses] == [200, 200, 404]
+    assert responses[1]["body"]["id"] == "SKU-2"
+    assert responses[2]["body"] == {"detail": "Item not found"}
+    assert elapsed < 0.5
+
+
+def slow_cart(user_id):
+    time.sleep(0.2)
+    return {"user_id": user_id, "items": [], "total_price": 0.0}
+
+
+def slow_order(order_id):
+    time.sleep(0.2)
+    return {"order_id": order_id, "status": "PROCESSING", "estimated_delivery": "2026-01-01"}
+
+
+@patch("app.database.get_order", side_effect=slow_order)
+@patch("app.database.get_cart_details", side_effect=slow_cart)
+def test_batch_runs_cart_and_order_reads_concurrently(mock_get_cart, mock_get_order):
+    start = time.monotonic()
+    response = client.post("/api/batch", json={"requests": [
+        {"path": "/api/cart/u1"},
+        {"path": "/api/cart/u2"},
+        {"path": "/api/orders/o1"},
+        {"path": "/api/orders/o2"},
+    ]})
+    elapsed = time.monotonic() - start
+
+    assert [r["status"] for r in response.json()["responses"]] == [200, 200, 200, 200]
+    # Datastore calls run off the event loop, so the sub-requests overlap
+    assert elapsed < 0.5
+
+
+@patch("app.database.get_cart_details")
+@patch("app.database.add_item_to_cart")
+def test_batch_keeps_writes_in_order(mock_add, mock_get_cart):
+    calls = []
+    mock_add.side_effect = lambda *args: calls.append("add") or {"items": {"SKU-1": 2}}
+    mock_get_cart.side_effect = lambda user_id: calls.append("get") or {"user_id": user_id, "items": [], "total_price": 0.0}
+
+    response = client.post("/api/batch", json={"requests": [
+        {"method": "POST", "path": "/api/cart/add", "body": {"user_id": "u1", "item_id": "SKU-1", "quantity": 2}},
+        {"path": "/api/cart/u1"},
+    ]})
+
+    assert [r["status"] for r in response.json()["responses"]] == [200, 200]
+    assert calls == ["add", "get"]
+
+
+def test_batch_validates_sub_requests():
+    response = client.post("/api/batch", json={"requests": [
+        {"path": "/api/batch"},
+        {"path": "/static/index.html"},
+        {"method": "POST", "path": "/api/cart/add", "body": {"user_id": "u1"}},
+    ]})
+    statuses = [r["status"] for r in response.json()["responses"]]
+    assert statuses == [400, 400, 422]
+
+
+def test_batch_size_limit():
+    with patch("app.main.config.BATCH_MAX_REQUESTS", 2):
+        response = client.post("/api/batch", json={"requests": [{"path": "/api/"}] * 3})
+    assert response.status_code == 400
+
+
+@patch("app.database.get_inventory_item", side_effect=slow_item)
+def test_batch_time_limit(mock_get_item):
+    with patch("app.batch.config.BATCH_TIMEOUT_SECONDS", 0.05):
+        response = client.post("/api/batch", json={"requests": [
+            {"path": "/api/products/SKU-1"},
+            {"method": "POST", "path": "/api/cart/checkout", "body": {"user_id": "u1"}},
+        ]})
+    assert [r["status"] for r in response.json()["responses"]] == [504, 504]
+
+
+@patch("app.database.add_item_to_cart")
+def test_batch_writes_run_under_the_batch_deadline(mock_add):
+    seen = []
+
+    def add(*args):
+        seen.append(deadline.remaining())
+        time.sleep(0.1)
+        return {"items": {"SKU-1": 1}}
+
+    mock_add.side_effect = add
+    with patch("app.batch.config.BATCH_TIMEOUT_SECONDS", 0.05):
+        response = client.post("/api/batch", json={"requests": [
+            {"method": "POST", "path": "/api/cart/add", "body": {"user_id": "u1", "item_id": "SKU-1", "quantity": 1}},
+            {"path": "/api/products/SKU-1"},
+        ]})
+    # The write outlived the time limit but is reported as it happened
+    assert [r["status"] for r in response.json()["responses"]] == [200, 504]
+    assert 0 < seen[0] <= 0.05
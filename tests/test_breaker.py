@@ -0,0 +1,112 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import breaker, catalog, database, memstore
+from app.main import app
+
+client = TestClient(app)
+
+
+def _fail():
+    raise RuntimeError("unavailable")
+
+
+def test_opens_on_failures_and_closes_after_probe():
+    cb = breaker.CircuitBreaker("test", window=4, min_calls=4, failure_rate=0.5, open_seconds=10)
+    with patch("app.breaker.time.monotonic", return_value=100.0):
+        cb.call(lambda: 1)
+        cb.call(lambda: 1)
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                cb.call(_fail)
+        assert cb.state == breaker.OPEN
+        with pytest.raises(breaker.CircuitOpenError) as rejected:
+            cb.call(lambda: 1)
+        assert rejected.value.retry_after == 10
+    with patch("app.breaker.time.monotonic", return_value=111.0):
+        assert cb.state == breaker.HALF_OPEN
+        # A failed probe opens it again
+        with pytest.raises(RuntimeError):
+            cb.call(_fail)
+        assert cb.state == breaker.OPEN
+    with patch("app.breaker.time.monotonic", return_value=122.0):
+        assert cb.call(lambda: 2) == 2
+        assert cb.state == breaker.CLOSED
+    assert cb.stats["rejected"] == 1 and cb.stats["opened"] == 2
+
+
+def test_slow_calls_open_and_excluded_errors_dont():
+    cb = breaker.CircuitBreaker("test", window=4, min_calls=4, slow_call_seconds=1.0, excluded=(KeyError,))
+    for _ in range(4):
+        with pytest.raises(KeyError):
+            cb.call(lambda: {}["x"])
+    assert cb.state == breaker.CLOSED
+
+    times = iter([0.0, 2.0] * 4)
+    with patch("app.breaker.time.monotonic", side_effect=lambda: next(times, 2.0)):
+        for _ in range(2):
+            cb.call(lambda: 1)
+        assert cb.state == breaker.OPEN
+
+
+def test_nested_calls_count_once():
+    cb = breaker.CircuitBreaker("test")
+    assert cb.call(lambda: cb.call(lambda: 3)) == 3
+    assert cb.stats["calls"] == 1
+
+
+def test_catalog_reads_fall_back_to_last_known_good():
+    store = memstore.Client()
+    with patch("app.database.db", store), patch.dict(database._last_known_good):
+        assert database.save_inventory_from_csv()
+        item_id = database.get_all_products()[0]["id"]
+        broken = MagicMock()
+        broken.collection.side_effect = RuntimeError("deadline exceeded")
+        with patch("app.database.db", broken):
+            response = client.get(f"/api/products/{item_id}")
+            assert response.status_code == 200
+            assert response.json()["id"] == item_id
+            assert response.headers["x-data-source"] == "snapshot"
+            assert response.headers["warning"].startswith("110")
+            assert int(response.headers["age"]) >= 0
+        assert "warning" not in client.get(f"/api/products/{item_id}").headers
+
+
+def test_csv_fallback_without_datastore():
+    with patch("app.database.db", None), patch.dict(database._last_known_good, {"products": None}):
+        response = client.get("/api/products/categories")
+    assert response.status_code == 200
+    assert "Footwear" in response.json()
+    assert response.headers["x-data-source"] == "csv"
+    assert "age" not in response.headers
+
+
+def test_catalog_keeps_snapshot_while_degraded():
+    with patch("app.database.get_all_products", return_value=[{"id": "SKU-1", "price": 1.0}]):
+        catalog.invalidate()
+        with breaker.track_stale() as stale:
+            assert catalog.get_catalog().ids == ["SKU-1"]
+        assert not stale
+
+    def fallback():
+        breaker.mark_stale("snapshot", 0.0)
+        return [{"id": "SKU-2", "price": 2.0}]
+
+    with patch("app.database.get_all_products", side_effect=fallback):
+        catalog.invalidate()
+        with breaker.track_stale() as stale:
+            assert catalog.get_catalog().ids == ["SKU-1"]
+        assert stale["source"] == "snapshot"
+    catalog.invalidate()
+
+
+def test_writes_fail_fast_while_open():
+    cb = breaker.CircuitBreaker("test", window=1, min_calls=1, open_seconds=30)
+    with pytest.raises(RuntimeError):
+        cb.call(_fail)
+    with patch("app.database.db", memstore.Client()), patch("app.database.datastore_breaker", cb):
+        response = client.post("/api/cart/add", json={"user_id": "u1", "item_id": "SKU-1", "quantity": 1})
+    assert response.status_code == 503
+    assert 29 <= int(response.headers["retry-after"]) <= 30
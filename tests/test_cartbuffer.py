@@ -0,0 +1,86 @@
+import time
+from unittest.mock import patch
+from app import database, memstore
+from app.cartbuffer import CartBuffer
+
+class FakeCarts:
+    def __init__(self):
+        self.docs = {}
+        self.reads = 0
+        self.writes = 0
+
+    def load(self, user_id):
+        self.reads += 1
+        return dict(self.docs.get(user_id, {}))
+
+    def store(self, user_id, items):
+        self.writes += 1
+        self.docs[user_id] = dict(items)
+
+def make_buffer(**kwargs):
+    carts = FakeCarts()
+    return carts, CartBuffer(carts.load, carts.store, **kwargs)
+
+def test_burst_of_mutations_is_one_write():
+    carts, buffer = make_buffer(window=60)
+    buffer.add("u1", "SKU-1", 1)
+    buffer.add("u1", "SKU-1", 2)
+    buffer.add("u1", "SKU-2", 1)
+    assert buffer.remove("u1", "SKU-2") == {"SKU-1": 3}
+    assert buffer.remove("u1", "SKU-9") is None
+    # Reads reflect the user's own writes before anything is flushed
+    assert buffer.get("u1") == {"SKU-1": 3}
+    assert carts.writes == 0
+    assert carts.reads == 1
+
+    buffer.flush("u1")
+    assert carts.writes == 1
+    assert carts.docs["u1"] == {"SKU-1": 3}
+    assert buffer.stats == {"mutations": 4, "writes": 1}
+
+def test_flush_due_respects_window_and_evicts_idle_carts():
+    carts, buffer = make_buffer(window=10, idle_ttl=20)
+    buffer.add("u1", "SKU-1", 1)
+    now = time.monotonic()
+    buffer.flush_due(now)
+    assert carts.writes == 0
+    buffer.flush_due(now + 11)
+    assert carts.writes == 1
+    buffer.flush_due(now + 31)
+    # Evicted: the next read loads from the store again
+    assert buffer.get("u1") == {"SKU-1": 1}
+    assert carts.reads == 2
+
+def test_background_flusher():
+    carts, buffer = make_buffer(window=0.02)
+    buffer.add("u1", "SKU-1", 1)
+    deadline = time.monotonic() + 2
+    while carts.writes == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert carts.docs["u1"] == {"SKU-1": 1}
+    buffer.flush_all()
+
+def test_hold_flushes_and_drops_the_buffered_cart():
+    carts, buffer = make_buffer(window=60)
+    buffer.add("u1", "SKU-1", 1)
+    with buffer.hold("u1"):
+        assert carts.docs["u1"] == {"SKU-1": 1}
+        carts.docs["u1"] = {}  # e.g. checkout cleared it
+    assert buffer.get("u1") == {}
+
+def test_checkout_flushes_buffered_cart():
+    store = memstore.Client()
+    store.collection("inventory").document("SKU-1").set({"id": "SKU-1"})
+
+    with patch('app.database.db', store):
+        buffer = CartBuffer(database._load_cart_items, database._store_cart_items, window=60)
+        with patch('app.database.cart_buffer', buffer):
+            database.add_item_to_cart("u1", "SKU-1", 2)
+            database.add_item_to_cart("u1", "SKU-1", 1)
+            assert database.get_cart("u1") == {"items": {"SKU-1": 3}}
+            assert not store.collection("carts").document("u1").get().exists
+
+            order = database.place_order("u1")
+            assert order["items"] == {"SKU-1": 3}
+            assert database.get_cart("u1") == {"items": {}}
+            assert buffer.stats["writes"] == 1
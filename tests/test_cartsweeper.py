@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from app import database, memstore
+from app.cartsweeper import CartSweeper
+
+
+def _carts(store):
+    return {doc.id: doc.to_dict() for doc in store.collection("carts").stream()}
+
+
+def test_cart_writes_stamp_expiry():
+    store = memstore.Client()
+    with patch('app.database.db', store):
+        database.add_item_to_cart("u1", "SKU-1", 2)
+        cart = _carts(store)["u1"]
+        assert cart["items"] == {"SKU-1": 2}
+        assert isinstance(cart["last_modified"], datetime)
+        assert cart["expires_at"] > datetime.now(timezone.utc) + timedelta(days=6)
+
+
+def test_emptied_carts_are_deleted():
+    store = memstore.Client()
+    with patch('app.database.db', store):
+        database.add_item_to_cart("u1", "SKU-1", 1)
+        database.remove_item_from_cart("u1", "SKU-1")
+        assert "u1" not in _carts(store)
+        assert database.get_cart("u1") == {"items": {}}
+
+        database.add_item_to_cart("u2", "SKU-1", 1)
+        database.clear_cart("u2")
+        assert "u2" not in _carts(store)
+
+
+def test_checkout_deletes_cart():
+    store = memstore.Client()
+    store.collection("inventory").document("SKU-1").set({"id": "SKU-1", "price": 10.0})
+    with patch('app.database.db', store):
+        database.add_item_to_cart("u1", "SKU-1", 1)
+        database.place_order("u1")
+        assert "u1" not in _carts(store)
+
+
+def test_sweep_deletes_only_expired_carts():
+    store = memstore.Client()
+    now = datetime.now(timezone.utc)
+    for i in range(23):
+        store.collection("carts").document(f"old{i}").set({"items": {"A": 1}, "expires_at": now - timedelta(hours=1)})
+    store.collection("carts").document("live").set({"items": {"A": 1}, "expires_at": now + timedelta(days=1)})
+    # Carts from before expiry stamping are left alone
+    store.collection("carts").document("legacy").set({"items": {"A": 1}})
+
+    sweeper = CartSweeper(lambda: store, batch_size=5, parallelism=2, max_rate=0)
+    assert sweeper.sweep(now) == 23
+    assert set(_carts(store)) == {"live", "legacy"}
+    assert sweeper.stats == {"sweeps": 1, "reclaimed": 23, "errors": 0}
+    assert sweeper.sweep(now) == 0
+
+
+def test_sweep_keeps_carts_written_after_the_query():
+    store = memstore.Client()
+    now = datetime.now(timezone.utc)
+    for i in range(3):
+        store.collection("carts").document(f"old{i}").set({"items": {"A": 1}, "expires_at": now - timedelta(hours=1)})
+
+    sweeper = CartSweeper(lambda: store, batch_size=5, parallelism=1, max_rate=0)
+    delete = sweeper._delete
+
+    def user_returns(client, snapshots):
+        # The user adds an item after the sweep query read the cart
+        store.collection("carts").document("old1").set({"items": {"A": 2}, "expires_at": now + timedelta(days=7)})
+        return delete(client, snapshots)
+
+    with patch.object(sweeper, "_delete", side_effect=user_returns):
+        assert sweeper.sweep(now) == 2
+    assert _carts(store)["old1"]["items"] == {"A": 2}
+    assert set(_carts(store)) == {"old1"}
+
+
+def test_sweep_paces_deletes():
+    store = memstore.Client()
+    now = datetime.now(timezone.utc)
+    for i in range(20):
+        store.collection("carts").document(f"old{i}").set({"expires_at": now - timedelta(hours=1)})
+    sweeper = CartSweeper(lambda: store, batch_size=5, parallelism=2, max_rate=100)
+    with patch.object(sweeper._stop, "wait", return_value=False) as mock_wait:
+        assert sweeper.sweep(now) == 20
+    # Two pages of 10: a pause of about 10 / 100 seconds between them
+    waited = mock_wait.call_args[0][0]
+    assert 0 < waited <= 0.1
+
+
+def test_sweep_without_datastore():
+    assert CartSweeper(lambda: None).sweep() == 0
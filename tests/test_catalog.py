@@ -0,0 +1,144 @@
+import time
+from unittest.mock import patch
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app import catalog
+from app.catalog import Catalog
+
+client = TestClient(app)
+
+PRODUCTS = [
+    {"id": "SKU-1", "category": "Running", "title": "Trail Shoe", "description": "", "price": 120.0,
+     "inventory_status": "IN_STOCK", "rating": 4.5, "image_url": ""},
+    {"id": "SKU-2", "category": "Tennis", "title": "Racket", "description": "", "price": 80.0,
+     "inventory_status": "LOW_STOCK", "rating": 4.8, "image_url": ""},
+    {"id": "SKU-3", "category": "Running", "title": "Armband", "description": "", "price": 15.0,
+     "inventory_status": "OUT_OF_STOCK", "rating": 3.9, "image_url": ""},
+    {"id": "SKU-4", "category": "Golf", "title": "Golf Balls", "description": "", "price": 30.0,
+     "inventory_status": "IN_STOCK", "rating": 4.5, "image_url": ""},
+]
+
+
+@pytest.fixture
+def loaded_catalog():
+    with patch("app.catalog.database.get_all_products", return_value=PRODUCTS) as mock_load:
+        catalog.invalidate()
+        yield mock_load
+    catalog.invalidate()
+
+
+def ids(items):
+    return [item["id"] for item in items]
+
+
+def test_filter_by_categories_and_price():
+    total, items = Catalog(PRODUCTS).filter(categories=["Running", "Golf"], max_price=100)
+    assert total == 2
+    assert ids(items) == ["SKU-3", "SKU-4"]
+
+
+def test_filter_by_status_and_rating():
+    total, items = Catalog(PRODUCTS).filter(statuses=["IN_STOCK", "LOW_STOCK"], min_rating=4.6)
+    assert ids(items) == ["SKU-2"]
+
+
+def test_unknown_category_matches_nothing():
+    assert Catalog(PRODUCTS).filter(categories=["Curling"]) == (0, [])
+
+
+def test_sorts_are_stable():
+    cat = Catalog(PRODUCTS)
+    assert ids(cat.filter(sort="price_asc")[1]) == ["SKU-3", "SKU-4", "SKU-2", "SKU-1"]
+    assert ids(cat.filter(sort="rating_desc")[1]) == ["SKU-2", "SKU-1", "SKU-4", "SKU-3"]
+    assert ids(cat.filter(sort="title_asc")[1]) == ["SKU-3", "SKU-4", "SKU-2", "SKU-1"]
+
+
+def test_pagination_reports_total():
+    total, items = Catalog(PRODUCTS).filter(sort="price_desc", offset=1, limit=2)
+    assert total == 4
+    assert ids(items) == ["SKU-2", "SKU-4"]
+
+
+def test_large_catalog_filter_is_fast():
+    n = 200_000
+    rng = np.random.default_rng(0)
+    records = [
+        {"id": f"SKU-{i}", "category": f"Cat{i % 20}", "title": f"Item {i}", "price": float(p),
+         "rating": float(r), "inventory_status": "IN_STOCK" if i % 3 else "LOW_STOCK"}
+        for i, (p, r) in enumerate(zip(rng.uniform(1, 500, n), rng.uniform(1, 5, n)))
+    ]
+    cat = Catalog(records)
+
+    start = time.perf_counter()
+    total, items = cat.filter(categories=["Cat1", "Cat7"], min_price=50, max_price=200,
+                              min_rating=4.0, statuses=["IN_STOCK"], sort="price_asc", limit=20)
+    elapsed = time.perf_counter() - start
+
+    assert total > 0
+    assert [i["price"] for i in items] == sorted(i["price"] for i in items)
+    assert elapsed < 0.1
+
+
+def test_catalog_is_rebuilt_after_inventory_reload(loaded_catalog):
+    first = catalog.get_catalog()
+    assert catalog.get_catalog() is first
+    assert loaded_catalog.call_count == 1
+
+    catalog.invalidate([])
+    assert catalog.get_catalog() is not first
+    assert catalog.get_catalog().version == first.version + 1
+
+
+def test_filter_endpoint(loaded_catalog):
+    response = client.get("/api/products/filter?categories=running,golf&status=in_stock&sort=price_asc")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 2
+    assert ids(body["items"]) == ["SKU-4", "SKU-1"]
+
+
+def test_filter_endpoint_rejects_unknown_sort(loaded_catalog):
+    response = client.get("/api/products/filter?sort=cheapest")
+    assert response.status_code == 400
+
+
+def test_partial_sort_keeps_tie_order():
+    cat = Catalog(PRODUCTS)
+    rows = cat.select()
+    # SKU-1 and SKU-4 tie on rating; the page boundary falls between them
+    assert ids(cat.materialize(cat.sort_rows(rows, "rating_desc", k=2))) == ["SKU-2", "SKU-1"]
+    assert ids(cat.filter(sort="rating_desc", offset=2, limit=1)[1]) == ["SKU-4"]
+
+
+def test_title_query():
+    total, items = Catalog(PRODUCTS).filter(q="  golf ")
+    assert ids(items) == ["SKU-4"]
+
+
+def test_facets_count_matching_rows():
+    facets = Catalog(PRODUCTS).facets(max_price=100)
+    assert facets["category"] == {"Golf": 1, "Running": 1, "Tennis": 1}
+    assert facets["inventory_status"] == {"IN_STOCK": 1, "LOW_STOCK": 1, "OUT_OF_STOCK": 1}
+    assert [b["count"] for b in facets["price"]] == [1, 1, 1, 0, 0]
+    assert facets["price"][0] == {"label": "Under $25", "min": None, "max": 25.0, "count": 1}
+    assert facets["rating"][-1]["label"] == "4.5 and up"
+    assert [b["count"] for b in facets["rating"]] == [0, 1, 0, 2]
+
+
+def test_facets_are_cached_per_query():
+    cat = Catalog(PRODUCTS)
+    first = cat.facets(categories=["Running", "Golf"], q="Ball")
+    assert cat.facets(categories=["Golf", "Running"], q="ball ") is first
+    assert cat.facets(categories=["Golf"]) is not first
+
+
+def test_filter_endpoint_with_facets(loaded_catalog):
+    response = client.get("/api/products/filter?categories=running&facets=true&limit=1")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 2
+    assert len(body["items"]) == 1
+    assert body["facets"]["category"] == {"Running": 2}
+    assert body["facets"]["inventory_status"] == {"IN_STOCK": 1, "OUT_OF_STOCK": 1}
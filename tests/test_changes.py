@@ -0,0 +1,114 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import config, database, memstore
+from app.main import app
+
+client = TestClient(app)
+
+
+def _row(item_id, price=10.0, status="IN_STOCK"):
+    return {"id": item_id, "category": "Golf", "title": f"Ball {item_id}", "description": "", "price": price,
+            "inventory_status": status, "rating": 4.0, "image_url": ""}
+
+
+@pytest.fixture
+def store():
+    store = memstore.Client()
+    with patch("app.database.db", store), patch.dict(database._last_known_good):
+        yield store
+
+
+def _load(rows):
+    with patch("app.database._read_inventory_csv", return_value=rows):
+        assert database.save_inventory_from_csv()
+
+
+def _sync(since, limit=100):
+    changes, cursor = [], None
+    while True:
+        response = client.get("/api/products/changes", params={"since": since, "limit": limit, "cursor": cursor})
+        assert response.status_code == 200
+        body = response.json()
+        changes += body["changes"]
+        cursor = body["next_cursor"]
+        if not cursor:
+            return body["version"], changes
+
+
+def test_reload_versions_only_what_changed(store):
+    _load([_row("SKU-1"), _row("SKU-2"), _row("SKU-3")])
+    version, changes = _sync(0)
+    assert version == 1
+    assert [(c["id"], c["version"], c["deleted"]) for c in changes] == [
+        ("SKU-1", 1, False), ("SKU-2", 1, False), ("SKU-3", 1, False)]
+    assert store.collection("inventory").document("SKU-1").get().to_dict()["catalog_version"] == 1
+
+    # Same file again: a new version, but nothing to sync
+    _load([_row("SKU-1"), _row("SKU-2"), _row("SKU-3")])
+    assert _sync(1) == (2, [])
+
+    _load([_row("SKU-1"), _row("SKU-2", price=12.0), _row("SKU-4")])
+    version, changes = _sync(2)
+    assert version == 3
+    assert {c["id"]: c["deleted"] for c in changes} == {"SKU-2": False, "SKU-3": True, "SKU-4": False}
+    assert next(c for c in changes if c["id"] == "SKU-2")["item"]["price"] == 12.0
+    assert not store.collection("inventory").document("SKU-3").get().exists
+
+
+def test_stock_updates_bump_the_version(store):
+    _load([_row("SKU-1"), _row("SKU-2")])
+    assert database.set_stock_level("SKU-2", 0)
+    version, changes = _sync(1)
+    assert version == 2
+    assert [(c["id"], c["item"]["stock_quantity"]) for c in changes] == [("SKU-2", 0)]
+    assert changes[0]["item"]["inventory_status"] == "OUT_OF_STOCK"
+
+
+def test_pages_are_pinned_to_the_first_version(store):
+    _load([_row(f"SKU-{i}") for i in range(5)])
+    first = client.get("/api/products/changes", params={"limit": 2}).json()
+    assert len(first["changes"]) == 2
+    # A write between pages doesn't leak into this sync
+    database.set_stock_level("SKU-0", 3)
+    cursor, ids = first["next_cursor"], [c["id"] for c in first["changes"]]
+    while cursor:
+        page = client.get("/api/products/changes", params={"limit": 2, "cursor": cursor}).json()
+        assert page["version"] == 1
+        ids += [c["id"] for c in page["changes"]]
+        cursor = page["next_cursor"]
+    assert ids == [f"SKU-{i}" for i in range(5)]
+    # ...and is picked up by the next one
+    version, changes = _sync(1)
+    assert (version, [c["id"] for c in changes]) == (2, ["SKU-0"])
+
+
+def test_committed_version_waits_for_earlier_writes(store):
+    # Two instances: version 1 is still being written when version 2 finishes
+    first = database._allocate_catalog_version(store.transaction())
+    second = database._allocate_catalog_version(store.transaction())
+    database._release_catalog_version(store.transaction(), second)
+    assert database.catalog_version() == 0
+    database._release_catalog_version(store.transaction(), first)
+    assert database.catalog_version() == 2
+
+
+def test_abandoned_write_stops_holding_back_syncs(store):
+    database._allocate_catalog_version(store.transaction())  # its instance dies
+    later = database._allocate_catalog_version(store.transaction())
+    database._release_catalog_version(store.transaction(), later)
+    assert database.catalog_version() == 0
+    # Once its lease runs out, the next catalog write moves syncs past it
+    later_on = time.time() + config.CATALOG_WRITE_LEASE_SECONDS + 1
+    with patch.object(database.time, "time", return_value=later_on):
+        database._release_catalog_version(store.transaction(), database._allocate_catalog_version(store.transaction()))
+    assert database.catalog_version() == 3
+
+
+def test_invalid_requests(store):
+    _load([_row("SKU-1")])
+    assert client.get("/api/products/changes", params={"since": 5}).status_code == 400
+    assert client.get("/api/products/changes", params={"cursor": "bogus"}).status_code == 400
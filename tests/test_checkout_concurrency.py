@@ -0,0 +1,51 @@
+import threading
+from unittest.mock import patch
+from app import database, memstore
+
+INITIAL_STOCK = 10
+BUYERS = 40
+
+def test_concurrent_checkouts_never_oversell():
+    # A small simulated RPC latency makes the transactions interleave
+    store = memstore.Client(latency=0.001)
+    store.collection("inventory").document("SKU-HOT").set({"id": "SKU-HOT"})
+    for i in range(BUYERS):
+        store.collection("carts").document(f"user{i}").set({"items": {"SKU-HOT": 1}})
+
+    results = {"ok": [], "out_of_stock": 0, "contention": 0}
+    lock = threading.Lock()
+    start = threading.Barrier(BUYERS)
+
+    def buy(user_id):
+        start.wait()
+        try:
+            order = database.place_order(user_id)
+            with lock:
+                results["ok"].append((user_id, order["order_id"]))
+        except database.OutOfStockError:
+            with lock:
+                results["out_of_stock"] += 1
+        except database.CheckoutContentionError:
+            with lock:
+                results["contention"] += 1
+
+    with patch('app.database.db', store):
+        database.set_stock_level("SKU-HOT", INITIAL_STOCK, shards=4)
+        threads = [threading.Thread(target=buy, args=(f"user{i}",)) for i in range(BUYERS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        sold = len(results["ok"])
+        database._stock_cache.clear()
+        remaining = database.get_inventory_item("SKU-HOT")["stock_quantity"]
+
+        assert sold + results["out_of_stock"] + results["contention"] == BUYERS
+        assert 0 < sold <= INITIAL_STOCK
+        assert remaining == INITIAL_STOCK - sold
+        assert len(list(store.collection("orders").stream())) == sold
+        for user_id, _ in results["ok"]:
+            assert database.get_cart(user_id) == {"items": {}}
+        # Buyers that were turned away keep their carts
+        assert sum(1 for i in range(BUYERS) if database.get_cart(f"user{i}")["items"]) == BUYERS - sold
@@ -1,6 +1,8 @@
+import time
 import unittest
+from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch
-from app import database
+from app import database, memstore
 
 class TestDatabase(unittest.TestCase):
 
@@ -50,5 +52,147 @@ class TestDatabase(unittest.TestCase):
         results_none = database.search_products("Swimming")
         self.assertEqual(len(results_none), 0)
 
+    def test_place_order_reserves_stock_and_clears_cart(self):
+        store = memstore.Client()
+        store.collection("inventory").document("SKU-1").set({"id": "SKU-1", "inventory_status": "IN_STOCK"})
+        store.collection("carts").document("user1").set({"items": {"SKU-1": 2}})
+
+        with patch('app.database.db', store):
+            database.set_stock_level("SKU-1", 12, shards=3)
+            order = database.place_order("user1")
+            self.assertEqual(order["user_id"], "user1")
+            self.assertEqual(order["items"], {"SKU-1": 2})
+            self.assertEqual(order["status"], "PROCESSING")
+            self.assertEqual(database.get_cart("user1"), {"items": {}})
+            self.assertEqual(database.get_inventory_item("SKU-1")["stock_quantity"], 10)
+            self.assertEqual(database.get_inventory_item("SKU-1")["inventory_status"], "LOW_STOCK")
+            self.assertTrue(store.collection("orders").document(order["order_id"]).get().exists)
+
+    def test_place_order_rejects_insufficient_stock_without_writes(self):
+        store = memstore.Client()
+        store.collection("inventory").document("SKU-1").set({"id": "SKU-1"})
+        store.collection("inventory").document("SKU-2").set({"id": "SKU-2"})
+        store.collection("carts").document("user1").set({"items": {"SKU-1": 1, "SKU-2": 3}})
+
+        with patch('app.database.db', store):
+            database.set_stock_level("SKU-1", 5)
+            database.set_stock_level("SKU-2", 2, shards=2)
+            with self.assertRaises(database.OutOfStockError) as ctx:
+                database.place_order("user1")
+            self.assertEqual(ctx.exception.item_ids, ["SKU-2"])
+            self.assertEqual(database.get_inventory_item("SKU-1")["stock_quantity"], 5)
+            self.assertEqual(database.get_cart("user1"), {"items": {"SKU-1": 1, "SKU-2": 3}})
+            with self.assertRaises(database.CartEmptyError):
+                database.place_order("user2")
+
+    def test_checkout_drains_stock_across_shards(self):
+        store = memstore.Client()
+        store.collection("inventory").document("SKU-1").set({"id": "SKU-1"})
+        store.collection("carts").document("user1").set({"items": {"SKU-1": 7}})
+
+        with patch('app.database.db', store):
+            database.set_stock_level("SKU-1", 8, shards=4)  # 2 per shard
+            database.place_order("user1")
+            item = database.get_inventory_item("SKU-1")
+            self.assertEqual(item["stock_quantity"], 1)
+            self.assertEqual(item["inventory_status"], "LOW_STOCK")
+
+    def test_stock_levels_are_cached(self):
+        store = memstore.Client()
+        store.collection("inventory").document("SKU-1").set({"id": "SKU-1", "inventory_status": "IN_STOCK"})
+
+        with patch('app.database.db', store):
+            database.set_stock_level("SKU-1", 0, shards=2)
+            with patch.object(store, 'get_all', wraps=store.get_all) as get_all:
+                self.assertEqual(database.get_inventory_item("SKU-1")["inventory_status"], "OUT_OF_STOCK")
+                get_all.assert_not_called()
+                database._stock_cache.clear()
+                self.assertEqual(database.get_inventory_item("SKU-1")["stock_quantity"], 0)
+                get_all.assert_called_once()
+
+    def test_get_inventory_items_in_one_round_trip(self):
+        store = memstore.Client()
+        for item_id in ("SKU-1", "SKU-2", "SKU-3"):
+            store.collection("inventory").document(item_id).set({"id": item_id, "inventory_status": "IN_STOCK"})
+
+        with patch('app.database.db', store):
+            with patch.object(store, 'get_all', wraps=store.get_all) as get_all:
+                items, missing = database.get_inventory_items(["SKU-3", "SKU-404", "SKU-1", "SKU-3"])
+                get_all.assert_called_once()
+        self.assertEqual([i["id"] for i in items], ["SKU-3", "SKU-1"])
+        self.assertEqual(missing, ["SKU-404"])
+
+    def test_inventory_load_keeps_batches_under_the_write_limit(self):
+        store = memstore.Client()
+        rows = [{"id": f"SKU-{i}", "category": "Golf", "title": "Ball", "description": "", "price": 1.0,
+                 "inventory_status": "IN_STOCK", "rating": 4.0, "image_url": ""} for i in range(35)]
+        # 3 items of 102 writes, 31 of 3 (399 so far), then one more of 102
+        overrides = {"SKU-0": 100, "SKU-1": 100, "SKU-2": 100, "SKU-34": 100}
+
+        with patch('app.database.db', store), patch.dict(database._last_known_good), \
+                patch('app.database._read_inventory_csv', return_value=rows), \
+                patch('app.config.STOCK_SHARDS', 1), patch('app.config.STOCK_SHARD_OVERRIDES', overrides), \
+                patch.object(store, '_commit', wraps=store._commit) as commit:
+            self.assertTrue(database.save_inventory_from_csv())
+        sizes = [len(call.args[0]) for call in commit.call_args_list]
+        self.assertLessEqual(max(sizes), memstore.MAX_WRITES)
+        self.assertEqual(store.collection("inventory").document("SKU-34").get().to_dict()["stock_shards"], 100)
+
+    def test_split_stock(self):
+        self.assertEqual(database._split_stock(10, 4), [3, 3, 2, 2])
+        self.assertEqual(database._split_stock(0, 2), [0, 0])
+
+    def test_cart_mutations_return_updated_cart(self):
+        store = memstore.Client()
+        store.collection("inventory").document("SKU-1").set({"id": "SKU-1", "title": "Ball", "price": 5.0, "image_url": "img"})
+
+        with patch('app.database.db', store):
+            self.assertEqual(database.add_item_to_cart("user1", "SKU-1", 2), {"items": {"SKU-1": 2}})
+            self.assertEqual(database.add_item_to_cart("user1", "SKU-2", 1), {"items": {"SKU-1": 2, "SKU-2": 1}})
+            self.assertEqual(database.remove_item_from_cart("user1", "SKU-2"), {"items": {"SKU-1": 2}})
+            self.assertIsNone(database.remove_item_from_cart("user1", "SKU-2"))
+
+            details = database.enrich_cart("user1", {"SKU-1": 2, "SKU-404": 1})
+            self.assertEqual(details["total_price"], 10.0)
+            self.assertEqual([i["item_id"] for i in details["items"]], ["SKU-1"])
+            self.assertEqual(database.get_cart_details("user1"), details)
+
+    def test_order_cursor_round_trip(self):
+        order = {"order_id": "ORDER-1", "created_at": datetime(2024, 1, 1, 12, tzinfo=timezone.utc)}
+        cursor = database._encode_order_cursor(order)
+        self.assertEqual(database._decode_order_cursor(cursor), (order["created_at"], "ORDER-1"))
+        with self.assertRaises(ValueError):
+            database._decode_order_cursor("not-a-cursor")
+
+    def test_cached_orders_are_copies_and_expire(self):
+        store = memstore.Client()
+        store.collection("orders").document("ORDER-1").set({"order_id": "ORDER-1", "status": "PROCESSING"})
+
+        with patch('app.database.db', store), patch.object(database._order_cache, 'ttl', 0.05):
+            database._order_cache.clear()
+            order = database.get_order("ORDER-1")
+            order["status"] = "MUTATED"
+            self.assertEqual(database.get_order("ORDER-1")["status"], "PROCESSING")
+            # A status change made elsewhere is seen once the entry expires
+            store.collection("orders").document("ORDER-1").update({"status": "RETURN_INITIATED"})
+            time.sleep(0.06)
+            self.assertEqual(database.get_order("ORDER-1")["status"], "RETURN_INITIATED")
+
+    @patch('app.database.db')
+    def test_get_user_orders_pagination(self, mock_db):
+        created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        docs = [
+            MagicMock(to_dict=lambda i=i: {"order_id": f"ORDER-{i}", "created_at": created})
+            for i in range(3)
+        ]
+        query = mock_db.collection.return_value.where.return_value.order_by.return_value.order_by.return_value
+        query.limit.return_value.stream.return_value = docs
+
+        orders, next_cursor = database.get_user_orders("user1", limit=2)
+
+        query.limit.assert_called_once_with(3)
+        self.assertEqual([o["order_id"] for o in orders], ["ORDER-0", "ORDER-1"])
+        self.assertEqual(database._decode_order_cursor(next_cursor), (created, "ORDER-1"))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,118 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from google.api_core import exceptions as gcp_exceptions
+
+from app import breaker, config, database, deadline, memstore
+from app.hedging import Hedger
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_budget_by_route_class_and_override():
+    assert deadline.budget("GET", "/api/products/SKU-1") == config.DEADLINE_READ_SECONDS
+    assert deadline.budget("POST", "/api/cart/add") == config.DEADLINE_WRITE_SECONDS
+    assert deadline.budget("GET", "/api/save_inventory") == config.DEADLINE_ADMIN_SECONDS
+    overrides = deadline._parse_overrides("/api/cart=3, /api/cart/checkout=12,bad")
+    with patch.object(deadline, "_overrides", overrides):
+        assert deadline.budget("POST", "/api/cart/checkout") == 12
+        assert deadline.budget("POST", "/api/cart/add") == 3
+
+
+def test_options_follow_the_deadline():
+    assert deadline.options()["timeout"] == config.DATASTORE_TIMEOUT_SECONDS
+    with deadline.within(2):
+        opts = deadline.options()
+        assert 0 < opts["timeout"] <= 2
+        assert opts["retry"].timeout <= 2
+        assert deadline.options(retry=False)["retry"] is None
+        # A nested budget can only shorten the deadline
+        with deadline.within(60):
+            assert deadline.remaining() <= 2
+    with deadline.within(0):
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.options()
+
+
+@patch("app.database.get_inventory_item")
+def test_request_timeout_header(mock_item):
+    seen = []
+    mock_item.side_effect = lambda item_id: seen.append(deadline.remaining()) or {
+        "id": item_id, "title": "Ball", "category": "Basketball", "price": 1.0,
+        "rating": 4.0, "inventory_status": "IN_STOCK", "image_url": "", "description": "",
+    }
+    assert client.get("/api/products/SKU-1").status_code == 200
+    assert client.get("/api/products/SKU-1", headers={"X-Request-Timeout": "0.5"}).status_code == 200
+    assert 0.5 < seen[0] <= config.DEADLINE_READ_SECONDS
+    assert seen[1] <= 0.5
+
+
+def test_expired_budget_returns_504():
+    with patch("app.database.db", memstore.Client()), patch.object(config, "DEADLINE_MIN_SECONDS", 0):
+        response = client.get("/api/cart/u1", headers={"X-Request-Timeout": "0"})
+    assert response.status_code == 504
+
+
+@patch("app.database.get_inventory_item")
+def test_request_timeout_has_a_floor(mock_item):
+    seen = []
+    mock_item.side_effect = lambda item_id: seen.append(deadline.remaining()) or {
+        "id": item_id, "title": "Ball", "category": "Basketball", "price": 1.0,
+        "rating": 4.0, "inventory_status": "IN_STOCK", "image_url": "", "description": "",
+    }
+    assert client.get("/api/products/SKU-1", headers={"X-Request-Timeout": "0"}).status_code == 200
+    assert 0 < seen[0] <= config.DEADLINE_MIN_SECONDS
+
+
+def test_timeouts_from_the_callers_budget_dont_trip_the_breaker():
+    store = memstore.Client()
+    cb = breaker.CircuitBreaker(
+        "test", window=2, min_calls=2, failure_rate=1.0, excluded=database.datastore_breaker.excluded)
+
+    def timed_out(*args, **kwargs):
+        time.sleep(0.02)
+        raise gcp_exceptions.DeadlineExceeded("timed out")
+
+    with patch("app.database.db", store), patch.object(database, "datastore_breaker", cb), \
+            patch.object(database._order_cache, "get", return_value=None), \
+            patch.object(memstore.DocumentReference, "get", timed_out):
+        for _ in range(3):
+            with deadline.within(0.01), pytest.raises(deadline.DeadlineExceeded):
+                database.get_order("ORDER-1")
+        assert cb.state == breaker.CLOSED
+        # With budget left, a timeout is the datastore's and counts
+        for _ in range(2):
+            with deadline.within(5), pytest.raises(gcp_exceptions.DeadlineExceeded):
+                database.get_order("ORDER-1")
+        assert cb.state == breaker.OPEN
+
+
+def test_hedged_call_returns_the_faster_attempt():
+    hedger = Hedger(workers=4, min_delay=0.01, min_samples=1)
+    hedger.call("lookup", lambda: "warm")
+    release = threading.Event()
+    attempts = []
+
+    def lookup():
+        attempts.append(1)
+        if len(attempts) == 1:
+            release.wait(2)
+            return "slow"
+        return "fast"
+
+    start = time.monotonic()
+    assert hedger.call("lookup", lookup) == "fast"
+    assert time.monotonic() - start < 1
+    release.set()
+    assert hedger.stats()["lookup"] == {"calls": 2, "hedged": 1, "hedge_wins": 1}
+
+
+def test_no_hedging_without_history():
+    hedger = Hedger(workers=2, min_samples=5)
+    assert hedger.delay("lookup") is None
+    assert hedger.call("lookup", lambda x: x * 2, 21) == 42
+    assert hedger.stats()["lookup"]["hedged"] == 0
@@ -1,8 +1,13 @@
 import pytest
 from fastapi.testclient import TestClient
+from app import database
 from app.main import app
 import uuid
 
+# Catalog reads fall back to the inventory CSV without a datastore; writes
+# (and the inventory load) need Firestore, or DATASTORE=memory
+requires_datastore = pytest.mark.skipif(database.db is None, reason="No datastore available")
+
 # This fixture allows us to share the same client across tests if needed
 # and guarantees the app is imported correctly.
 @pytest.fixture
@@ -13,7 +18,6 @@ def client():
 # Generate a unique username for each run to avoid conflicts
 UNIQUE_USER = f"user_{uuid.uuid4().hex[:8]}"
 UNIQUE_PASS = "securepassword"
-ORDER_ID = "ORDER-123456" # Mocked, so ID doesn't need to exist in DB
 ITEM_ID = "SKU-10001" # Should exist after save_inventory
 
 def test_root(client):
@@ -21,6 +25,7 @@ def test_root(client):
     assert response.status_code == 200
     assert response.json() == {"message": "Welcome to the Cymbal Sports Mock API"}
 
+@requires_datastore
 def test_save_inventory(client):
     """
     Depending on permissions, this might fail in some environments if not authed.
@@ -42,7 +47,7 @@ def test_get_categories(client):
     print(f"\n[Integration] Found categories: {categories}")
 
 def test_get_top_products(client):
-    response = client.get("/api/products/top")
+    response = client.get("/api/products/top", params={"limit": 5})
     assert response.status_code == 200
     products = response.json()
     assert isinstance(products, list)
@@ -77,6 +82,7 @@ def test_get_product_details(client):
     product = response.json()
     assert product["id"] == item_id
 
+@requires_datastore
 def test_create_user(client):
     response = client.post("/api/users", json={"username": UNIQUE_USER, "password": UNIQUE_PASS})
     # If user already exists from previous failed run, handle gracefully or expect success
@@ -86,11 +92,13 @@ def test_create_user(client):
         assert response.status_code == 200
         assert response.json()["username"] == UNIQUE_USER
 
+@requires_datastore
 def test_login(client):
     response = client.post("/api/login", json={"username": UNIQUE_USER, "password": UNIQUE_PASS})
     assert response.status_code == 200
     assert "token" in response.json()
 
+@requires_datastore
 def test_cart_workflow(client):
     # 1. Add to cart
     # Need a valid item ID.
@@ -120,12 +128,30 @@ def test_cart_workflow(client):
     cart_after = remove_response.json()["cart"]
     assert item_id not in cart_after["items"]
 
-def test_order_mock_logic(client):
-    # These are mocked so they don't depend on DB state, but good to test integration of the endpoint
-    status_response = client.get(f"/api/orders/{ORDER_ID}")
+@requires_datastore
+def test_order_workflow(client):
+    top_response = client.get("/api/products/top")
+    products = top_response.json()
+    if not products:
+        pytest.skip("No products found for order test")
+
+    client.post("/api/cart/add", json={
+        "user_id": UNIQUE_USER,
+        "item_id": products[0]["id"],
+        "quantity": 1
+    })
+    checkout_response = client.post("/api/cart/checkout", json={"user_id": UNIQUE_USER})
+    assert checkout_response.status_code == 200
+    order_id = checkout_response.json()["order_id"]
+
+    status_response = client.get(f"/api/orders/{order_id}")
     assert status_response.status_code == 200
-    assert status_response.json()["order_id"] == ORDER_ID
-    
-    return_response = client.post(f"/api/orders/{ORDER_ID}/return", json={"reason": "Test return"})
+    assert status_response.json()["status"] == "PROCESSING"
+
+    history_response = client.get(f"/api/users/{UNIQUE_USER}/orders")
+    assert history_response.status_code == 200
+    assert history_response.json()["orders"][0]["order_id"] == order_id
+
+    return_response = client.post(f"/api/orders/{order_id}/return", json={"reason": "Test return"})
     assert return_response.status_code == 200
     assert return_response.json()["status"] == "RETURN_INITIATED"
@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+
+from app import loadgen, memstore
+
+
+def test_step_stats():
+    stats = loadgen.StepStats()
+    for ms in (0.5, 3, 3, 40, 2500):
+        stats.record(ms / 1000, 200, True)
+    stats.record(0.004, 500, False)
+    summary = stats.summary()
+    assert summary["requests"] == 6 and summary["errors"] == 1
+    assert summary["statuses"] == {"200": 5, "500": 1}
+    assert summary["histogram"]["<=1ms"] == 1
+    assert summary["histogram"]["<=5ms"] == 3
+    assert summary["histogram"]["<=5000ms"] == 1
+    assert summary["p50_ms"] == pytest.approx(4)
+
+
+def test_pacer_spaces_requests():
+    async def go():
+        pacer = loadgen.Pacer(200)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(21):
+            await pacer.wait()
+        return loop.time() - start
+
+    assert asyncio.run(go()) >= 0.09
+
+
+def test_load_scripts_validates(tmp_path):
+    path = tmp_path / "scripts.json"
+    path.write_text(json.dumps({"s": {"weight": 1, "steps": ["search", "teleport"]}}))
+    with pytest.raises(SystemExit):
+        loadgen.load_scripts(str(path))
+    path.write_text(json.dumps({"s": {"weight": 1, "steps": ["search", "product"]}}))
+    assert loadgen.load_scripts(str(path))["s"]["steps"] == ["search", "product"]
+
+
+def test_in_process_run():
+    args = argparse.Namespace(
+        url=None, users=4, duration=0.5, ramp_up=0, rate=0, think_time=0.01,
+        tenants=2, connections=10, timeout=10, seed=1,
+    )
+    scripts = {"purchase": loadgen.DEFAULT_SCRIPTS["purchase"]}
+    with patch('app.database.db', memstore.Client()):
+        report = asyncio.run(loadgen.run(args, scripts))
+    assert report["requests"] > 0
+    assert report["errors"] == 0
+    assert report["steps"]["checkout"]["requests"] > 0
+    assert report["steps"]["order_status"]["requests"] > 0
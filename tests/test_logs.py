@@ -0,0 +1,75 @@
+import json
+import logging
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app import logs, tenancy
+from app.main import app
+
+client = TestClient(app)
+
+
+def _record(msg="hello %s", args=("world",), **extra):
+    record = logging.makeLogRecord({"name": "app.test", "levelname": "WARNING", "msg": msg, "args": args})
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter():
+    record = _record(request_id="abc", tenant="alpha", item_id="SKU-1")
+    entry = json.loads(logs.JsonFormatter().format(record))
+    assert entry["message"] == "hello world"
+    assert entry["severity"] == "WARNING"
+    assert entry["logger"] == "app.test"
+    assert entry["request_id"] == "abc"
+    assert entry["tenant"] == "alpha"
+    assert entry["item_id"] == "SKU-1"
+
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        import sys
+        record = _record(exc_info=sys.exc_info())
+    assert "ValueError: boom" in json.loads(logs.JsonFormatter().format(record))["exception"]
+
+
+def test_queue_handler_captures_context():
+    handler = logs.ContextQueueHandler(None, tenant=tenancy.current)
+    token = logs.request_id.set("req-1")
+    try:
+        with tenancy.use("alpha"):
+            record = handler.prepare(_record())
+    finally:
+        logs.request_id.reset(token)
+    assert (record.request_id, record.tenant) == ("req-1", "alpha")
+    # Formatting is left to the listener thread
+    assert record.args == ("world",)
+
+
+def test_sampler():
+    sampler = logs.Sampler(burst=3, interval=10)
+    with patch("app.logs.time.monotonic", return_value=100.0):
+        passed = [sampler.filter(_record()) for _ in range(10)]
+        # Other templates have their own budget
+        assert sampler.filter(_record("other"))
+    assert passed == [True] * 3 + [False] * 7
+    with patch("app.logs.time.monotonic", return_value=111.0):
+        record = _record()
+        assert sampler.filter(record)
+    assert record.suppressed == 7
+
+
+def test_parse_levels():
+    assert logs._parse_levels("app.database=debug, app.cartsweeper=WARNING,bad") == {
+        "app.database": "DEBUG",
+        "app.cartsweeper": "WARNING",
+    }
+
+
+def test_request_id_header():
+    response = client.get("/api/")
+    generated = response.headers["x-request-id"]
+    assert len(generated) == 32
+    response = client.get("/api/", headers={"X-Request-ID": "trace-123"})
+    assert response.headers["x-request-id"] == "trace-123"
@@ -1,6 +1,8 @@
+from datetime import datetime, timezone
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 from app.main import app
+from app import database
 
 client = TestClient(app)
 
@@ -36,7 +38,8 @@ def test_get_product_details(mock_get_item):
         "price": 95.00,
         "inventory_status": "IN_STOCK",
         "rating": 4.8,
-        "image_url": "http://example.com/image.png"
+        "image_url": "http://example.com/image.png",
+        "stock_quantity": 40
     }
     mock_get_item.return_value = mock_item
     
@@ -44,12 +47,44 @@ def test_get_product_details(mock_get_item):
     assert response.status_code == 200
     assert response.json() == mock_item
 
+@patch('app.database.set_stock_level')
+def test_set_stock_level(mock_set_stock):
+    mock_set_stock.return_value = True
+    response = client.post("/api/inventory/SKU-1/stock", json={"quantity": 3, "shards": 8})
+    assert response.status_code == 200
+    assert response.json() == {"item_id": "SKU-1", "stock_quantity": 3, "inventory_status": "LOW_STOCK"}
+    mock_set_stock.assert_called_once_with("SKU-1", 3, 8)
+
+    assert client.post("/api/inventory/SKU-1/stock", json={"quantity": -1}).status_code == 400
+    assert client.post("/api/inventory/SKU-1/stock", json={"quantity": 1, "shards": 0}).status_code == 400
+    mock_set_stock.return_value = False
+    assert client.post("/api/inventory/SKU-404/stock", json={"quantity": 1}).status_code == 404
+
 @patch('app.database.get_inventory_item')
 def test_get_product_details_not_found(mock_get_item):
     mock_get_item.return_value = None
     response = client.get("/api/products/SKU-99999")
     assert response.status_code == 404
 
+@patch("app.database.get_inventory_items")
+def test_get_products_bulk(mock_get_items):
+    item = {"id": "SKU-1", "category": "Golf", "title": "Balls", "description": "", "price": 10.0,
+            "inventory_status": "IN_STOCK", "rating": 4.0, "image_url": ""}
+    mock_get_items.return_value = ([item], ["SKU-404"])
+    response = client.get("/api/products?ids=SKU-1, SKU-404")
+    assert response.status_code == 200
+    assert response.json()["missing"] == ["SKU-404"]
+    assert response.json()["items"][0]["id"] == "SKU-1"
+    mock_get_items.assert_called_once_with(["SKU-1", "SKU-404"])
+
+    response = client.post("/api/products/lookup", json={"ids": ["SKU-1"]})
+    assert response.status_code == 200
+
+def test_get_products_bulk_limits():
+    assert client.get("/api/products?ids=,").status_code == 400
+    ids = ",".join(f"SKU-{i}" for i in range(101))
+    assert client.get(f"/api/products?ids={ids}").status_code == 400
+
 @patch('app.database.get_top_products')
 def test_get_top_products(mock_get_top):
     mock_products = [
@@ -73,38 +108,150 @@ def test_get_products_by_category(mock_get_by_cat):
     assert len(response.json()) == 1
     assert response.json()[0]["category"] == "Running"
 
-def test_get_order_status():
-    # Mock behavior is deterministic in code, so predictable
+@patch('app.database.get_order')
+def test_get_order_status(mock_get_order):
+    mock_get_order.return_value = {
+        "order_id": "ORDER-123",
+        "user_id": "user1",
+        "items": {"SKU-1": 1},
+        "status": "SHIPPED",
+        "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        "estimated_delivery": "2024-01-06"
+    }
     response = client.get("/api/orders/ORDER-123")
     assert response.status_code == 200
     data = response.json()
     assert data["order_id"] == "ORDER-123"
-    assert "status" in data
-    
-def test_return_order():
+    assert data["status"] == "SHIPPED"
+    assert data["estimated_delivery"] == "2024-01-06"
+
+@patch('app.database.get_order')
+def test_get_order_status_not_found(mock_get_order):
+    mock_get_order.return_value = None
+    response = client.get("/api/orders/ORDER-404")
+    assert response.status_code == 404
+
+@patch('app.database.get_order')
+@patch('app.database.update_order_status')
+def test_return_order(mock_update, mock_get_order):
+    mock_get_order.return_value = {"order_id": "ORDER-123", "user_id": "user1", "status": "DELIVERED"}
+    mock_update.return_value = True
     response = client.post("/api/orders/ORDER-123/return", json={"reason": "size too small"})
     assert response.status_code == 200
     assert response.json()["status"] == "RETURN_INITIATED"
+    mock_update.assert_called_once_with("ORDER-123", "RETURN_INITIATED")
+
+@patch('app.database.get_order')
+@patch('app.database.update_order_status')
+def test_return_order_not_found(mock_update, mock_get_order):
+    mock_get_order.return_value = None
+    response = client.post("/api/orders/ORDER-404/return", json={"reason": "size too small"})
+    assert response.status_code == 404
+    mock_update.assert_not_called()
+
+@patch('app.database.get_user_orders')
+def test_get_order_history(mock_get_orders):
+    order = {
+        "order_id": "ORDER-1",
+        "user_id": "user1",
+        "items": {"SKU-1": 2},
+        "status": "PROCESSING",
+        "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        "estimated_delivery": "2024-01-06"
+    }
+    mock_get_orders.return_value = ([order], "next-page")
+    response = client.get("/api/users/user1/orders?limit=1")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["orders"][0]["order_id"] == "ORDER-1"
+    assert data["next_cursor"] == "next-page"
+    mock_get_orders.assert_called_once_with("user1", limit=1, cursor=None)
+
+@patch('app.database.get_user_orders')
+def test_get_order_history_bad_cursor(mock_get_orders):
+    mock_get_orders.side_effect = ValueError("Invalid cursor: x")
+    response = client.get("/api/users/user1/orders?cursor=x")
+    assert response.status_code == 400
+
+@patch('app.database.place_order')
+def test_checkout(mock_place_order):
+    mock_place_order.return_value = {"order_id": "ORDER-1"}
+    response = client.post("/api/cart/checkout", json={"user_id": "user1"})
+    assert response.status_code == 200
+    assert response.json()["order_id"] == "ORDER-1"
+
+@patch('app.database.place_order')
+def test_checkout_empty_cart(mock_place_order):
+    mock_place_order.side_effect = database.CartEmptyError("user1")
+    response = client.post("/api/cart/checkout", json={"user_id": "user1"})
+    assert response.status_code == 400
+
+@patch('app.database.place_order')
+def test_checkout_out_of_stock(mock_place_order):
+    mock_place_order.side_effect = database.OutOfStockError(["SKU-1"])
+    response = client.post("/api/cart/checkout", json={"user_id": "user1"})
+    assert response.status_code == 409
+    assert "SKU-1" in response.json()["detail"]
+
+@patch('app.database.place_order')
+def test_checkout_contention(mock_place_order):
+    mock_place_order.side_effect = database.CheckoutContentionError("aborted")
+    response = client.post("/api/cart/checkout", json={"user_id": "user1"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
 
 @patch('app.database.add_item_to_cart')
 @patch('app.database.get_cart')
 def test_add_to_cart(mock_get_cart, mock_add):
-    mock_add.return_value = True
-    mock_get_cart.return_value = {"items": {"SKU-123": 1}}
+    mock_add.return_value = {"items": {"SKU-123": 1}}
     
     response = client.post("/api/cart/add", json={"user_id": "user1", "item_id": "SKU-123", "quantity": 1})
     assert response.status_code == 200
     assert response.json()["message"] == "Item added to cart"
+    assert response.json()["cart"] == {"items": {"SKU-123": 1}}
+    assert "cart_details" not in response.json()
+    # The mutation's result is returned as-is; the cart isn't read again
+    mock_get_cart.assert_not_called()
+
+@patch('app.database.enrich_cart')
+@patch('app.database.add_item_to_cart')
+def test_add_to_cart_with_details(mock_add, mock_enrich):
+    mock_add.return_value = {"items": {"SKU-123": 2}}
+    mock_enrich.return_value = {
+        "user_id": "user1",
+        "items": [{"item_id": "SKU-123", "quantity": 2, "title": "Shoe", "price": 10.0, "image_url": "img.png"}],
+        "total_price": 20.0
+    }
+
+    response = client.post("/api/cart/add?detail=true", json={"user_id": "user1", "item_id": "SKU-123", "quantity": 2})
+    assert response.status_code == 200
+    assert response.json()["cart_details"]["total_price"] == 20.0
+    mock_enrich.assert_called_once_with("user1", {"SKU-123": 2})
+
+@patch('app.database.remove_item_from_cart')
+def test_remove_from_cart(mock_remove):
+    mock_remove.return_value = {"items": {}}
+    response = client.post("/api/cart/remove", json={"user_id": "user1", "item_id": "SKU-123"})
+    assert response.status_code == 200
+    assert response.json()["cart"] == {"items": {}}
+
+    mock_remove.return_value = None
+    response = client.post("/api/cart/remove", json={"user_id": "user1", "item_id": "SKU-123"})
+    assert response.status_code == 400
 
-@patch('app.database.verify_user')
-def test_login(mock_verify):
-    mock_verify.return_value = True
+@patch('app.auth.check_password')
+@patch('app.database.get_user')
+def test_login(mock_get_user, mock_check):
+    mock_get_user.return_value = {"username": "user1", "password_hash": "scrypt$..."}
+    mock_check.return_value = True
     response = client.post("/api/login", json={"username": "user1", "password": "password"})
     assert response.status_code == 200
     assert "token" in response.json()
 
-@patch('app.database.verify_user')
-def test_login_fail(mock_verify):
-    mock_verify.return_value = False
+@patch('app.auth.check_password')
+@patch('app.database.get_user')
+def test_login_fail(mock_get_user, mock_check):
+    mock_get_user.return_value = {"username": "user1", "password_hash": "scrypt$..."}
+    mock_check.return_value = False
     response = client.post("/api/login", json={"username": "user1", "password": "wrongpassword"})
     assert response.status_code == 401
@@ -0,0 +1,96 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import catalog, nlquery
+from app.main import app
+
+client = TestClient(app)
+
+
+def _product(item_id, category, title, price, rating, status="IN_STOCK"):
+    return {"id": item_id, "category": category, "title": title, "description": "", "price": price,
+            "inventory_status": status, "rating": rating, "image_url": ""}
+
+
+PRODUCTS = [
+    _product("SKU-1", "Basketball", "Cymbal Elite Basketball Sneakers", 95.0, 4.9),
+    _product("SKU-2", "Basketball", "Cymbal Pro Basketball Sneakers", 180.0, 4.2),
+    _product("SKU-3", "Basketball", "Cymbal Vent Basketball Shorts", 36.0, 4.2),
+    _product("SKU-4", "Basketball", "Cymbal Speed Basketball Sneakers", 60.0, 4.0, "OUT_OF_STOCK"),
+    _product("SKU-5", "Golf", "Cymbal Pro Golf Shoes", 94.0, 4.9),
+    _product("SKU-6", "Footwear", "Cymbal Trail Boots", 120.0, 4.5, "LOW_STOCK"),
+]
+
+
+@pytest.fixture
+def loaded_catalog():
+    with patch("app.catalog.database.get_all_products", return_value=PRODUCTS):
+        catalog.invalidate()
+        yield
+    catalog.invalidate()
+
+
+def test_parse_extracts_constraints():
+    parsed = nlquery.parse("Basketball shoes under $100 in stock")
+    assert parsed["categories"] == ["Basketball"]
+    assert parsed["max_price"] == 100
+    assert parsed["statuses"] == ["IN_STOCK", "LOW_STOCK"]
+    assert "sneaker" in parsed["keywords"][0]
+
+    parsed = nlquery.parse("golf polos between $50 and $1,200, at least 4.5 stars")
+    assert (parsed["min_price"], parsed["max_price"], parsed["min_rating"]) == (50, 1200, 4.5)
+    assert parsed["keywords"] == [["polo", "polos"]]
+
+    parsed = nlquery.parse("I need the cheapest tent")
+    assert parsed["categories"] is None
+    assert parsed["sort"] == "price_asc"
+    assert parsed["keywords"] == [["tent"]]
+
+
+def test_parse_category_words():
+    # Name variants set the category; broad synonyms only when nothing else does
+    assert nlquery.parse("basketballs")["categories"] == ["Basketball"]
+    assert nlquery.parse("camping gear")["categories"] == ["Camping"]
+    assert nlquery.parse("gear")["categories"] == ["Camping"]
+    assert nlquery.parse("football and basketball jerseys")["categories"] == ["Football", "Basketball"]
+    top = nlquery.parse("top rated hunting boots")
+    assert (top["min_rating"], top["sort"]) == (4.5, "rating_desc")
+
+
+def test_longest_phrase_wins():
+    # "at least 4 stars" is a rating, "at least 4" alone a price
+    assert nlquery.parse("at least 4 stars")["min_rating"] == 4
+    assert nlquery.parse("at least 4")["min_price"] == 4
+    assert nlquery.parse("4+ stars")["min_rating"] == 4
+    assert nlquery.parse("out of stock")["statuses"] == ["OUT_OF_STOCK"]
+
+
+def test_execute(loaded_catalog):
+    snapshot = catalog.get_catalog()
+    total, items, ignored = nlquery.execute(nlquery.parse("basketball shoes under $100 in stock"), snapshot)
+    assert (total, [i["id"] for i in items], ignored) == (1, ["SKU-1"], [])
+
+    total, items, ignored = nlquery.execute(nlquery.parse("waterproof shoes please"), snapshot, sort="price_asc")
+    assert [i["id"] for i in items] == ["SKU-4", "SKU-5", "SKU-1", "SKU-6", "SKU-2"]
+    assert ignored == [["waterproof"]]
+
+
+def test_query_endpoint(loaded_catalog):
+    response = client.get("/api/products/query", params={"text": "top rated sneakers", "limit": 1})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["query"]["min_rating"] == 4.5
+    assert body["total"] == 2
+    assert [i["id"] for i in body["items"]] == ["SKU-1"]
+    assert client.get("/api/products/query", params={"text": "x", "sort": "bogus"}).status_code == 400
+
+
+def test_parse_is_fast():
+    nlquery.parse("warm up")
+    start = time.perf_counter()
+    for _ in range(1000):
+        nlquery.parse("basketball shoes under $100 in stock, 4+ stars")
+    assert (time.perf_counter() - start) / 1000 < 0.0005
@@ -0,0 +1,86 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app import auth
+from app.ratelimit import RateLimitMiddleware, TokenBucketLimiter, READ, WRITE, ADMIN, route_class
+
+def make_client(**kwargs):
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, **kwargs)
+
+    @app.get("/api/products/top")
+    async def top():
+        return []
+
+    @app.post("/api/cart/add")
+    async def add(payload: dict):
+        return payload
+
+    return TestClient(app), app
+
+def test_token_bucket():
+    limiter = TokenBucketLimiter(rate=2, burst=2)
+    assert limiter.acquire("a", now=0) == 0
+    assert limiter.acquire("a", now=0) == 0
+    assert limiter.acquire("a", now=0) == 0.5
+    # Other keys have their own bucket
+    assert limiter.acquire("b", now=0) == 0
+    # Half a second refills one token
+    assert limiter.acquire("a", now=0.5) == 0
+
+def test_route_class():
+    assert route_class("GET", "/api/products/top") == READ
+    assert route_class("POST", "/api/cart/add") == WRITE
+    assert route_class("GET", "/api/save_inventory") == ADMIN
+
+def test_rejects_with_retry_after():
+    client, _ = make_client(rate=1, burst=2)
+    assert client.get("/api/products/top").status_code == 200
+    assert client.get("/api/products/top").status_code == 200
+    response = client.get("/api/products/top")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+def test_limits_are_keyed_by_session_user():
+    client, _ = make_client(rate=1, burst=1)
+    alice = {"Authorization": f"Bearer {auth.issue_token('alice')}"}
+    response = client.post("/api/cart/add", json={"user_id": "alice", "item_id": "SKU-1"}, headers=alice)
+    assert response.status_code == 200
+    assert response.json()["item_id"] == "SKU-1"
+    assert client.post("/api/cart/add", json={"user_id": "alice"}, headers=alice).status_code == 429
+    # Claiming another user_id, or sending a bad token, doesn't get a fresh bucket
+    assert client.post("/api/cart/add", json={"user_id": "bob"}, headers=alice).status_code == 429
+    assert client.get("/api/products/top", headers={"X-User-Id": "carol"}).status_code == 200
+    assert client.get("/api/products/top", headers={"Authorization": "Bearer forged.token"}).status_code == 429
+    bob = {"Authorization": f"Bearer {auth.issue_token('bob')}"}
+    assert client.post("/api/cart/add", json={"user_id": "bob"}, headers=bob).status_code == 200
+
+def test_client_address_ignores_spoofed_forwarded_for():
+    client, _ = make_client(rate=1, burst=1)
+    assert client.get("/api/products/top", headers={"X-Forwarded-For": "1.1.1.1, 10.0.0.7"}).status_code == 200
+    # Only the entry appended by the trusted proxy counts
+    assert client.get("/api/products/top", headers={"X-Forwarded-For": "2.2.2.2, 10.0.0.7"}).status_code == 429
+    assert client.get("/api/products/top", headers={"X-Forwarded-For": "10.0.0.8"}).status_code == 200
+
+def test_concurrency_cap_shrinks_under_latency():
+    middleware = RateLimitMiddleware(None, rate=100, burst=100, concurrency={READ: 10, WRITE: 10, ADMIN: 1}, shed_latency_ms=100)
+    assert middleware.effective_limit(READ) == 10
+    middleware.latency.value = 0.4
+    assert middleware.effective_limit(READ) == 2
+    middleware.latency.value = 10
+    assert middleware.effective_limit(READ) == 1
+
+def test_sheds_when_route_class_is_full():
+    middleware = RateLimitMiddleware(None, rate=100, burst=100, concurrency={READ: 1, WRITE: 1, ADMIN: 1})
+    middleware.in_flight[READ] = 1
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    scope = {"type": "http", "method": "GET", "path": "/api/products/top", "headers": [], "query_string": b"", "client": ("1.2.3.4", 1)}
+    asyncio.run(middleware(scope, receive, send))
+    assert sent[0]["status"] == 429
@@ -0,0 +1,69 @@
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.related import RelatedTable
+
+client = TestClient(app)
+
+PRODUCTS = [
+    {"id": "SKU-1", "category": "Camping", "title": "Trail Tent", "description": "Two person tent for trail camping.", "price": 180.0},
+    {"id": "SKU-2", "category": "Camping", "title": "Trail Sleeping Bag", "description": "Warm bag for tent camping.", "price": 150.0},
+    {"id": "SKU-3", "category": "Camping", "title": "Camp Lantern", "description": "Bright lantern for the campsite.", "price": 30.0},
+    {"id": "SKU-4", "category": "Camping", "title": "Trail Tent", "description": "Two person tent for trail camping.", "price": 175.0},
+    {"id": "SKU-5", "category": "Golf", "title": "Golf Tent Umbrella", "description": "Keeps the rain off on the course.", "price": 40.0},
+]
+
+
+def test_neighbors_from_same_category_ranked():
+    table = RelatedTable(PRODUCTS, k=3)
+    # Never itself, a same-title duplicate or another category
+    assert table.related("SKU-1") == ["SKU-2", "SKU-3"]
+    assert table.related("SKU-1", limit=1) == ["SKU-2"]
+    assert table.related("SKU-5") == []
+    assert table.related("SKU-404") is None
+
+
+def test_neighbors_are_stored_compactly():
+    table = RelatedTable(PRODUCTS, k=3)
+    assert table.neighbors.shape == (5, 3)
+    assert str(table.neighbors.dtype) == "int32"
+
+
+def test_incremental_update_only_touches_changed_categories():
+    table = RelatedTable(PRODUCTS, k=3)
+    assert table.update(PRODUCTS) == 0
+
+    updated = [dict(p) for p in PRODUCTS]
+    updated[4]["price"] = 45.0
+    updated.append({"id": "SKU-6", "category": "Golf", "title": "Golf Balls", "description": "Rain or shine.", "price": 20.0})
+    assert table.update(updated) == 2
+    assert table.related("SKU-6") == ["SKU-5"]
+    assert table.related("SKU-1") == ["SKU-2", "SKU-3"]
+
+
+def test_update_drops_removed_products():
+    table = RelatedTable(PRODUCTS, k=3)
+    before = table._state
+    remaining = [p for p in PRODUCTS if p["id"] != "SKU-2"]
+    assert table.update(remaining) == 3
+    assert table.related("SKU-2") is None
+    assert table.related("SKU-1") == ["SKU-3"]
+    assert table.related("SKU-5") == []
+    # Lookups already holding the old table keep a consistent view
+    assert before[0][before[3][0, 0]] == "SKU-2"
+
+
+def test_related_endpoint():
+    items = [{"id": "SKU-2", "category": "Camping", "title": "Trail Sleeping Bag", "description": "",
+              "price": 150.0, "inventory_status": "IN_STOCK", "rating": 4.5, "image_url": ""}]
+    with patch("app.main.related.get_related_products", return_value=items) as mock_related:
+        response = client.get("/api/products/SKU-1/related?limit=3")
+    assert response.status_code == 200
+    assert response.json()[0]["id"] == "SKU-2"
+    mock_related.assert_called_once_with("SKU-1", limit=3)
+
+
+def test_related_endpoint_not_found():
+    with patch("app.main.related.get_related_products", return_value=None):
+        response = client.get("/api/products/SKU-404/related")
+    assert response.status_code == 404
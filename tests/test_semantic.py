@@ -0,0 +1,103 @@
+import os
+from types import SimpleNamespace
+from unittest.mock import patch
+import numpy as np
+from fastapi.testclient import TestClient
+from app.main import app
+from app import semantic
+from app.semantic import SemanticIndex, tokenize
+
+client = TestClient(app)
+
+PRODUCTS = [
+    {"id": "SKU-1", "category": "Camping", "title": "Insulated Winter Sleeping Bag",
+     "description": "Stay warm on cold nights in the backcountry."},
+    {"id": "SKU-2", "category": "Camping", "title": "Four Season Tent",
+     "description": "A sturdy shelter for snow camping."},
+    {"id": "SKU-3", "category": "Golf", "title": "Pro Golf Clubs",
+     "description": "Forged irons for a consistent swing."},
+    {"id": "SKU-4", "category": "Footwear", "title": "Trail Running Shoes",
+     "description": "Light and breathable for summer runs."},
+]
+
+
+def ids(results):
+    return [product["id"] for product, _ in results]
+
+
+def test_tokenize_drops_stopwords_and_plurals():
+    assert tokenize("Something warm for the Winter nights") == ["warm", "winter", "night"]
+    assert tokenize("glass") == ["glass"]
+
+
+def test_natural_language_query():
+    index = SemanticIndex(PRODUCTS)
+    results = index.search("something warm for winter camping", k=2)
+    assert ids(results) == ["SKU-1", "SKU-2"]
+    assert results[0][1] > results[1][1] > 0
+
+
+def test_synonyms_match_category():
+    index = SemanticIndex(PRODUCTS, synonyms={"Clubs": "Golf", "Sneakers": "Footwear"})
+    assert ids(index.search("sneakers", k=1)) == ["SKU-4"]
+
+
+def test_no_matches():
+    assert SemanticIndex(PRODUCTS).search("xylophone") == []
+
+
+def test_vectors_are_memory_mapped_and_cleaned_up():
+    index = SemanticIndex(PRODUCTS)
+    assert isinstance(index.vectors, np.memmap)
+    assert index.vectors.dtype == np.float32
+    assert os.path.exists(index.path)
+    index.close()
+    assert not os.path.exists(index.path)
+
+
+def test_ivf_index_finds_exact_match():
+    rng = np.random.default_rng(0)
+    vocab = [f"word{i}" for i in range(300)]
+    records = [
+        {"id": f"SKU-{i}", "category": "Misc", "title": " ".join(rng.choice(vocab, 3)),
+         "description": " ".join(rng.choice(vocab, 6))}
+        for i in range(2000)
+    ]
+    exact = SemanticIndex(records, ivf_threshold=10**9)
+    approximate = SemanticIndex(records, ivf_threshold=1000)
+    assert approximate.centroids is not None
+
+    query = records[7]["title"] + " " + records[7]["description"]
+    assert ids(exact.search(query, k=1)) == ["SKU-7"]
+    assert ids(approximate.search(query, k=1)) == ["SKU-7"]
+    # Batched queries give the same answers as single ones
+    batch = approximate.search_many([query, records[9]["title"] + " " + records[9]["description"]], k=1)
+    assert [ids(r) for r in batch] == [["SKU-7"], ["SKU-9"]]
+
+
+def test_semantic_search_endpoint():
+    products = [dict(p, price=10.0, inventory_status="IN_STOCK", rating=4.0, image_url="") for p in PRODUCTS]
+    with patch("app.semantic.catalog.get_catalog") as mock_catalog:
+        mock_catalog.return_value.records = products
+        semantic.invalidate()
+        response = client.get("/api/products/search?q=golf%20irons&mode=semantic&limit=1")
+        semantic.invalidate()
+
+    assert response.status_code == 200
+    assert [p["id"] for p in response.json()] == ["SKU-3"]
+
+
+def test_index_follows_catalog_version():
+    snapshot = SimpleNamespace(version=1, records=PRODUCTS[:2])
+    with patch("app.semantic.catalog.get_catalog", return_value=snapshot):
+        semantic.invalidate()
+        first = semantic.get_index()
+        assert semantic.get_index() is first
+        snapshot.version, snapshot.records = 2, PRODUCTS
+        assert ids(semantic.get_index().search("golf irons", k=1)) == ["SKU-3"]
+        semantic.invalidate()
+
+
+def test_search_rejects_unknown_mode():
+    response = client.get("/api/products/search?q=tent&mode=fuzzy")
+    assert response.status_code == 400
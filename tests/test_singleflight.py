@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app import deadline
+from app.main import app
+from app.singleflight import SingleFlight, coalesce, group
+
+client = TestClient(app)
+
+def test_concurrent_threads_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    def slow_fetch():
+        calls.append(1)
+        time.sleep(0.05)
+        return ["Golf"]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do(("fetch", ()), slow_fetch))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [["Golf"]] * 8
+    assert flight.stats() == {"fetch": {"executions": 1, "coalesced": 7}}
+
+def test_errors_are_shared_and_not_cached():
+    flight = SingleFlight()
+
+    def failing():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flight.do(("fetch", ()), failing)
+    # The next call runs again rather than reusing the failure
+    assert flight.do(("fetch", ()), lambda: "ok") == "ok"
+
+def test_followers_retry_when_the_leaders_deadline_runs_out():
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(deadline.remaining())
+        started.set()
+        time.sleep(0.05)
+        deadline.options()  # raises once the caller's budget is gone
+        return "ok"
+
+    def leader():
+        with deadline.within(0.02), pytest.raises(deadline.DeadlineExceeded):
+            flight.do(("fetch", ()), fetch)
+
+    results = []
+
+    def follower():
+        with deadline.within(5):
+            results.append(flight.do(("fetch", ()), fetch))
+
+    threads = [threading.Thread(target=leader), threading.Thread(target=follower)]
+    threads[0].start()
+    started.wait(1)
+    threads[1].start()
+    for t in threads:
+        t.join()
+
+    assert results == ["ok"]
+    assert len(calls) == 2 and calls[1] > 1
+
+def test_async_followers_retry_when_the_leaders_deadline_runs_out():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        deadline.options()
+        return "ok"
+
+    async def call(seconds):
+        with deadline.within(seconds):
+            return await flight.do_async(("fetch", ()), fetch)
+
+    async def main():
+        return await asyncio.gather(call(0.02), call(5), return_exceptions=True)
+
+    leader, follower = asyncio.run(main())
+    assert isinstance(leader, deadline.DeadlineExceeded)
+    assert follower == "ok"
+
+def test_async_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async(("fetch", ()), fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == [42] * 5
+    assert len(calls) == 1
+    assert flight.stats()["fetch"]["coalesced"] == 4
+
+def test_async_path_runs_blocking_functions_in_a_thread():
+    flight = SingleFlight()
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async(("sleep", ()), time.sleep, 0.02) for _ in range(3)))
+
+    assert asyncio.run(main()) == [None] * 3
+    assert flight.stats()["sleep"] == {"executions": 1, "coalesced": 2}
+
+def test_decorator_normalizes_keys():
+    gate = threading.Event()
+    calls = []
+
+    @coalesce(key=lambda category: category.strip().lower())
+    def fetch_category(category):
+        calls.append(category)
+        gate.wait()
+        return [category]
+
+    threads = [threading.Thread(target=fetch_category, args=(c,)) for c in ("golf", " Golf ", "GOLF")]
+    threads[0].start()
+    time.sleep(0.02)
+    for t in threads[1:]:
+        t.start()
+    time.sleep(0.02)
+    gate.set()
+    for t in threads:
+        t.join()
+
+    assert calls == ["golf"]
+    assert asyncio.run(fetch_category.aio("golf")) == ["golf"]
+
+def test_metrics_endpoint():
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.json()["singleflight"] == group.stats()
@@ -0,0 +1,89 @@
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from app.main import app
+from app import stores
+
+client = TestClient(app)
+
+SAMPLE_LOCATIONS = """Cymbal Sports Store Locations Directory
+=======================================
+
+
+Store: Cymbal Sports Denver
+Address: 1200 Main St, Denver, CO 80202
+Phone: (303) 555-0100
+Hours: Mon-Sat: 9am-9pm, Sun: 10am-6pm
+---------------------------------------
+
+Store: Cymbal Sports Boston
+Address: 6996 Cedar St, Boston, MA 02108
+Phone: (617) 555-0101
+Hours: Mon-Sat: 9am-9pm, Sun: 10am-6pm
+---------------------------------------
+
+Store: Cymbal Sports Seattle
+Address: 45 Market St, Seattle, WA 98101
+Phone: (206) 555-0102
+Hours: Mon-Sat: 9am-9pm, Sun: 10am-6pm
+---------------------------------------
+"""
+
+def make_directory():
+    return stores.StoreDirectory(stores.parse_locations(SAMPLE_LOCATIONS))
+
+def test_parse_locations():
+    parsed = stores.parse_locations(SAMPLE_LOCATIONS)
+    assert len(parsed) == 3
+    assert parsed[0]["store_id"] == "STORE-001"
+    assert parsed[0]["address"] == "1200 Main St"
+    assert parsed[0]["city"] == "Denver"
+    assert parsed[0]["state"] == "CO"
+    assert parsed[0]["zip_code"] == "80202"
+    assert parsed[0]["latitude"] is not None
+
+def test_find_by_indexes():
+    directory = make_directory()
+    assert [s["city"] for s in directory.find(city="denver")] == ["Denver"]
+    assert [s["city"] for s in directory.find(state="wa")] == ["Seattle"]
+    assert [s["city"] for s in directory.find(zip_prefix="021")] == ["Boston"]
+    assert directory.find(city="Denver", state="MA") == []
+    assert len(directory.find()) == 3
+
+def test_nearest():
+    directory = make_directory()
+    # Colorado Springs is closest to Denver, then Seattle, then Boston
+    results = directory.nearest(38.8339, -104.8214, limit=3)
+    assert [s["city"] for s in results] == ["Denver", "Seattle", "Boston"]
+    assert 55 < results[0]["distance_miles"] < 70
+
+def test_nearest_matches_brute_force():
+    parsed = [
+        {"store_id": f"S{i}", "city": "X", "state": "XX", "zip_code": "00000",
+         "latitude": lat, "longitude": lon}
+        for i, (lat, lon) in enumerate(stores.CITY_COORDINATES.values())
+    ]
+    directory = stores.StoreDirectory(parsed)
+    target = stores._to_unit_vector(36.0, -100.0)
+    expected = sorted(
+        parsed,
+        key=lambda s: sum((a - b) ** 2 for a, b in zip(stores._to_unit_vector(s["latitude"], s["longitude"]), target)),
+    )[:5]
+    results = directory.nearest(36.0, -100.0, limit=5)
+    assert [s["store_id"] for s in results] == [s["store_id"] for s in expected]
+
+@patch('app.stores.get_directory')
+def test_stores_endpoints(mock_get_directory):
+    mock_get_directory.return_value = make_directory()
+
+    response = client.get("/api/stores?city=Boston")
+    assert response.status_code == 200
+    assert response.json()[0]["store_id"] == "STORE-002"
+
+    response = client.get("/api/stores/nearest?city=Denver&limit=1")
+    assert response.status_code == 200
+    assert response.json()[0]["city"] == "Denver"
+
+    assert client.get("/api/stores/nearest").status_code == 400
+    assert client.get("/api/stores/nearest?city=Atlantis").status_code == 404
+    assert client.get("/api/stores/STORE-003").json()["city"] == "Seattle"
+    assert client.get("/api/stores/STORE-999").status_code == 404
@@ -0,0 +1,98 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app import suggest
+from app.suggest import SuggestIndex
+
+client = TestClient(app)
+
+PRODUCTS = [
+    {"id": "SKU-1", "category": "Footwear", "title": "Trail Running Shoe", "rating": 4.2},
+    {"id": "SKU-2", "category": "Footwear", "title": "Court Shoe", "rating": 4.7},
+    {"id": "SKU-3", "category": "Running", "title": "Running Socks (3-Pack)", "rating": 4.9},
+    {"id": "SKU-4", "category": "Golf", "title": "Golf Balls", "rating": 4.5},
+]
+SYNONYMS = {"Shoes": "Footwear", "Sneakers": "Footwear", "Clubs": "Golf", "Tents": "Camping"}
+
+
+def texts(suggestions):
+    return [s["text"] for s in suggestions]
+
+
+def test_products_ranked_by_rating():
+    index = SuggestIndex(PRODUCTS, depth=1)
+    assert texts(index.suggest("run")) == ["Running", "Running Socks (3-Pack)", "Trail Running Shoe"]
+
+
+def test_precomputed_and_scanned_prefixes_agree():
+    shallow = SuggestIndex(PRODUCTS, depth=0)
+    deep = SuggestIndex(PRODUCTS, depth=10)
+    for prefix in ["s", "sh", "sho", "r", "ru", "g", "trail", "x"]:
+        assert shallow.suggest(prefix) == deep.suggest(prefix)
+
+
+def test_synonyms_suggest_canonical_category():
+    index = SuggestIndex(PRODUCTS, synonyms=SYNONYMS)
+    result = index.suggest("Sne")
+    assert result == [{"text": "Footwear", "type": "category", "category": "Footwear"}]
+    # Synonyms for categories that aren't stocked are ignored
+    assert index.suggest("tent") == []
+
+
+def test_multi_word_prefix():
+    index = SuggestIndex(PRODUCTS)
+    assert texts(index.suggest("running sh")) == ["Trail Running Shoe"]
+    assert texts(index.suggest("  COURT   s")) == ["Court Shoe"]
+
+
+def test_limit():
+    index = SuggestIndex(PRODUCTS, synonyms=SYNONYMS)
+    assert texts(index.suggest("s", limit=2)) == ["Footwear", "Running Socks (3-Pack)"]
+    # Categories alone can fill the limit
+    index = SuggestIndex(PRODUCTS, synonyms={"Running Shoes": "Footwear"})
+    assert texts(index.suggest("running s", limit=1)) == ["Footwear"]
+
+
+def test_large_index_lookups_are_fast():
+    words = ["alpine", "trail", "court", "summit", "ridge", "storm", "shadow", "swift", "stride", "shield"]
+    records = [
+        {"id": f"SKU-{i}", "category": "Footwear", "title": f"{words[i % 10]} {words[(i // 10) % 10]} model {i}",
+         "rating": (i * 7919 % 50) / 10}
+        for i in range(100_000)
+    ]
+    index = SuggestIndex(records)
+    prefixes = ["s", "sh", "sha", "shad", "shadow", "shadow st", "model 12", "model 99999", "trail"]
+
+    start = time.perf_counter()
+    for prefix in prefixes * 100:
+        index.suggest(prefix)
+    per_lookup = (time.perf_counter() - start) / (len(prefixes) * 100)
+
+    assert per_lookup < 0.001
+
+
+def test_suggest_endpoint():
+    with patch("app.suggest.catalog.get_catalog") as mock_catalog:
+        mock_catalog.return_value.records = PRODUCTS
+        suggest.invalidate()
+        response = client.get("/api/products/suggest?prefix=golf")
+        suggest.invalidate()
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"text": "Golf", "type": "category", "id": None, "category": "Golf"},
+        {"text": "Golf Balls", "type": "product", "id": "SKU-4", "category": "Golf"},
+    ]
+
+
+def test_index_follows_catalog_version():
+    snapshot = SimpleNamespace(version=1, records=PRODUCTS[:1])
+    with patch("app.suggest.catalog.get_catalog", return_value=snapshot):
+        suggest.invalidate()
+        assert texts(suggest.get_index().suggest("golf")) == []
+        # e.g. a TTL refresh, or recovery from the CSV fallback, on this instance
+        snapshot.version, snapshot.records = 2, PRODUCTS
+        assert texts(suggest.get_index().suggest("golf")) == ["Golf", "Golf Balls"]
+        suggest.invalidate()
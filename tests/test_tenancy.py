@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import auth, config, database, memstore, tenancy
+from app.cartsweeper import CartSweeper
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_validate():
+    assert tenancy.validate(" Cohort-7 ") == "cohort-7"
+    for bad in ("", "-x", "a/b", "x" * 64):
+        with pytest.raises(ValueError):
+            tenancy.validate(bad)
+    with patch.object(config, "TENANTS", {"alpha"}):
+        assert tenancy.validate("alpha") == "alpha"
+        with pytest.raises(ValueError):
+            tenancy.validate("beta")
+
+
+def test_collections_are_scoped():
+    store = memstore.Client()
+    assert tenancy.collection(store, "carts").path == "carts"
+    with tenancy.use("alpha"):
+        assert tenancy.collection(store, "carts").path == "tenants/alpha/carts"
+    assert tenancy.current() is None
+
+
+def test_carts_users_and_orders_are_isolated():
+    store = memstore.Client()
+    store.collection("inventory").document("SKU-1").set({"id": "SKU-1", "price": 10.0})
+    with patch('app.database.db', store), patch.object(config, "AUTH_SCRYPT_N", 1024):
+        with tenancy.use("alpha"):
+            database.add_item_to_cart("u1", "SKU-1", 2)
+            assert database.create_user("alice", auth.hash_password("pw"))
+            order = database.place_order("u1")
+            database.add_item_to_cart("u1", "SKU-1", 1)
+        with tenancy.use("beta"):
+            assert database.get_cart("u1") == {"items": {}}
+            assert database.get_user("alice") is None
+            assert database.get_order(order["order_id"]) is None
+            assert database.get_user_orders("u1") == ([], None)
+        with tenancy.use("alpha"):
+            assert database.get_cart("u1") == {"items": {"SKU-1": 1}}
+            assert database.get_order(order["order_id"])["user_id"] == "u1"
+        assert database.get_cart("u1") == {"items": {}}
+        # The catalog is shared
+        with tenancy.use("beta"):
+            assert database.get_inventory_item("SKU-1")["id"] == "SKU-1"
+
+
+@patch('app.database.get_cart_details')
+def test_tenant_from_path_prefix_and_header(mock_details):
+    seen = []
+
+    def details(user_id):
+        seen.append(tenancy.current())
+        return {"user_id": user_id, "items": [], "total_price": 0}
+
+    mock_details.side_effect = details
+    assert client.get("/t/alpha/api/cart/u1").status_code == 200
+    assert client.get("/api/cart/u1", headers={"X-Tenant-ID": "Beta"}).status_code == 200
+    assert client.get("/api/cart/u1").status_code == 200
+    assert seen == ["alpha", "beta", None]
+    assert client.get("/t/bad!/api/cart/u1").status_code == 400
+    assert client.get("/t/alpha/").status_code == 200
+
+
+@patch('app.database.get_cart_details')
+def test_tokens_are_tenant_scoped(mock_details):
+    mock_details.return_value = {"user_id": "alice", "items": [], "total_price": 0}
+    headers = {"Authorization": "Bearer " + auth.issue_token("alice", tenant="alpha")}
+    assert client.get("/t/alpha/api/cart/alice", headers=headers).status_code == 200
+    assert client.get("/t/beta/api/cart/alice", headers=headers).status_code == 401
+    assert client.get("/api/cart/alice", headers=headers).status_code == 401
+
+
+def test_sweeper_covers_every_tenant():
+    store = memstore.Client()
+    expired = datetime.now(timezone.utc) - timedelta(hours=1)
+    store.collection("carts").document("u1").set({"expires_at": expired})
+    store.collection("tenants/alpha/carts").document("u1").set({"expires_at": expired})
+    store.collection("tenants/beta/carts").document("u2").set({"expires_at": expired + timedelta(days=2)})
+    assert CartSweeper(lambda: store, max_rate=0).sweep() == 2
+    assert [d.id for d in store.collection("tenants/beta/carts").stream()] == ["u2"]